@@ -25,6 +25,7 @@ Manifested by 0x0630ff x Made Evil by gh0st
 
 import time
 import array
+import asyncio
 import sys
 import supervisor
 import usb
@@ -232,6 +233,7 @@ def load_usb_host_screen(user_data=None):
         MenuItem("< Back", go_back_to, main_menu)
     ]
     print("Finding usb devices:")
+    get_usb_host()
     devices = usb.core.find(find_all=True)
     count = 0
     time.sleep(0.25)
@@ -257,7 +259,7 @@ def load_ducky_menu(user_data=None):
     global ducky_menu
     ducky_menu_items = [
         MenuItem("< Back", go_back_to, main_menu),
-        MenuItem("Load from /SD" if sd_card_init_success else "No SD Card found... :/", load_sd_files),
+        MenuItem("Load from /SD" if mount_sd_card() else "No SD Card found... :/", load_sd_files),
     ]
     ducky_menu = DuckyMenu("Ducky Script", ducky_menu_items)
     print("trying to load Ducky Menu")
@@ -315,7 +317,7 @@ def load_sd_files(user_data=None):
     global ducky_menu, sd_files_loaded
     print("Load SD Card files")
     
-    if sd_card_init_success:
+    if mount_sd_card():
         # Determine the path to scan (default to root "/")
         filespath = user_data if user_data else "/"
         
@@ -375,7 +377,7 @@ def load_sd_files(user_data=None):
                 
         except Exception as e:
             print(f"Error loading SD files: {e}")
-            print(f"SD card init success: {sd_card_init_success}")
+            print(f"SD card init success: {mount_sd_card()}")
             print(f"Attempted path: {filespath}")
             
             # Try to list root directory to see what's available
@@ -2195,38 +2197,46 @@ def main():
     mouse = None
     consumer_control = None
     hid_available = False
-    
-    pixels.fill(NEON_ORANGE)  # Orange = skipping HID to avoid hanging
-    pixels.show()
-    time.sleep(0.3)
-    
-    # Initialize buttons FIRST (independent of HID)
-    pixels.fill(NEON_RED)  # Red = button initialization starting
-    pixels.show()
-    time.sleep(0.3)
-    
-    try:
-        print("Attempting to initialize buttons...")
-        buttons = Buttons()
-        print("Buttons initialized successfully")
-        pixels.fill(NEON_GREEN)  # Green = buttons success
+    profile_mark("main start")
+    buttons = None
+
+    # LED status stages, each color held long enough to read. Runs as a boot()
+    # task, so the holds overlap the splash and SD mount instead of adding up
+    async def led_stages():
+        nonlocal buttons
+        pixels.fill(NEON_ORANGE)  # Orange = skipping HID to avoid hanging
         pixels.show()
-        time.sleep(0.3)
-    except Exception as e:
-        print(f"Button initialization failed: {e}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        traceback.print_exception(e)
-        buttons = None
-        pixels.fill(NEON_ORANGE)  # Orange = buttons failed
+        await asyncio.sleep(0.3)
+        
+        # Initialize buttons FIRST (independent of HID)
+        pixels.fill(NEON_RED)  # Red = button initialization starting
         pixels.show()
-        time.sleep(0.3)
-
-    # HID devices will be initialized on-demand when needed
-    print("HID devices will be initialized on-demand")
-    pixels.fill(NEON_GREEN)  # Green = ready
-    pixels.show()
-    time.sleep(0.3)
+        await asyncio.sleep(0.3)
+        
+        try:
+            print("Attempting to initialize buttons...")
+            buttons = Buttons()
+            print("Buttons initialized successfully")
+            pixels.fill(NEON_GREEN)  # Green = buttons success
+            pixels.show()
+            await asyncio.sleep(0.3)
+        except Exception as e:
+            print(f"Button initialization failed: {e}")
+            print(f"Error type: {type(e)}")
+            import traceback
+            traceback.print_exception(e)
+            buttons = None
+            pixels.fill(NEON_ORANGE)  # Orange = buttons failed
+            pixels.show()
+            await asyncio.sleep(0.3)
+        profile_mark("buttons")
+
+        # HID devices will be initialized on-demand when needed
+        print("HID devices will be initialized on-demand")
+        pixels.fill(NEON_GREEN)  # Green = ready
+        pixels.show()
+        await asyncio.sleep(0.3)
+        profile_mark("hid")
 
     main_menu_items = [
         MenuItem("HID BadUSB", load_ducky_menu, "DUCKS!"),
@@ -2242,7 +2252,8 @@ def main():
     print("Creating main menu...")
     global main_menu
     try:
-        main_menu = MainMenu("DN KEY PRO MENU", main_menu_items)
+        # splash, SD card, battery and LED stages come up while the menu is built
+        main_menu = boot(lambda: MainMenu("DN KEY PRO MENU", main_menu_items), led_stages())
         print("Main menu created successfully")
     except Exception as e:
         print(f"Main menu creation failed: {e}")
@@ -2254,6 +2265,7 @@ def main():
     try:
         main_menu.draw(display_group)
         print("Main menu drawn successfully")
+        profile_mark("menu drawn")
     except Exception as e:
         print(f"Main menu drawing failed: {e}")
         import traceback
@@ -2265,11 +2277,15 @@ def main():
     current_menu = main_menu
     print("Current menu set to main menu")
 
+    # boot timings, only when DN_KEY_PRO_PROFILE = 1 is in settings.toml
+    report_profile()
+
     # Main Loop - faster timing
     print("Starting Defcon Demo...")
     while True:
         try:
             rainbow_cycle(0)  # Increase the number to slow down the rainbow
+            animator.tick()  # run backlight fades and other animations
 
             current_menu.handle_input(buttons, display_group)
         except Exception as e:
@@ -1,13 +1,43 @@
+# boot profiler first, so it can time the imports below
+from .profiler import profile_begin, profile_end, profile_mark, report_profile
+
 # import local .py files
+profile_begin("dn_duck")
 from dn_duck.dn_duck import Ducky
+profile_end("dn_duck")
 
+# usb host, battery and sd card only start when first used, through
+# get_usb_host(), get_battery() and mount_sd_card(); boot() starts the sd
+# card and battery next to the splash and menu
+profile_begin("usb_host")
 from .usb_host import *
+profile_end("usb_host")
 
+profile_begin("helpers")
 from .helpers import *
+profile_end("helpers")
+profile_begin("animation")
+from .animation import *
+profile_end("animation")
+profile_begin("display")
 from .display import *
+profile_end("display")
+profile_begin("leds")
 from .leds import *
+profile_end("leds")
 
+profile_begin("menu_setup")
 from .menu_setup import *
+profile_end("menu_setup")
+profile_begin("battery")
 from .battery import *
+profile_end("battery")
+profile_begin("buttons")
 from .buttons import *
+profile_end("buttons")
+profile_begin("sd_card")
 from .sd_card import *
+profile_end("sd_card")
+profile_begin("startup")
+from .startup import *
+profile_end("startup")
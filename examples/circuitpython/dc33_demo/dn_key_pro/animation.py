@@ -0,0 +1,94 @@
+from adafruit_ticks import ticks_ms, ticks_diff
+
+# seconds between animation frames when nothing else drives animator.tick()
+ANIMATION_FRAME = 0.01
+
+
+# easing functions turn the elapsed part of a tween (0.0 - 1.0)
+# into how far along the value should be
+def linear(t):
+    return t
+
+def ease_in(t):
+    return t * t
+
+def ease_out(t):
+    return t * (2 - t)
+
+def ease_in_out(t):
+    if t < 0.5:
+        return 2 * t * t
+    return -1 + (4 - 2 * t) * t
+
+
+# A Tween moves a value from start to end over duration seconds, handing
+# each new value to setter. on_done(tween) is called once it has finished
+class Tween:
+    def __init__(self, setter, start, end, duration, easing=linear, on_done=None):
+        self.setter = setter
+        self.start = start
+        self.end = end
+        self.duration_ms = int(duration * 1000)
+        self.easing = easing
+        self.on_done = on_done
+        self.started = None
+        self.done = False
+
+    # set the value for time now (ticks_ms), returns True once finished
+    def update(self, now):
+        if self.started is None:
+            self.started = now
+        elapsed = ticks_diff(now, self.started)
+        if elapsed >= self.duration_ms:
+            t = 1.0
+            self.done = True
+        else:
+            t = elapsed / self.duration_ms
+        self.setter(self.start + (self.end - self.start) * self.easing(t))
+        return self.done
+
+
+# Runs the tweens, call tick() from the main loop as often as possible.
+# Nothing blocks, so buttons and background work keep running meanwhile
+class Animator:
+    def __init__(self):
+        self.tweens = []
+
+    @property
+    def busy(self):
+        return len(self.tweens) > 0
+
+    def add(self, tween):
+        self.tweens.append(tween)
+        return tween
+
+    def cancel(self, tween):
+        if tween in self.tweens:
+            self.tweens.remove(tween)
+
+    def tick(self):
+        if not self.tweens:
+            return
+        now = ticks_ms()
+        i = 0
+        # tweens added by an on_done callback start in this same tick
+        while i < len(self.tweens):
+            tween = self.tweens[i]
+            if tween.update(now):
+                self.tweens.pop(i)
+                if tween.on_done is not None:
+                    tween.on_done(tween)
+            else:
+                i += 1
+
+
+# shared animator ticked by the main loop
+animator = Animator()
+
+
+# animate a whole number attribute, like a TileGrid's x or y or
+# a PWMOut's duty_cycle, from its current value to end
+def animate(obj, name, end, duration, easing=ease_in_out, on_done=None):
+    def set_value(value):
+        setattr(obj, name, int(value))
+    return animator.add(Tween(set_value, getattr(obj, name), end, duration, easing, on_done))
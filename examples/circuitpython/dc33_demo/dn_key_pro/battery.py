@@ -1,19 +1,30 @@
-import adafruit_max1704x
-
 from .periferals import i2c
+from .profiler import profile_begin, profile_end
 
 
+# fuel gauge, probed on first use by get_battery() instead of at boot
 max17 = None
-try:
-    max17 = adafruit_max1704x.MAX17048(i2c)
-    print(
-        "Found MAX1704x with chip version",
-        hex(max17.chip_version),
-        "and id",
-        hex(max17.chip_id),
-    )
-except:
-    print('no i2c setup, try later, check pull ups..')
+max17_probed = False
+
+def get_battery():
+    global max17, max17_probed
+    if max17_probed:
+        return max17
+    max17_probed = True
+    profile_begin("battery probe")
+    try:
+        import adafruit_max1704x
+        max17 = adafruit_max1704x.MAX17048(i2c)
+        print(
+            "Found MAX1704x with chip version",
+            hex(max17.chip_version),
+            "and id",
+            hex(max17.chip_id),
+        )
+    except:
+        print('no i2c setup, try later, check pull ups..')
+    profile_end("battery probe")
+    return max17
 
 # Quick starting allows an instant 'auto-calibration' of the battery. However, its a bad idea
 # to do this right when the battery is first plugged in or if there's a lot of load on the battery
@@ -22,6 +33,7 @@ except:
 # max17.quick_start = True
 
 def print_battery_levels():   
+    max17 = get_battery()
     if max17 is None:
         return
     print(f" ")
@@ -37,7 +49,7 @@ def print_battery_levels():
 bat_counter = 0xfff + 1  # only update the battery every so often
 bat_counter_max = 0xfff
 def update_battery_levels():
-    if max17 is None:
+    if get_battery() is None:
         return
     global bat_counter
     if bat_counter > bat_counter_max:
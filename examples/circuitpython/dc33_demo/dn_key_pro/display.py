@@ -1,4 +1,5 @@
 import time
+import asyncio
 import board
 import pwmio
 import displayio
@@ -12,6 +13,8 @@ except ImportError:
     from displayio import FourWire
 
 from .periferals import spi
+from .profiler import profile_begin, profile_end
+from .animation import animator, animate, Tween, ease_in_out, ease_out, ANIMATION_FRAME
 
 # Initialize display
 BL_PWM_MIN = 65534
@@ -20,8 +23,18 @@ BL_PWM_MAX = 65534 * (3/8)
 BL_PWM_ON = BL_PWM_MAX
 BL_PWM_OFF = BL_PWM_MIN
 
+# gamma corrected backlight curve, BACKLIGHT_CURVE[n] is the duty cycle that
+# looks like brightness n / BACKLIGHT_STEPS (the backlight is on when low)
+BACKLIGHT_GAMMA = 2.2
+BACKLIGHT_STEPS = 32
+BACKLIGHT_CURVE = [
+    int(BL_PWM_OFF - (BL_PWM_OFF - BL_PWM_ON) * (n / BACKLIGHT_STEPS) ** BACKLIGHT_GAMMA)
+    for n in range(BACKLIGHT_STEPS + 1)
+]
+
 tft_backlight = pwmio.PWMOut(board.TFT_BL, frequency=80)
 tft_backlight.duty_cycle = BL_PWM_OFF
+backlight_level = 0.0
 
 time.sleep(0.001)
 
@@ -33,6 +46,7 @@ HEIGHT = 172
 tft_cs = board.TFT_CS
 tft_dc = board.TFT_DC
 
+profile_begin("display init")
 while not spi.try_lock():
     pass
 
@@ -59,14 +73,30 @@ display_group.append(tile_grid)
 # set main group to display
 display.root_group = display_group
 time.sleep(0.1)
+profile_end("display init")
+
+
+# set the backlight brightness, 0.0 (off) - 1.0 (BL_PWM_ON)
+def set_backlight(level):
+    global backlight_level
+    backlight_level = min(max(level, 0.0), 1.0)
+    tft_backlight.duty_cycle = BACKLIGHT_CURVE[round(backlight_level * BACKLIGHT_STEPS)]
+
+# fade the backlight to level without blocking, ticked by animator
+def fade_backlight(level, duration=0.5, easing=ease_in_out, on_done=None):
+    return animator.add(Tween(set_backlight, backlight_level, level, duration, easing, on_done))
+
 
-# screen fade in
-for i in range(BL_PWM_MIN, BL_PWM_MAX, -655):
-    tft_backlight.duty_cycle = i
-    time.sleep(0.01)
+# splash fade in and slide, run by boot() next to the other devices
+async def splash_animation():
+    profile_begin("splash")
+    def slide(tween):
+        animate(tile_grid, "x", tile_grid.x + 96, 0.18, ease_out)
 
-for i in range(0, 24):
-    tile_grid.x += 4
-    time.sleep(0.0075)
+    fade_backlight(1.0, 0.65, on_done=slide)
+    while animator.busy:
+        animator.tick()
+        await asyncio.sleep(ANIMATION_FRAME)
 
-time.sleep(0.1)
\ No newline at end of file
+    await asyncio.sleep(0.1)
+    profile_end("splash")
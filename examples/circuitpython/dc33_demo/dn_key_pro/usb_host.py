@@ -1,5 +1,4 @@
 import board
-import max3421e
 import usb
 import time
 
@@ -8,7 +7,15 @@ from .periferals import spi
 cs = board.USB_SS
 irq = board.USB_INT
 
-max3421e = max3421e.Max3421E(spi, chip_select=cs, irq=irq)
+# usb host chip, started on first use by get_usb_host() instead of at boot
+usb_host_chip = None
+
+def get_usb_host():
+    global usb_host_chip
+    if usb_host_chip is None:
+        import max3421e
+        usb_host_chip = max3421e.Max3421E(spi, chip_select=cs, irq=irq)
+    return usb_host_chip
 
 device = None
 vid = None
@@ -17,6 +24,7 @@ pid = None
 # max3421e test
 def test_max3421e():
     global device, vid, pid
+    get_usb_host()
     print("Finding devices:")
     time.sleep(0.5)
     for device in usb.core.find(find_all=True):
@@ -219,6 +219,7 @@ def load_usb_host_screen(user_data=None):
         MenuItem("< Back", go_back_to, main_menu)
     ]
     print("Finding usb devices:")
+    get_usb_host()
     devices = usb.core.find(find_all=True)
     count = 0
     time.sleep(0.5)
@@ -255,7 +256,7 @@ def load_ducky_menu(user_data=None):
         )
     else:
         ducky_menu_items.append(
-            MenuItem("Load from /SD" if sd_card_init_success else "No SD Card found... :/", load_sd_files, "")
+            MenuItem("Load from /SD" if mount_sd_card() else "No SD Card found... :/", load_sd_files, "")
         )
 
     ducky_menu = DuckyMenu("Ducky Script", ducky_menu_items)
@@ -309,7 +310,7 @@ def run_duck(duck_file):
 def load_sd_files(filespath=None):
     global ducky_menu, sd_files_loaded
     print("Load SD Card files:", filespath)
-    if sd_card_init_success:
+    if mount_sd_card():
         ducky_menu.items.clear()
         ducky_menu.selected_index = 0
         ducky_menu.items.append(MenuItem("< Back", load_ducky_menu))
@@ -470,13 +471,14 @@ def get_system_info(user_data=None):
     display_group.append(text_area)
     
     # Battery info
+    max17 = get_battery()
     if max17 is not None:
         battery_text = f"Battery: {max17.cell_percent:.1f}%"
         battery_label = label.Label(terminalio.FONT, text=battery_text, color=NEON_WHITE, x=10, y=50, scale=1)
         display_group.append(battery_label)
     
     # SD card info
-    if sd_card_init_success:
+    if mount_sd_card():
         sd_text = "SD Card: Mounted"
         sd_label = label.Label(terminalio.FONT, text=sd_text, color=NEON_GREEN, x=10, y=70, scale=1)
         display_group.append(sd_label)
@@ -1555,7 +1557,9 @@ def rainbow_cycle(wait, num_pixels=4):
 
 # main starting function
 def main():
+    profile_mark("main start")
     buttons = Buttons()
+    profile_mark("buttons")
 
     main_menu_items = [
         MenuItem("HID BadUSB", load_ducky_menu, "DUCKS!"),
@@ -1568,19 +1572,25 @@ def main():
     ]
 
     global main_menu
-    main_menu = MainMenu("DN KEY PRO", main_menu_items)
+    # splash, SD card and battery come up while the menu is built
+    main_menu = boot(lambda: MainMenu("DN KEY PRO", main_menu_items))
     main_menu.draw(display_group)
+    profile_mark("menu drawn")
     
     # set the current_menu to the desired starting view
     global current_menu
     current_menu = main_menu
 
+    # boot timings, only when DN_KEY_PRO_PROFILE = 1 is in settings.toml
+    report_profile()
+
     # Main Loop - faster timing
     print("Starting Defcon Demo...")
 
     global do_mouse_jiggle
     while True:
         rainbow_cycle(0)  # Increase the number to slow down the rainbow
+        animator.tick()  # run backlight fades and other animations
 
         current_menu.handle_input(buttons, display_group)
         
@@ -2,7 +2,7 @@ import time
 import terminalio
 from adafruit_display_text import label
 
-from .battery import max17, update_battery_levels
+from .battery import get_battery, update_battery_levels
 from .buttons import Buttons
 
 # location helpers for drawing text locations
@@ -60,6 +60,7 @@ class MenuBase:
 
     def handle_input(self, buttons, display_group):
         # uncomment if a battery is soldered
+        max17 = get_battery()
         if not max17 is None:
             update_battery_levels()
             self.battery_label.text = f"BAT:{max17.cell_percent:.1f}%"
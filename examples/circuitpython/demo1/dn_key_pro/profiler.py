@@ -0,0 +1,110 @@
+import gc
+import os
+import time
+
+# Boot profiler, off unless settings.toml has DN_KEY_PRO_PROFILE = 1.
+# Every event stores when it happened and how much RAM was free in a table
+# allocated once, so profiling itself barely moves the numbers
+
+# number of events kept, later ones are only counted in profile_dropped
+PROFILE_SIZE = 96
+
+# where save_profile() appends its record (the SD card is mounted on "/")
+PROFILE_FILE = "/boot_profile.jsonl"
+
+# event kinds
+PROFILE_MARK = 0
+PROFILE_BEGIN = 1
+PROFILE_END = 2
+
+profile_enabled = os.getenv("DN_KEY_PRO_PROFILE", 0) in (1, "1")
+profile_started = time.monotonic_ns()
+profile_count = 0
+profile_dropped = 0
+
+if profile_enabled:
+    import array
+    profile_labels = [None] * PROFILE_SIZE
+    profile_kinds = bytearray(PROFILE_SIZE)
+    # microseconds since profile_started and gc.mem_free()
+    profile_times = array.array("L", [0] * PROFILE_SIZE)
+    profile_free = array.array("L", [0] * PROFILE_SIZE)
+
+
+def profile_event(kind, label):
+    global profile_count, profile_dropped
+    if profile_count >= PROFILE_SIZE:
+        profile_dropped += 1
+        return
+    i = profile_count
+    profile_times[i] = (time.monotonic_ns() - profile_started) // 1000
+    profile_free[i] = gc.mem_free()
+    profile_kinds[i] = kind
+    profile_labels[i] = label
+    profile_count = i + 1
+
+# start of a span, closed by profile_end() with the same label
+def profile_begin(label):
+    if profile_enabled:
+        profile_event(PROFILE_BEGIN, label)
+
+def profile_end(label):
+    if profile_enabled:
+        profile_event(PROFILE_END, label)
+
+# a single point, like the end of one step of main()
+def profile_mark(label):
+    if profile_enabled:
+        profile_event(PROFILE_MARK, label)
+
+
+# Print the table: spans with their time and the RAM they used, marks
+# with the time since the event before them
+def print_profile():
+    if not profile_enabled:
+        print("Profiling is off, set DN_KEY_PRO_PROFILE = 1 in settings.toml")
+        return
+    print(f"{'event':<28} {'at ms':>9} {'took ms':>9} {'free':>8} {'used':>7}")
+    open_spans = {}
+    for i in range(profile_count):
+        kind = profile_kinds[i]
+        label = profile_labels[i]
+        if kind == PROFILE_BEGIN:
+            open_spans[label] = i
+            continue
+        start = open_spans.pop(label, None) if kind == PROFILE_END else None
+        if start is None:
+            start = i - 1 if i > 0 else i
+        took = (profile_times[i] - profile_times[start]) / 1000
+        used = profile_free[start] - profile_free[i]
+        name = "  " * len(open_spans) + label
+        print(f"{name:<28} {profile_times[i] / 1000:>9.1f} {took:>9.1f} {profile_free[i]:>8} {used:>7}")
+    if profile_dropped:
+        print(f"{profile_dropped} event(s) dropped, raise PROFILE_SIZE")
+
+
+# Append the table as one line of JSON to path,
+# returns False when it can't be written (no SD card mounted)
+def save_profile(path=PROFILE_FILE):
+    if not profile_enabled:
+        return False
+    import json
+    events = [
+        [profile_labels[i], profile_kinds[i], profile_times[i], profile_free[i]]
+        for i in range(profile_count)
+    ]
+    try:
+        with open(path, "a") as f:
+            f.write(json.dumps({"dropped": profile_dropped, "events": events}))
+            f.write("\n")
+    except OSError as e:
+        print(f"Could not save profile to {path}: {e}")
+        return False
+    print(f"Profile saved to {path}")
+    return True
+
+# print and save the profile once boot is done, does nothing when off
+def report_profile():
+    if profile_enabled:
+        print_profile()
+        save_profile()
@@ -4,7 +4,8 @@ import board
 import busio
 import digitalio
 import storage
-import adafruit_sdcard
+
+from .profiler import profile_begin, profile_end
 
 # spi bus used by SD Card, stored globably
 spi_0 = None
@@ -13,28 +14,53 @@ spi_0 = None
 DUCKY_DIR = "/DUCKY_SCRIPTS/"
 
 sd_card_init_success = False
+sd_card_tried = False
+
+# Initialize SD Card, yields the seconds to wait between steps so the
+# same steps can run blocking or as an asyncio task
+def sd_mount_steps():
+    global spi_0, sd_card_init_success
+    profile_begin("sd mount")
+    print("Trying SD CARD setup")
+    try:
+        import adafruit_sdcard
+        spi_0 = busio.SPI(board.SD_CLK, MISO=board.SD_D0, MOSI=board.SD_DI)
+        while not spi_0.try_lock():
+            pass
+        spi_0.configure(baudrate=2400000)
+        spi_0.unlock()
+        # spi_0 = busio.SPI(board.SD_CLK, MISO=board.SD_D0, MOSI=board.SD_DI)
+        # sdcard = sdcardio.SDCard(spi_0, board.D7, baudrate=2000000)
+        cs = digitalio.DigitalInOut(board.SD_CS)
+        sdcard = adafruit_sdcard.SDCard(spi_0, cs)
+        vfs = storage.VfsFat(sdcard)
+        yield 0.25
+        storage.mount(vfs, "/")
+        yield 0.5
+        print("SD Card Mounted")
+        sd_card_init_success = True
+    except OSError as e:
+        print(f"SD Card Error: {e}")
+    profile_end("sd mount")
 
-print("Trying SD CARD setup")
-# Initialize SD Card
-try:
-    spi_0 = busio.SPI(board.SD_CLK, MISO=board.SD_D0, MOSI=board.SD_DI)
-    while not spi_0.try_lock():
-        pass
-    spi_0.configure(baudrate=2400000)
-    spi_0.unlock()
-    # spi_0 = busio.SPI(board.SD_CLK, MISO=board.SD_D0, MOSI=board.SD_DI)
-    # sdcard = sdcardio.SDCard(spi_0, board.D7, baudrate=2000000)
-    cs = digitalio.DigitalInOut(board.SD_CS)
-    sdcard = adafruit_sdcard.SDCard(spi_0, cs)
-    vfs = storage.VfsFat(sdcard)
-    time.sleep(0.25)
-    storage.mount(vfs, "/")
-    time.sleep(0.5)
-    print("SD Card Mounted")
-    sd_card_init_success = True
-except OSError as e:
-    print(f"SD Card Error: {e}")
+# mount on first use, later calls return the first result
+def mount_sd_card():
+    global sd_card_tried
+    if not sd_card_tried:
+        sd_card_tried = True
+        for delay in sd_mount_steps():
+            time.sleep(delay)
+    return sd_card_init_success
 
+# same as mount_sd_card(), sleeping without blocking other tasks
+async def mount_sd_card_async():
+    global sd_card_tried
+    if not sd_card_tried:
+        sd_card_tried = True
+        import asyncio
+        for delay in sd_mount_steps():
+            await asyncio.sleep(delay)
+    return sd_card_init_success
 
 def print_directory(path, tabs=0):
     for file in os.listdir(path):
@@ -63,5 +89,5 @@ def print_directory(path, tabs=0):
         if isdir:
             print_directory(path + "/" + file, tabs + 1)
 
-# if sd_card_init_success:
+# if mount_sd_card():
 #     print_directory("/")
@@ -0,0 +1,44 @@
+import asyncio
+
+from .display import splash_animation
+from .battery import get_battery
+from .sd_card import mount_sd_card_async
+from .profiler import profile_begin, profile_end
+
+
+# run a blocking step (battery probe, menu build) in one of the gaps the
+# sleeping tasks leave, after they have all started
+async def run_between(func):
+    await asyncio.sleep(0)
+    return func()
+
+async def build_menu_task(build_menu):
+    await asyncio.sleep(0)
+    profile_begin("menu build")
+    menu = build_menu()
+    profile_end("menu build")
+    return menu
+
+async def boot_tasks(build_menu, extra_tasks):
+    # asyncio is cooperative: only the sleeps (splash frames, SD settle times,
+    # anything in extra_tasks) overlap, the short blocking steps run one at a
+    # time in between. Boot takes about as long as the longest sleeping task
+    # plus the blocking steps, instead of the sum of every sleep
+    tasks = [
+        asyncio.create_task(build_menu_task(build_menu)),
+        asyncio.create_task(splash_animation()),
+        asyncio.create_task(mount_sd_card_async()),
+        asyncio.create_task(run_between(get_battery)),
+    ]
+    tasks += [asyncio.create_task(task) for task in extra_tasks]
+    results = await asyncio.gather(*tasks)
+    return results[0]
+
+# Bring up the splash, SD card and battery gauge while build_menu() runs,
+# along with any extra coroutines (like LED status stages), returns what
+# build_menu() returned once all of them are done
+def boot(build_menu, *extra_tasks):
+    profile_begin("boot")
+    menu = asyncio.run(boot_tasks(build_menu, extra_tasks))
+    profile_end("boot")
+    return menu
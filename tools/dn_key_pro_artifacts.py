@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro firmware artifact store
+==================================
+
+Content-addressed cache used by dn_key_pro_recovery.py. Every firmware image
+(bootloader, partition table, OTA data, TinyUF2, CircuitPython UF2/.bin) is
+copied into the store under its SHA-256 and verified once, when it is
+imported. After that:
+
+- a source file whose path, size and mtime haven't changed is resolved to its
+  hash from the manifest without being read again;
+- derived images (the merged flash image) are looked up by the hashes of
+  their inputs and only rebuilt when one of them changes;
+- provisioned.jsonl records which exact artifacts went onto which board.
+
+Layout under the store root:
+
+    manifest.json           artifacts, source index and derived images
+    objects/ab/abcdef...    artifact contents, named by SHA-256
+    provisioned.jsonl       one JSON line per provisioned board
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+HASH_CHUNK = 1024 * 1024
+
+# Root of the tools' caches: the artifact store, compiled modules, checkpoints
+CACHE_DIR = Path.home() / ".cache" / "dn_key_pro"
+
+
+class ArtifactError(Exception):
+    """An artifact could not be imported or failed verification"""
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Artifact:
+    """A verified file in the store"""
+
+    def __init__(self, sha256, path, kind, name, size, cached):
+        self.sha256 = sha256
+        self.path = path
+        self.kind = kind
+        self.name = name
+        self.size = size
+        self.cached = cached
+
+    @property
+    def short_hash(self):
+        return self.sha256[:12]
+
+
+class ArtifactStore:
+    """SHA-256 keyed artifact cache with a JSON manifest"""
+
+    def __init__(self, root):
+        self.root = Path(root).expanduser()
+        self.objects = self.root / "objects"
+        self.manifest_path = self.root / "manifest.json"
+        self.provisioned_path = self.root / "provisioned.jsonl"
+        self._lock = threading.Lock()
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {"version": MANIFEST_VERSION, "artifacts": {}, "sources": {}, "derived": {}}
+
+    def save(self):
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.manifest_path.with_name(f"manifest.json.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(self.manifest, f, indent=2, sort_keys=True)
+            tmp.replace(self.manifest_path)
+
+    def object_path(self, sha256):
+        return self.objects / sha256[:2] / sha256
+
+    def _artifact(self, sha256, cached):
+        entry = self.manifest["artifacts"][sha256]
+        return Artifact(sha256, self.object_path(sha256), entry["kind"], entry["name"], entry["size"], cached)
+
+    def _has_object(self, sha256):
+        entry = self.manifest["artifacts"].get(sha256)
+        path = self.object_path(sha256)
+        return entry is not None and path.exists() and path.stat().st_size == entry["size"]
+
+    def _add_object(self, sha256, kind, name, write):
+        """Write an object with write(tmp_path), verify its hash and record it"""
+        path = self.object_path(sha256)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{sha256}.{os.getpid()}.{threading.get_ident()}.tmp")
+            write(tmp)
+            if sha256_file(tmp) != sha256:
+                tmp.unlink()
+                raise ArtifactError(f"{name}: stored copy does not match SHA-256 {sha256}")
+            tmp.replace(path)
+        with self._lock:
+            self.manifest["artifacts"][sha256] = {
+                "kind": kind,
+                "name": name,
+                "size": path.stat().st_size,
+                "imported": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+
+    def import_file(self, source, kind):
+        """Import a source file, returning its Artifact
+
+        Unchanged sources (same path, size and mtime) are resolved from the
+        manifest without hashing the file again.
+        """
+        source = Path(source).resolve()
+        stat = source.stat()
+        key = str(source)
+
+        with self._lock:
+            known = self.manifest["sources"].get(key)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            if self._has_object(known["sha256"]):
+                return self._artifact(known["sha256"], cached=True)
+
+        sha256 = sha256_file(source)
+        cached = self._has_object(sha256)
+        if not cached:
+            self._add_object(sha256, kind, source.name, lambda tmp: shutil.copyfile(source, tmp))
+        with self._lock:
+            self.manifest["sources"][key] = {
+                "sha256": sha256,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+        return self._artifact(sha256, cached)
+
+    def derived(self, kind, name, inputs, build):
+        """Return the artifact built from inputs, calling build() only on a miss
+
+        inputs are the Artifacts the result depends on; build() returns bytes.
+        """
+        key = hashlib.sha256(kind.encode() + b"".join(a.sha256.encode() for a in inputs)).hexdigest()
+        with self._lock:
+            sha256 = self.manifest["derived"].get(key)
+        if sha256 and self._has_object(sha256):
+            return self._artifact(sha256, cached=True)
+
+        data = build()
+        sha256 = hashlib.sha256(data).hexdigest()
+        if not self._has_object(sha256):
+            self._add_object(sha256, kind, name, lambda tmp: tmp.write_bytes(data))
+        with self._lock:
+            self.manifest["derived"][key] = sha256
+            self.manifest["artifacts"][sha256]["inputs"] = [a.sha256 for a in inputs]
+        return self._artifact(sha256, cached=False)
+
+    def record_provisioning(self, record):
+        """Append one provisioned-board record to provisioned.jsonl"""
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.provisioned_path, "a") as f:
+                f.write(json.dumps(record, sort_keys=True) + "\n")
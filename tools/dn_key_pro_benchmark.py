@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro provisioning benchmark
+=================================
+
+Measures dn_key_pro_recovery.py without real boards. The recovery tool runs
+unmodified against simulated hardware:
+
+- SimulatedEsptool stands in for the esptool drivers. Every command sleeps
+  for a configurable latency (writes also for their zlib-compressed size
+  divided by --write-rate, as esptool sends them) and fails with a
+  configurable probability.
+- Simulated boards mount DN_BOOT after a reset into TinyUF2, install a UF2
+  copied onto it, and mount DN-S3-PY once "CircuitPython" boots, each after
+  its own delay. Volumes are plain directories under a temporary root.
+
+Each scheduling mode (sequential, parallel, pipeline) is run for every device
+count and the end-to-end time per device and for the whole batch is
+reported, in simulated seconds (measured time divided by --time-scale).
+
+Usage:
+    python3 dn_key_pro_benchmark.py
+    python3 dn_key_pro_benchmark.py --devices 1 4 8 --jobs 8 --time-scale 0.05
+    python3 dn_key_pro_benchmark.py --latency erase=4 --failure-rate write=0.05
+    python3 dn_key_pro_benchmark.py --merged --json benchmark.json
+
+Sleeps and timeouts inside the recovery tool itself are not scaled (for
+example the 8 s reboot wait used with --shared-volumes, or the 60 s volume
+timeout after a simulated volume failure); use --time-scale 1 to compare
+runs that hit them.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import dn_key_pro_recovery as recovery_module
+from dn_key_pro_esptool import EsptoolError, image_bytes
+from dn_key_pro_firmware import PARTITION_ENTRY, PARTITION_MAGIC
+from dn_key_pro_metrics import RunLog, percentile, run_summary
+from dn_key_pro_usb import DeviceMonitor, usb_hub_path
+
+# Simulated durations in seconds (write also takes compressed size / write rate)
+DEFAULT_LATENCIES = {
+    "connect": 1.0,            # open port, sync ROM loader, upload stub
+    "read_mac": 0.05,
+    "erase": 8.0,              # erase_flash of the whole 8 MB chip
+    "write": 0.2,              # per write_flash, plus compressed size / write rate
+    "verify": 0.3,             # per region hashed by verify_flash
+    "reenumerate": 1.0,        # ROM port gone and back after a reset
+    "boot": 1.5,               # reset -> DN_BOOT / DN-S3-PY mounted
+    "uf2_install": 10.0,       # UF2 copied -> TinyUF2 done writing it
+    "probe": 0.5,              # baud rate probe (in-process driver only)
+}
+
+# Compressed bytes per second on the wire at 460800 baud (10 bits per byte);
+# scaled with the baud rate a simulated session runs at
+DEFAULT_WRITE_RATE = 46000
+REFERENCE_BAUD = 460800
+
+# Fastest baud rate the simulated ports pass the probe at
+DEFAULT_MAX_BAUD = 921600
+
+# Probability that a command fails: connect, read_mac, erase, write, verify, volume
+DEFAULT_FAILURE_RATES = {}
+
+SCHEDULING_MODES = ("sequential", "parallel", "pipeline")
+
+# Fake firmware sizes in bytes
+FIRMWARE_SIZES = {
+    "bootloader.bin": 20 * 1024,
+    "tinyuf2.bin": 200 * 1024,
+    "circuitpython.bin": 1400 * 1024,
+    "circuitpython.uf2": 2800 * 1024,
+}
+
+# Simulated boards boot into CircuitPython when OTA data selects ota_0
+OTA_0_SELECTED = "ota_0"
+
+
+def partition_table():
+    """Partition table with the DN-KEY Pro layout (TinyUF2 factory app)"""
+    entries = [
+        (1, 0x02, 0x9000, 0x5000, b"nvs"),
+        (1, 0x00, 0xE000, 0x2000, b"otadata"),
+        (0, 0x10, 0x10000, 0x200000, b"ota_0"),
+        (0, 0x11, 0x210000, 0x200000, b"ota_1"),
+        (0, 0x00, 0x410000, 0x40000, b"uf2"),
+        (1, 0x81, 0x450000, 0x3B0000, b"ffat"),
+    ]
+    data = b"".join(PARTITION_ENTRY.pack(PARTITION_MAGIC, ptype, subtype, offset, size, label, 0)
+                    for ptype, subtype, offset, size, label in entries)
+    return data + b"\xff" * (0xC00 - len(data))
+
+
+def write_firmware(directory, rng):
+    """Create fake firmware files, return the recovery tool configuration for them"""
+    build = directory / "tinyuf2" / "build"
+    build.mkdir(parents=True)
+    for name, size in FIRMWARE_SIZES.items():
+        target = (build if name.endswith("bin") and "circuitpython" not in name else directory) / name
+        # Random data followed by padding compresses about as well as real firmware (~60%)
+        random_size = size * 6 // 10
+        target.write_bytes(rng.getrandbits(random_size * 8).to_bytes(random_size, "little")
+                           + b"\0" * (size - random_size))
+    (build / "partition-table.bin").write_bytes(partition_table())
+    (build / "ota_data_initial.bin").write_bytes(b"\xff" * 0x2000)
+    (directory / "code.py").write_text("print('Hello from the benchmark')\n")
+    return {
+        "TINYUF2_DIR": str(build),
+        "TINYUF2_PARTITION_TABLE": "partition-table.bin",
+        "TINYUF2_OTA_DATA": "ota_data_initial.bin",
+        "TINYUF2_BOOTLOADER": "bootloader.bin",
+        "TINYUF2_BINARY": "tinyuf2.bin",
+        "CIRCUITPYTHON_UF2": str(directory / "circuitpython.uf2"),
+        "CIRCUITPYTHON_BIN": str(directory / "circuitpython.bin"),
+        "SAMPLE_CODE": str(directory / "code.py"),
+        "CACHE_DIR": str(directory / "cache"),
+    }
+
+
+@contextlib.contextmanager
+def recovery_configuration(settings):
+    """Temporarily point the recovery tool's configuration at the fake firmware"""
+    saved = {name: getattr(recovery_module, name) for name in settings}
+    try:
+        for name, value in settings.items():
+            setattr(recovery_module, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(recovery_module, name, value)
+
+
+class SimulatedBoard:
+    """One ESP32-S3: its serial port, flash contents and mounted volumes"""
+
+    def __init__(self, hardware, index):
+        self.hardware = hardware
+        self.index = index
+        self.port = str(hardware.root / "dev" / f"ttySIM{index}")
+        # Boards are spread over the simulated hubs: 1-1.1, 1-2.1, 1-1.2, ...
+        self.usb_port = f"1-{index % hardware.hubs + 1}.{index // hardware.hubs + 1}"
+        self.mac = f"sm:00:00:00:{index // 256:02x}:{index % 256:02x}"
+        self.flash = {}
+        self.installing = False
+        self.volumes = hardware.root / "volumes" / self.usb_port
+        Path(self.port).touch()
+
+    def volume(self, label):
+        return self.volumes / label
+
+    def set_volume(self, label, present):
+        path = self.volume(label)
+        if present:
+            path.mkdir(parents=True, exist_ok=True)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+        self.hardware.notify()
+
+    def reenumerate(self):
+        """Serial port disappears and comes back, e.g. after esptool's hard reset"""
+        self.set_port(False)
+        self.hardware.later("reenumerate", lambda: self.set_port(True))
+
+    def set_port(self, present):
+        if present:
+            Path(self.port).touch()
+        elif os.path.exists(self.port):
+            os.unlink(self.port)
+        self.hardware.notify()
+
+    def reset(self):
+        """Hard reset: boot whatever the flash and OTA data select"""
+        self.set_volume("DN_BOOT", False)
+        self.set_volume("DN-S3-PY", False)
+        if 0x0 not in self.flash:
+            # Blank flash: the ROM bootloader stays up
+            self.reenumerate()
+            return
+        self.set_port(False)
+        label = "DN-S3-PY" if self.flash.get(0xE000) == OTA_0_SELECTED else "DN_BOOT"
+        if not self.hardware.fails("volume"):
+            self.hardware.later("boot", lambda: self.set_volume(label, True))
+
+    def install_uf2(self):
+        """TinyUF2 got a UF2 file: write it, select ota_0 and reboot into CircuitPython"""
+        def installed():
+            self.installing = False
+            self.flash[0xE000] = OTA_0_SELECTED
+            self.reset()
+
+        self.installing = True
+        self.hardware.later("uf2_install", installed)
+
+
+class SimulatedHardware:
+    """A set of simulated boards plus the timers that drive their USB behaviour"""
+
+    def __init__(self, root, latencies, failure_rates, write_rate, time_scale, seed, max_baud=DEFAULT_MAX_BAUD,
+                 hubs=1):
+        self.root = Path(root)
+        (self.root / "dev").mkdir(parents=True, exist_ok=True)
+        self.latencies = latencies
+        self.failure_rates = failure_rates
+        self.write_rate = write_rate
+        self.max_baud = max_baud
+        self.hubs = max(1, hubs)
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.monitor = SimulatedMonitor()
+        self.boards = []
+        self.timers = []
+        self.digests = {}
+        self.compressed = {}
+        # Digest of the OTA data image that boots CircuitPython, once known
+        self.boot_ota_0 = None
+        self.running = True
+        self.watcher = threading.Thread(target=self._watch_volumes, name="sim-volumes", daemon=True)
+        self.watcher.start()
+
+    def add_boards(self, count, provisioned_images=None):
+        for _ in range(count):
+            board = SimulatedBoard(self, len(self.boards))
+            if provisioned_images:
+                board.flash = {int(offset, 16): self.flash_digest(path) for offset, path in provisioned_images}
+                board.flash[0xE000] = OTA_0_SELECTED
+            self.boards.append(board)
+        return self.boards
+
+    def board(self, port):
+        return next(board for board in self.boards if board.port == port)
+
+    def notify(self):
+        self.monitor.notify()
+
+    def sleep(self, name, extra=0.0):
+        time.sleep((self.latencies.get(name, 0.0) + extra) * self.time_scale)
+
+    def fails(self, name):
+        with self.rng_lock:
+            return self.rng.random() < self.failure_rates.get(name, 0.0)
+
+    def later(self, name, action):
+        timer = threading.Timer(self.latencies.get(name, 0.0) * self.time_scale, action)
+        timer.daemon = True
+        self.timers.append(timer)
+        timer.start()
+
+    def digest(self, path):
+        path = str(path)
+        if path not in self.digests:
+            with open(path, "rb") as f:
+                self.digests[path] = hashlib.sha256(f.read()).hexdigest()
+        return self.digests[path]
+
+    def flash_digest(self, path):
+        """What a board's flash holds after writing the image (OTA data booting ota_0 is tracked by name)"""
+        digest = self.digest(path)
+        return OTA_0_SELECTED if digest == self.boot_ota_0 else digest
+
+    def compressed_size(self, path):
+        """Bytes write_flash -z would send for an image"""
+        path = str(path)
+        if path not in self.compressed:
+            with open(path, "rb") as f:
+                self.compressed[path] = len(zlib.compress(f.read(), 9))
+        return self.compressed[path]
+
+    def _watch_volumes(self):
+        # Boards "see" a UF2 as soon as the recovery tool copies it onto DN_BOOT
+        while self.running:
+            for board in list(self.boards):
+                dn_boot = board.volume("DN_BOOT")
+                if not board.installing and dn_boot.is_dir() and any(dn_boot.glob("*.uf2")):
+                    board.install_uf2()
+            time.sleep(0.01)
+
+    def stop(self):
+        self.running = False
+        for timer in self.timers:
+            timer.cancel()
+        self.watcher.join()
+
+
+class SimulatedMonitor(DeviceMonitor):
+    """DeviceMonitor woken by the simulated boards instead of kernel events"""
+
+    def start(self):
+        self.event_driven = True
+        return True
+
+
+class SimulatedEsptool:
+    """Stand-in for LibraryEsptool / SubprocessEsptool backed by a SimulatedBoard
+
+    With the subprocess driver every command pays the connect latency again
+    and write_flash / erase_flash end with a hard reset, like the real tool.
+    """
+
+    def __init__(self, board, driver):
+        self.board = board
+        self.hardware = board.hardware
+        self.name = driver
+        self.port = board.port
+        self.baud = int(recovery_module.BAUD_RATE)
+        self.baud_fallbacks = []
+        self.mac = None
+        self.last_command = None
+        self.bytes_written = 0
+        self.reset_pending = False
+
+    def _command(self, name, extra=0.0):
+        self.last_command = f"simulated {name} on {self.port}"
+        if self.name == "subprocess":
+            # Every esptool process connects again and prints the MAC
+            self.hardware.sleep("connect")
+            self.mac = self.board.mac
+        if not os.path.exists(self.port):
+            raise EsptoolError(f"could not open port {self.port}: No such file or directory")
+        self.hardware.sleep(name, extra)
+        if self.hardware.fails(name):
+            raise EsptoolError(f"simulated {name} failure")
+
+    def connect(self):
+        if self.name == "library":
+            self._command("connect")
+        return self
+
+    def set_baud(self, baud, reconnect=False):
+        self.baud = int(baud)
+
+    def read_mac(self):
+        self._command("read_mac")
+        self.mac = self.board.mac
+        return self.mac
+
+    def erase_flash(self):
+        self._command("erase")
+        self.board.flash.clear()
+        self.reset_pending = False
+        if self.name == "subprocess":
+            self.board.reenumerate()
+        return ""
+
+    def write_flash(self, images, flash_mode, flash_freq, flash_size, cwd=None, reset=True):
+        paths = [(offset, os.path.join(cwd, filename) if cwd else filename) for offset, filename in images]
+        wire_bytes = sum(self.hardware.compressed_size(path) for _, path in paths)
+        self._command("write", wire_bytes / (self.hardware.write_rate * self.baud / REFERENCE_BAUD))
+        for offset, path in paths:
+            self.board.flash[int(offset, 16)] = self.hardware.flash_digest(path)
+            if int(offset, 16) == 0 and os.path.getsize(path) > 0x10000:
+                # Merged image: its OTA data selects the CircuitPython slot
+                self.board.flash[0xE000] = OTA_0_SELECTED
+        self.bytes_written += image_bytes(images, cwd)
+        if self.name == "subprocess" and reset:
+            self.board.reset()
+        self.reset_pending = self.name == "subprocess" and not reset
+        return ""
+
+    def verify_regions(self, images, flash_mode, flash_freq, flash_size, cwd=None):
+        self._command("verify", self.hardware.latencies.get("verify", 0.0) * (len(images) - 1))
+        self.reset_pending = self.name == "subprocess"
+        return {
+            int(offset, 16): self.board.flash.get(int(offset, 16)) == self.hardware.flash_digest(
+                os.path.join(cwd, filename) if cwd else filename)
+            for offset, filename in images
+        }
+
+    def close(self, reset=True):
+        if reset and self.reset_pending:
+            self._command("reset")
+        if reset and (self.name == "library" or self.reset_pending):
+            self.board.reset()
+        self.reset_pending = False
+
+
+class SimulatedLibraryEsptool(SimulatedEsptool):
+    """The in-process driver can also probe the port's fastest baud rate"""
+
+    def probe_baud(self):
+        self._command("probe")
+        self.baud = self.hardware.max_baud
+        return self.baud, self.hardware.write_rate * self.baud / REFERENCE_BAUD
+
+
+class SimulatedRecovery(recovery_module.DNKeyProRecovery):
+    """The recovery tool wired to simulated boards, quiet on the console"""
+
+    def __init__(self, hardware, driver="library", shared_volumes=False):
+        super().__init__()
+        self.hardware = hardware
+        self.driver = driver
+        self.shared_volumes = shared_volumes
+        self.device_monitor = hardware.monitor
+        self.console_output = False
+        self.log_file = hardware.root / "recovery_log.jsonl"
+        self.run_log = RunLog(self.log_file)
+        self.resume = False
+
+    def check_dependencies(self):
+        return True
+
+    def scan_ports(self):
+        return [board.port for board in self.hardware.boards]
+
+    def new_result(self, device_port):
+        result = super().new_result(device_port)
+        # Without USB port paths (macOS/Windows) volumes are told apart by label only
+        result.usb_port = None if self.shared_volumes else self.hardware.board(device_port).usb_port
+        result.hub = self.port_hub(device_port)
+        return result
+
+    def port_hub(self, device_port):
+        if self.shared_volumes:
+            return None
+        return usb_hub_path(self.hardware.board(device_port).usb_port)
+
+    def open_esptool(self, device_port, device_id):
+        driver = SimulatedLibraryEsptool if self.driver == "library" else SimulatedEsptool
+        return driver(self.hardware.board(device_port), self.driver).connect()
+
+    def volume_candidates(self, volume_name, usb_port=None):
+        if usb_port:
+            return [str(self.hardware.root / "volumes" / usb_port / volume_name)]
+        return [str(board.volume(volume_name)) for board in self.hardware.boards]
+
+
+def run_benchmark(mode, devices, options):
+    """Recover `devices` simulated boards with one scheduling mode, return the metrics"""
+    root = Path(tempfile.mkdtemp(prefix="dn_key_pro_bench_"))
+    rng = random.Random(options.seed)
+    try:
+        settings = write_firmware(root / "firmware", rng)
+        with recovery_configuration(settings):
+            hardware = SimulatedHardware(root / "hardware", options.latencies, options.failure_rates,
+                                         options.write_rate, options.time_scale, options.seed, options.max_baud,
+                                         options.hubs)
+            try:
+                recovery = SimulatedRecovery(hardware, options.driver, options.shared_volumes)
+                recovery.merged = options.merged
+                recovery.refresh = options.refresh
+                recovery.verify = options.verify
+                recovery.up_to_date = options.up_to_date
+                recovery.probe_baud = not options.no_baud_probe
+                recovery.limiter.per_hub = options.hub_jobs
+                recovery.limiter.total = options.jobs
+                if not recovery.prepare_recovery():
+                    raise RuntimeError(f"recovery setup failed, see {recovery.log_file}")
+                ota_data = [path for _, name, path in recovery.firmware_regions + recovery.merged_parts
+                            if name == "ota_data"]
+                if ota_data:
+                    hardware.boot_ota_0 = hardware.digest(ota_data[0])
+                provisioned = None
+                if options.installed:
+                    provisioned = [(offset, path) for offset, _, path in recovery.firmware_regions]
+                elif options.provisioned:
+                    provisioned = recovery.tinyuf2_images()
+                hardware.add_boards(devices, provisioned)
+
+                started = time.monotonic()
+                results = recovery.recover_devices(
+                    recovery.scan_ports(),
+                    parallel=mode == "parallel",
+                    max_workers=options.jobs,
+                    pipeline=mode == "pipeline",
+                )
+                wall_time = (time.monotonic() - started) / options.time_scale
+                recovery.run_log.close()
+            finally:
+                hardware.stop()
+    finally:
+        if options.keep:
+            print(f"  kept {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    # Report simulated seconds
+    for result in results:
+        result.stage_times = {name: t / options.time_scale for name, t in result.stage_times.items()}
+    summary = run_summary(results, wall_time)
+    durations = [result.duration / options.time_scale for result in results]
+    summary.update({
+        "mode": mode,
+        "device_p50": percentile(durations, 50),
+        "device_p90": percentile(durations, 90),
+        "device_max": max(durations) if durations else None,
+    })
+    return summary
+
+
+def parse_overrides(values, defaults):
+    """NAME=VALUE pairs from the command line on top of a defaults dict"""
+    merged = dict(defaults)
+    for value in values or []:
+        name, _, number = value.partition("=")
+        try:
+            merged[name] = float(number)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected NAME=NUMBER, got {value!r}")
+    return merged
+
+
+def print_report(summaries):
+    header = (f"{'Mode':<11} {'Devices':>7} {'OK':>4} {'Batch':>9} {'Dev p50':>9} {'Dev p90':>9} "
+              f"{'Dev/hour':>9}  Slowest stage (p50)")
+    print(header)
+    print("-" * len(header))
+    for summary in summaries:
+        stages = summary["stages"]
+        slowest = max(stages, key=lambda name: stages[name]["p50"]) if stages else "-"
+        slowest_text = f"{slowest} {stages[slowest]['p50']:.1f}s" if stages else "-"
+        per_hour = summary["devices_per_hour"] or 0
+        print(f"{summary['mode']:<11} {summary['devices']:>7} {summary['succeeded']:>4} "
+              f"{summary['wall_time']:>8.1f}s {summary['device_p50']:>8.1f}s {summary['device_p90']:>8.1f}s "
+              f"{per_hour:>9.0f}  {slowest_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dn_key_pro_recovery.py against simulated boards")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 4],
+                        help="device counts to benchmark (default: 1 4)")
+    parser.add_argument("--modes", nargs="+", choices=SCHEDULING_MODES, default=list(SCHEDULING_MODES),
+                        help="scheduling modes to benchmark (default: all)")
+    parser.add_argument("-j", "--jobs", type=int, default=recovery_module.MAX_CONCURRENT_DEVICES,
+                        help="worker limit for parallel mode")
+    parser.add_argument("--hubs", type=int, default=1, help="spread the boards over this many USB hubs")
+    parser.add_argument("--hub-jobs", type=int, default=recovery_module.MAX_JOBS_PER_HUB,
+                        help="per-hub limit for serial stages, 0 for no limit")
+    parser.add_argument("--driver", choices=["library", "subprocess"], default="library",
+                        help="simulate the in-process or the subprocess esptool driver")
+    parser.add_argument("--latency", action="append", metavar="NAME=SECONDS",
+                        help=f"override a simulated latency ({', '.join(DEFAULT_LATENCIES)})")
+    parser.add_argument("--failure-rate", action="append", metavar="NAME=P",
+                        help="probability that connect, read_mac, erase, write, verify or volume fails")
+    parser.add_argument("--write-rate", type=float, default=DEFAULT_WRITE_RATE,
+                        help=f"simulated compressed write_flash bytes per second (default: {DEFAULT_WRITE_RATE})")
+    parser.add_argument("--max-baud", type=int, default=DEFAULT_MAX_BAUD,
+                        help=f"fastest baud rate the simulated ports pass the probe at (default: {DEFAULT_MAX_BAUD})")
+    parser.add_argument("--time-scale", type=float, default=0.1,
+                        help="real seconds per simulated second (default: 0.1)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for failures")
+    parser.add_argument("--no-baud-probe", action="store_true", help="flash at BAUD_RATE instead of the probed rate")
+    parser.add_argument("--merged", action="store_true", help="benchmark --merged flashing")
+    parser.add_argument("--refresh", action="store_true", help="benchmark --refresh flashing")
+    parser.add_argument("--verify", action="store_true", help="add the on-chip flash verification stage")
+    parser.add_argument("--provisioned", action="store_true",
+                        help="boards start with the current TinyUF2 already on them (for --refresh)")
+    parser.add_argument("--installed", action="store_true",
+                        help="boards start with the current TinyUF2 and CircuitPython already on them")
+    parser.add_argument("--up-to-date", choices=["code", "skip", "reflash"],
+                        default=recovery_module.UP_TO_DATE_BOARDS,
+                        help="what the recovery tool does with up-to-date boards")
+    parser.add_argument("--shared-volumes", action="store_true",
+                        help="volumes can't be matched to boards by USB port (macOS/Windows behaviour)")
+    parser.add_argument("--json", metavar="PATH", help="also write all summaries to a JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the simulated volumes and logs")
+    options = parser.parse_args()
+    options.latencies = parse_overrides(options.latency, DEFAULT_LATENCIES)
+    options.failure_rates = parse_overrides(options.failure_rate, DEFAULT_FAILURE_RATES)
+    if options.time_scale <= 0:
+        parser.error("--time-scale must be positive")
+
+    summaries = []
+    for devices in options.devices:
+        for mode in options.modes:
+            print(f"Running {mode} with {devices} device(s)...", file=sys.stderr)
+            summaries.append(run_benchmark(mode, devices, options))
+
+    print()
+    print_report(summaries)
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump({"options": {k: v for k, v in vars(options).items() if k not in ("latency", "failure_rate")},
+                       "results": summaries}, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
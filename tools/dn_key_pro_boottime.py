@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro boot time
+====================
+
+Measures how long a board takes from reset to the main menu of the
+CircuitPython demo, from what it prints on the serial console:
+
+    python3 dn_key_pro_boottime.py --runs 20
+
+Every run resets the board, stamps each known console line (BOOT_MARKERS)
+with the host's monotonic clock, and splits the boot into stages: the time
+from one marker to the next. After all runs the stages and the total time to
+"Starting Defcon Demo..." are reported with their percentiles.
+
+Resets are soft by default (Ctrl-C, then Ctrl-D to reload code.py), so the
+console stays connected and no line is missed. --reset hard calls
+microcontroller.reset(); output printed before the port comes back is lost,
+and those markers are reported as missed.
+
+Consoles recorded by dn_key_pro_monitor.py (or with --save here) can be
+analysed offline with --replay. Each "--- reset ---" or "soft reboot" line
+starts a run.
+
+With --baseline, the median total and stage times are compared with an
+earlier --json result and the exit status is 1 when one got slower than
+--tolerance allows, so the tool can gate startup latency regressions.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+from dn_key_pro_metrics import PERCENTILES, percentile
+from dn_key_pro_monitor import ConsoleMux, MonitorError
+from dn_key_pro_repl import find_repl_ports
+
+# (name, what the stage ending at this line covers, console line), in boot order;
+# the boot() tasks run concurrently, so their lines may come in any order
+BOOT_MARKERS = (
+    ("code_start", "reset to code.py", r"^code\.py output:"),
+    ("display", "imports, display init", r"^Initializing DEEPNET Key Pro"),
+    ("main", "code.py module body", r"^starting$"),
+    ("buttons_start", "LED stages", r"^Attempting to initialize buttons"),
+    ("buttons", "button init", r"^(Buttons initialized|Button initialization failed)"),
+    ("hid", "LED stage", r"^HID devices will be initialized on-demand"),
+    ("menu_start", "LED stage", r"^Creating main menu"),
+    ("sd_start", "boot tasks start", r"^Trying SD CARD setup"),
+    ("battery", "battery probe", r"^(Found MAX1704x|no i2c setup)"),
+    ("sd_mount", "SD mount", r"^SD Card (Mounted|Error)"),
+    ("menu_created", "splash, rest of boot tasks", r"^Main menu created"),
+    ("menu_drawn", "menu draw", r"^Main menu drawn"),
+    ("ready", "main loop start", r"^Starting Defcon Demo"),
+)
+
+# The last marker of a boot; the total is measured up to it
+READY_MARKER = "ready"
+
+# Lines that start a new run in a replayed console log
+RUN_START = re.compile(r"^(--- reset|soft reboot)")
+
+# Seconds to wait for READY_MARKER after a reset
+BOOT_TIMEOUT = 60.0
+
+# Seconds left after Ctrl-C for code.py to stop before Ctrl-D or the reset command
+STOP_DELAY = 0.5
+
+# Monitor log line: "<seconds> <console line>"
+LOG_LINE = re.compile(r"^(\d+\.\d+) (.*)$")
+
+
+class BootRun:
+    """Console markers of one boot, in seconds since the reset"""
+
+    def __init__(self, markers, reset_time):
+        self.markers = markers
+        self.reset_time = reset_time
+        self.found = {}
+        self.lines = 0
+
+    def feed(self, timestamp, line):
+        self.lines += 1
+        for name, _, pattern in self.markers:
+            if name not in self.found and pattern.search(line):
+                self.found[name] = timestamp - self.reset_time
+                return name
+        return None
+
+    @property
+    def complete(self):
+        return READY_MARKER in self.found
+
+    @property
+    def total(self):
+        return self.found.get(READY_MARKER)
+
+    def stages(self):
+        """Map marker -> seconds since the previous marker seen (or the reset)"""
+        stages = {}
+        previous = 0.0
+        for name, offset in sorted(self.found.items(), key=lambda item: item[1]):
+            stages[name] = offset - previous
+            previous = offset
+        return stages
+
+    def missed(self):
+        return [name for name, _, _ in self.markers if name not in self.found]
+
+
+def compile_markers(extra=()):
+    """BOOT_MARKERS plus "name=regex" markers from the command line, compiled"""
+    markers = [(name, description, re.compile(pattern)) for name, description, pattern in BOOT_MARKERS]
+    for spec in extra:
+        name, _, pattern = spec.partition("=")
+        if not name or not pattern:
+            raise ValueError(f"expected NAME=REGEX, got {spec!r}")
+        markers = [marker for marker in markers if marker[0] != name]
+        markers.append((name, name, re.compile(pattern)))
+    return markers
+
+
+def replay(path, markers):
+    """BootRuns from a console log recorded by dn_key_pro_monitor.py"""
+    runs = []
+    run = None
+    with open(path, encoding="utf-8", errors="replace") as log:
+        for text in log:
+            found = LOG_LINE.match(text.rstrip("\n"))
+            if not found:
+                continue
+            timestamp, line = float(found.group(1)), found.group(2)
+            # "soft reboot" right after a logged reset belongs to that run
+            if RUN_START.search(line) and (run is None or run.found):
+                run = BootRun(markers, timestamp)
+                runs.append(run)
+            elif run is not None:
+                run.feed(timestamp, line)
+    return runs
+
+
+def reset_board(console, mode):
+    """Stop code.py and reset the board, return the host time of the reset"""
+    console.write(b"\x03\x03")
+    time.sleep(STOP_DELAY)
+    if mode == "soft":
+        # Ctrl-D reloads, from "Press any key to enter the REPL" or the REPL itself
+        reset_time = time.monotonic()
+        console.write(b"\x04")
+    else:
+        # Any key enters the REPL, then a hard reset
+        console.write(b"\r")
+        time.sleep(STOP_DELAY)
+        reset_time = time.monotonic()
+        console.write(b"import microcontroller; microcontroller.reset()\r")
+    return reset_time
+
+
+def measure(port, runs, markers, mode="soft", save=None, verbose=False, log=print):
+    """Reset the board runs times and return its BootRuns"""
+    current = []
+
+    def on_line(console, timestamp, line):
+        if current:
+            name = current[0].feed(timestamp + mux.started, line)
+            if name and verbose:
+                log(f"  {current[0].found[name]:7.3f}s {name}")
+
+    mux = ConsoleMux(ports=[port], log_dir=save, on_line=on_line, echo=False)
+    if save is not None:
+        Path(save).mkdir(parents=True, exist_ok=True)
+    results = []
+    try:
+        for number in range(runs):
+            console = wait_for_console(mux, BOOT_TIMEOUT)
+            if console is None:
+                log(f"run {number + 1}: {port} didn't come back")
+                break
+            try:
+                run = BootRun(markers, reset_board(console, mode))
+            except MonitorError as e:
+                log(f"run {number + 1}: reset failed ({e})")
+                continue
+            # Marks the start of the run in the --save log, for --replay
+            mux.notice(console, f"reset ({mode})", run.reset_time)
+            current[:] = [run]
+            deadline = run.reset_time + BOOT_TIMEOUT
+            while not run.complete and time.monotonic() < deadline:
+                if not any(other.connected for other in mux.consoles.values()):
+                    mux.scan()
+                mux.poll(0.05)
+            mux.flush_logs()
+            current[:] = []
+            results.append(run)
+            status = f"{run.total:.3f}s" if run.complete else "no ready marker"
+            missed = run.missed()
+            log(f"run {number + 1}: {status}" + (f", missed {', '.join(missed)}" if missed else ""))
+            # Let the menu settle before the next reset
+            time.sleep(1.0)
+    finally:
+        mux.close()
+    return results
+
+
+def wait_for_console(mux, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        mux.scan()
+        for console in mux.consoles.values():
+            if console.connected:
+                return console
+        mux.poll(0.1)
+    return None
+
+
+def summarize(runs, markers):
+    """Per-stage and total statistics over the runs: {name: {count, mean, max, pNN}}"""
+    def stats(values):
+        entry = {"count": len(values), "mean": sum(values) / len(values), "max": max(values)}
+        for pct in PERCENTILES:
+            entry[f"p{pct}"] = percentile(values, pct)
+        return entry
+
+    summary = {"runs": len(runs), "complete": sum(1 for run in runs if run.complete), "stages": {}}
+    for name, description, _ in markers:
+        values = [run.stages()[name] for run in runs if name in run.found]
+        if values:
+            summary["stages"][name] = dict(stats(values), description=description)
+    totals = [run.total for run in runs if run.complete]
+    if totals:
+        summary["total"] = stats(totals)
+    return summary
+
+
+def print_summary(summary):
+    columns = "".join(f"{'p' + str(pct):>9}" for pct in PERCENTILES)
+    print()
+    print(f"{'Stage':<15} {'Covers':<28} {'Runs':>5}{columns}{'Max':>9}")
+    rows = list(summary["stages"].items())
+    if "total" in summary:
+        rows.append(("TOTAL", dict(summary["total"], description="reset to main menu")))
+    for name, entry in rows:
+        values = "".join(f"{entry[f'p{pct}']:>8.3f}s" for pct in PERCENTILES)
+        print(f"{name:<15} {entry['description']:<28} {entry['count']:>5}{values}{entry['max']:>8.3f}s")
+    print(f"\n{summary['complete']} of {summary['runs']} run(s) reached the main menu")
+
+
+def regressions(summary, baseline, tolerance, slack):
+    """Median times slower than the baseline by more than tolerance (a fraction) plus slack seconds"""
+    found = []
+    pairs = [("TOTAL", summary.get("total"), baseline.get("total"))]
+    pairs += [(name, entry, baseline.get("stages", {}).get(name)) for name, entry in summary["stages"].items()]
+    for name, entry, base in pairs:
+        if entry is None or base is None:
+            continue
+        if entry["p50"] > base["p50"] * (1 + tolerance) + slack:
+            found.append(f"{name}: median {entry['p50']:.3f}s, baseline {base['p50']:.3f}s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure DN-KEY Pro boot time from its console output")
+    parser.add_argument("--port", help="console port of the board (default: the only CircuitPython board found)")
+    parser.add_argument("--runs", type=int, default=10, help="boots to measure (default: 10)")
+    parser.add_argument("--reset", choices=["soft", "hard"], default="soft",
+                        help="reload code.py (soft, default) or reset the chip (hard)")
+    parser.add_argument("--replay", metavar="LOG", help="analyse a console log recorded by dn_key_pro_monitor.py")
+    parser.add_argument("--save", metavar="DIR", help="also record the console log to this directory")
+    parser.add_argument("--marker", action="append", default=[], metavar="NAME=REGEX",
+                        help="add (or replace) a console marker, e.g. wifi='^WiFi connected' (repeatable)")
+    parser.add_argument("--json", metavar="FILE", help="write the summary as JSON")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="fail when the median total or a stage is slower than in this --json summary")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="allowed slowdown against --baseline in percent (default: 10)")
+    parser.add_argument("--slack", type=float, default=0.05,
+                        help="allowed slowdown against --baseline in seconds, on top of --tolerance (default: 0.05)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every marker as it is seen")
+    args = parser.parse_args()
+
+    try:
+        markers = compile_markers(args.marker)
+    except (ValueError, re.error) as e:
+        parser.error(str(e))
+    if args.replay:
+        try:
+            runs = replay(args.replay, markers)
+        except OSError as e:
+            parser.error(str(e))
+    else:
+        port = args.port
+        if port is None:
+            ports = find_repl_ports()
+            if len(ports) != 1:
+                parser.error("no CircuitPython console found, pass --port" if not ports else
+                             f"several boards found ({', '.join(ports)}), pass --port")
+            port = ports[0]
+        print(f"Measuring {args.runs} {args.reset} boot(s) of {port}")
+        runs = measure(port, args.runs, markers, args.reset, args.save, args.verbose)
+    if not runs:
+        print("No boots found")
+        sys.exit(1)
+
+    summary = summarize(runs, markers)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = regressions(summary, baseline, args.tolerance / 100.0, args.slack)
+        for line in slower:
+            print(f"REGRESSION {line}")
+        if slower:
+            sys.exit(1)
+    sys.exit(0 if summary["complete"] else 1)
+
+
+if __name__ == "__main__":
+    main()
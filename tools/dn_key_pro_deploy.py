@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro application deploy
+=============================
+
+Syncs a whole CircuitPython app directory (code.py, dn_key_pro/, lib/,
+images/, ...) to a board's DN-S3-PY volume, e.g.:
+
+    python3 dn_key_pro_deploy.py ../examples/circuitpython/dc33_demo
+
+A manifest on the volume (MANIFEST_NAME) records the SHA-256 and size of every
+file the last deploy wrote. A deploy then:
+
+- copies only files whose hash differs from the manifest (or that are missing
+  or were resized on the device);
+- deletes files the manifest lists but the app no longer has; files the
+  manifest doesn't know about (the user's own) are never touched;
+- flushes the volume once at the end instead of after every file.
+
+Without a manifest (first deploy, or an interrupted one) files already on the
+volume are hashed and only rewritten when they differ. Also used by the code
+stage of dn_key_pro_recovery.py (--app).
+
+With --mpy, modules (everything but code.py, boot.py, ...) are cross-compiled
+with mpy-cross and pushed as .mpy instead of .py, so the board doesn't compile
+them at every boot. A .py of the same name already on the volume is deleted,
+manifest or not, since CircuitPython would still import it first. Compiled
+files are cached by source hash and mpy-cross version. mpy-cross must be built
+for the CircuitPython major version in the target firmware
+(firmware/circuitpython/UF2); when it is missing or doesn't match, the sources
+are deployed and a warning explains why.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dn_key_pro_artifacts import CACHE_DIR, sha256_file
+from dn_key_pro_firmware import FirmwareError, firmware_version
+from dn_key_pro_usb import IS_LINUX, find_volume_mounts
+
+# Manifest written to the root of the volume by every deploy
+MANIFEST_NAME = ".dn_key_pro_deploy.json"
+MANIFEST_VERSION = 1
+
+# CircuitPython drive label used by the DN-KEY Pro firmware
+VOLUME_LABEL = "DN-S3-PY"
+
+# Source files and directories that are never deployed
+DEFAULT_EXCLUDES = (".DS_Store", "._*", "__pycache__", "*.pyc", ".git", ".gitignore", "README.md", MANIFEST_NAME)
+
+HASH_CHUNK = 64 * 1024
+
+# mpy-cross command line; compiled modules are cached in CACHE_DIR/mpy
+MPY_CROSS = "mpy-cross"
+
+# Files CircuitPython only runs as source, never compiled
+SOURCE_ONLY = ("code.py", "main.py", "boot.py", "safemode.py")
+
+# CircuitPython firmware builds shipped with the repository, newest last
+FIRMWARE_DIR = Path(__file__).resolve().parent.parent / "firmware" / "circuitpython" / "UF2"
+
+# "CircuitPython 10.0.0-alpha.6" in an mpy-cross --version or firmware banner
+CIRCUITPYTHON_VERSION = re.compile(r"CircuitPython (\d+)\.(\S+)")
+
+
+class DeployError(Exception):
+    """The app directory or the volume can't be used"""
+
+
+def excluded(name, excludes):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in excludes)
+
+
+def scan_app(app_dir, excludes=DEFAULT_EXCLUDES):
+    """Map relative POSIX path -> {"sha256", "size", "source"} for every file to deploy"""
+    app_dir = Path(app_dir)
+    if not (app_dir / "code.py").is_file():
+        raise DeployError(f"{app_dir} has no code.py")
+    files = {}
+    for root, dirs, names in os.walk(app_dir):
+        dirs[:] = sorted(d for d in dirs if not excluded(d, excludes))
+        for name in sorted(names):
+            if excluded(name, excludes):
+                continue
+            path = Path(root) / name
+            relative = path.relative_to(app_dir).as_posix()
+            files[relative] = {"sha256": sha256_file(path), "size": path.stat().st_size, "source": str(path)}
+    return files
+
+
+def read_manifest(volume):
+    """Files recorded by the last deploy to the volume, {} when there is none"""
+    try:
+        with open(Path(volume) / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest.get("files", {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def flush_volume(volume):
+    """Flush written data to the device once, at the end of a deploy"""
+    if hasattr(os, "sync"):
+        os.sync()
+    else:
+        # Windows: no global sync, flush the manifest written last
+        with open(Path(volume) / MANIFEST_NAME, "rb+") as f:
+            os.fsync(f.fileno())
+
+
+class MpyCrossUnavailable(DeployError):
+    """mpy-cross is missing or doesn't match the target firmware; deploy sources instead"""
+
+
+def target_circuitpython(firmware=None):
+    """CircuitPython version ("10.0.0-alpha.6") of a firmware image, default the newest in FIRMWARE_DIR"""
+    if firmware is None:
+        images = sorted(path for path in FIRMWARE_DIR.glob("*/*.uf2") if path.parent.name != "archive")
+        if not images:
+            return None
+        firmware = images[-1]
+    try:
+        banner = firmware_version(Path(firmware).read_bytes())
+    except (OSError, FirmwareError):
+        return None
+    found = CIRCUITPYTHON_VERSION.search(banner or "")
+    return f"{found.group(1)}.{found.group(2)}" if found else None
+
+
+class MpyCompiler:
+    """Cross-compiles modules with mpy-cross, cached by source hash and compiler version"""
+
+    def __init__(self, command=MPY_CROSS, cache_dir=CACHE_DIR / "mpy", target_version=None):
+        self.command = command
+        self.cache_dir = Path(cache_dir)
+        self.target_version = target_version
+        self.version = None
+        self.compiled = 0
+        self.cached = 0
+
+    def check(self):
+        """Find mpy-cross and make sure it builds for the target version
+
+        Raises MpyCrossUnavailable with the reason when it can't be used.
+        """
+        try:
+            output = subprocess.run([self.command, "--version"], capture_output=True, text=True, timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            raise MpyCrossUnavailable(f"{self.command} not found (build it from the CircuitPython "
+                                      f"{self.target_version or ''} source tree, or pass --mpy-cross PATH)")
+        self.version = (output.stdout or output.stderr).strip().split("\n")[0]
+        found = CIRCUITPYTHON_VERSION.search(self.version)
+        if not found:
+            raise MpyCrossUnavailable(f"{self.command} isn't CircuitPython's mpy-cross ({self.version})")
+        if self.target_version and found.group(1) != self.target_version.split(".")[0]:
+            raise MpyCrossUnavailable(f"{self.command} is for CircuitPython {found.group(1)}.x, "
+                                      f"the firmware runs {self.target_version}")
+        return self.version
+
+    def compile(self, source, name, sha256):
+        """Path of the .mpy for a source file, compiled on a cache miss"""
+        key = hashlib.sha256(f"{sha256}\0{name}\0{self.version}".encode()).hexdigest()
+        target = self.cache_dir / key[:2] / f"{key}.mpy"
+        if target.exists():
+            self.cached += 1
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{key}.{os.getpid()}.tmp")
+        # -s: file name shown in tracebacks on the device
+        result = subprocess.run([self.command, "-o", str(tmp), "-s", name, str(source)],
+                                capture_output=True, text=True, timeout=60)
+        if result.returncode != 0:
+            if tmp.exists():
+                tmp.unlink()
+            raise DeployError(f"mpy-cross failed for {name}: {(result.stderr or result.stdout).strip()}")
+        tmp.replace(target)
+        self.compiled += 1
+        return target
+
+
+def compile_app(files, compiler, log=None):
+    """Replace the app's modules with compiled .mpy files, return the new file map
+
+    A .mpy shipped next to a .py (as in lib/) is replaced by the one built from
+    the .py, so the module always matches its source and the firmware.
+    """
+    log = log or (lambda message: None)
+    compiled = {}
+    for relative, entry in files.items():
+        if not relative.endswith(".py") or relative in SOURCE_ONLY:
+            continue
+        mpy = compiler.compile(entry["source"], relative, entry["sha256"])
+        compiled[relative[:-3] + ".mpy"] = {
+            "sha256": sha256_file(mpy),
+            "size": mpy.stat().st_size,
+            "source": str(mpy),
+        }
+        log(f"  {relative} -> {relative[:-3]}.mpy")
+    result = {relative: entry for relative, entry in files.items()
+              if relative not in compiled and not (relative.endswith(".py") and relative[:-3] + ".mpy" in compiled)}
+    result.update(compiled)
+    return dict(sorted(result.items()))
+
+
+def shadowing_sources(files):
+    """.py files that would shadow a deployed .mpy (CircuitPython imports .py first)"""
+    return [relative[:-4] + ".py" for relative in files
+            if relative.endswith(".mpy") and relative[:-4] + ".py" not in files]
+
+
+class SyncResult:
+    """What a deploy changed on one volume"""
+
+    def __init__(self, volume):
+        self.volume = str(volume)
+        self.copied = []
+        self.deleted = []
+        self.unchanged = []
+        self.bytes_copied = 0
+        self.duration = 0.0
+
+    @property
+    def changed(self):
+        return bool(self.copied or self.deleted)
+
+    def summary(self):
+        return (f"{len(self.copied)} copied ({self.bytes_copied / 1024:.1f} KiB), "
+                f"{len(self.deleted)} deleted, {len(self.unchanged)} unchanged")
+
+
+def compare_files(files, manifest, size_of, same_content):
+    """Split the app's files into (to copy, unchanged) and list stale ones to delete
+
+    size_of(relative) is the size of the deployed file (None when missing);
+    same_content(relative, entry) hashes it, for files the manifest doesn't
+    list. Stale files include a .py left next to a deployed .mpy of the same
+    name, manifest or not, since the board would keep importing the source.
+    """
+    copy, unchanged = [], []
+    for relative, entry in files.items():
+        size = size_of(relative)
+        if size is None or size != entry["size"]:
+            copy.append(relative)
+        elif relative in manifest:
+            # Trust the manifest for files of the right size
+            (unchanged if manifest[relative]["sha256"] == entry["sha256"] else copy).append(relative)
+        elif same_content(relative, entry):
+            unchanged.append(relative)
+        else:
+            copy.append(relative)
+    stale = {relative for relative in manifest if relative not in files}
+    stale.update(relative for relative in shadowing_sources(files) if size_of(relative) is not None)
+    return copy, unchanged, sorted(stale)
+
+
+def plan_sync(files, volume):
+    """compare_files() against a mounted volume"""
+    volume = Path(volume)
+
+    def size_of(relative):
+        try:
+            return (volume / relative).stat().st_size
+        except OSError:
+            return None
+
+    return compare_files(files, read_manifest(volume), size_of,
+                         lambda relative, entry: sha256_file(volume / relative) == entry["sha256"])
+
+
+def manifest_record(app_dir, files):
+    """Manifest contents describing the deployed files"""
+    return {
+        "version": MANIFEST_VERSION,
+        "app": Path(app_dir).resolve().name,
+        "deployed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": {relative: {"sha256": entry["sha256"], "size": entry["size"]}
+                  for relative, entry in files.items()},
+    }
+
+
+def sync_app(app_dir, volume, files=None, dry_run=False, log=None):
+    """Bring the volume in line with the app directory, return a SyncResult
+
+    files is the result of scan_app() (or compile_app()), so several volumes
+    can share one scan.
+    """
+    started = time.monotonic()
+    app_dir = Path(app_dir)
+    volume = Path(volume)
+    if not volume.is_dir():
+        raise DeployError(f"volume not found: {volume}")
+    if files is None:
+        files = scan_app(app_dir)
+    log = log or (lambda message: None)
+
+    result = SyncResult(volume)
+    copy, result.unchanged, stale = plan_sync(files, volume)
+    if dry_run:
+        result.copied, result.deleted = copy, stale
+        result.bytes_copied = sum(files[relative]["size"] for relative in copy)
+        return result
+
+    if copy or stale:
+        # An interrupted deploy leaves no manifest, so the next one compares
+        # hashes instead of trusting entries for half-written files
+        try:
+            (volume / MANIFEST_NAME).unlink()
+        except FileNotFoundError:
+            pass
+
+    for relative in copy:
+        target = volume / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(files[relative]["source"], "rb") as source, open(target, "wb") as destination:
+            for chunk in iter(lambda: source.read(HASH_CHUNK), b""):
+                destination.write(chunk)
+        result.copied.append(relative)
+        result.bytes_copied += files[relative]["size"]
+        log(f"  + {relative}")
+
+    for relative in stale:
+        target = volume / relative
+        try:
+            target.unlink()
+        except FileNotFoundError:
+            pass
+        result.deleted.append(relative)
+        log(f"  - {relative}")
+        # Remove directories the deleted files leave empty
+        parent = target.parent
+        while parent != volume:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+
+    if result.changed or not (volume / MANIFEST_NAME).exists():
+        with open(volume / MANIFEST_NAME, "w") as f:
+            json.dump(manifest_record(app_dir, files), f, sort_keys=True, separators=(",", ":"))
+        flush_volume(volume)
+
+    result.duration = time.monotonic() - started
+    return result
+
+
+def find_volumes(label=VOLUME_LABEL):
+    """Mount points of every volume with the label (Linux mount table, /Volumes on macOS)"""
+    if IS_LINUX:
+        return [mount for mount, _ in find_volume_mounts(label)]
+    if sys.platform == "darwin":
+        # Several boards mount as DN-S3-PY, "DN-S3-PY 1", ...
+        return [str(path) for path in sorted(Path("/Volumes").glob(f"{label}*"))
+                if path.name == label or path.name[len(label):].strip().isdigit()]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync a CircuitPython app directory to DN-KEY Pro volumes")
+    parser.add_argument("app", help="app directory, e.g. examples/circuitpython/dc33_demo")
+    parser.add_argument("volumes", nargs="*",
+                        help=f"mounted volumes to sync (default: every mounted {VOLUME_LABEL} volume)")
+    parser.add_argument("--label", default=VOLUME_LABEL, help=f"volume label to look for (default: {VOLUME_LABEL})")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would change")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list every copied and deleted file")
+    parser.add_argument("--mpy", action="store_true", help="push modules compiled to .mpy instead of .py sources")
+    parser.add_argument("--mpy-cross", default=MPY_CROSS, help=f"mpy-cross command (default: {MPY_CROSS})")
+    parser.add_argument("--firmware", metavar="UF2",
+                        help="CircuitPython firmware the .mpy files are built for "
+                             "(default: the newest build in firmware/circuitpython/UF2)")
+    args = parser.parse_args()
+
+    volumes = args.volumes or find_volumes(args.label)
+    if not volumes:
+        parser.error(f"no {args.label} volume found, pass its mount point")
+    try:
+        files = scan_app(args.app)
+    except (OSError, DeployError) as e:
+        parser.error(str(e))
+    if args.mpy:
+        compiler = MpyCompiler(args.mpy_cross, target_version=target_circuitpython(args.firmware))
+        try:
+            print(f"Compiling modules with {compiler.check()}")
+            files = compile_app(files, compiler, log=print if args.verbose else None)
+            print(f"{compiler.compiled} module(s) compiled, {compiler.cached} from the cache")
+        except MpyCrossUnavailable as e:
+            print(f"WARNING: {e}; deploying .py sources instead")
+        except (OSError, DeployError) as e:
+            parser.error(str(e))
+    total = sum(entry["size"] for entry in files.values())
+    print(f"{args.app}: {len(files)} file(s), {total / 1024:.1f} KiB")
+
+    def deploy(volume):
+        try:
+            return sync_app(args.app, volume, files, args.dry_run,
+                            log=print if args.verbose and len(volumes) == 1 else None)
+        except (OSError, DeployError) as e:
+            return e
+
+    # Every board is its own USB device, so volumes are synced concurrently
+    with ThreadPoolExecutor(max_workers=max(1, len(volumes))) as pool:
+        outcomes = list(pool.map(deploy, volumes))
+
+    failed = 0
+    for volume, outcome in zip(volumes, outcomes):
+        if isinstance(outcome, Exception):
+            failed += 1
+            print(f"{volume}: FAILED ({outcome})")
+        else:
+            prefix = "dry run, " if args.dry_run else ""
+            print(f"{volume}: {prefix}{outcome.summary()}" + ("" if args.dry_run else f" in {outcome.duration:.1f}s"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro esptool drivers
+==========================
+
+Thin driver layer used by dn_key_pro_recovery.py to talk to the ESP32-S3 ROM
+bootloader. Two drivers share the same interface:
+
+- LibraryEsptool: imports esptool and keeps one serial connection (with the
+  flasher stub loaded) open for the whole erase + write + verify sequence.
+- SubprocessEsptool: runs one esptool process per command, exactly like the
+  recovery tool always did. Used when esptool can't be imported, isn't a
+  4.x release, or the in-process connection fails.
+
+Both raise EsptoolError when a command fails. When erase, write or verify
+fail with a serial link error, both drivers step down to the next slower
+rate in BAUD_CANDIDATES and retry. LibraryEsptool can also probe the fastest
+baud rate a port sustains (probe_baud).
+
+write_flash(reset=False) leaves the chip in the bootloader so the written
+regions can still be checked with verify_regions(); close() resets it.
+"""
+
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import esptool
+    ESPTOOL_LIBRARY_AVAILABLE = True
+except ImportError:
+    esptool = None
+    ESPTOOL_LIBRARY_AVAILABLE = False
+
+CHIP = "esp32s3"
+
+# esptool major version LibraryEsptool is written for: it hands v4 command
+# lines (--after no_reset_stub, write_flash) to esptool.main(), which other
+# major versions spell differently
+ESPTOOL_LIBRARY_MAJOR = 4
+
+# Baud rates tried by probe_baud() and the write-error fallback, fastest first
+BAUD_CANDIDATES = (2000000, 1500000, 921600, 460800, 230400, 115200)
+
+# Flash read back (and MD5-checked on the chip) at each rate by probe_baud()
+BAUD_PROBE_SIZE = 16 * 1024
+
+# esptool and pyserial messages for failures of the serial link rather than
+# the command itself (timeouts, lost or corrupted packets, MD5 mismatches
+# after a write), the only errors a slower baud rate can fix
+LINK_ERROR = re.compile(
+    "|".join([
+        r"timed out waiting for packet",
+        r"esptool timed out after",
+        r"invalid head of packet",
+        r"serial data stream stopped",
+        r"packet content transfer stopped",
+        r"no serial data received",
+        r"device reports readiness to read but returned no data",
+        r"write timeout",
+        r"corrupt data, expected",
+        r"checksum error",
+        r"md5 of file does not match",
+    ]),
+    re.IGNORECASE,
+)
+
+# "MAC: aa:bb:cc:dd:ee:ff", printed by esptool after connecting
+MAC_LINE = re.compile(r"MAC:\s*([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})")
+
+# esptool command lines to try, in order, when running it as a subprocess
+ESPTOOL_COMMANDS = [
+    ['esptool.py'],
+    [sys.executable, '-m', 'esptool'],
+    ['python', '-m', 'esptool'],
+    ['python3', '-m', 'esptool'],
+]
+
+_esptool_cmd = None
+_esptool_cmd_lock = threading.Lock()
+
+
+class EsptoolError(Exception):
+    """An esptool command failed"""
+
+
+def find_esptool_command():
+    """Find a working esptool command line, cached after the first lookup"""
+    global _esptool_cmd
+    with _esptool_cmd_lock:
+        if _esptool_cmd is None:
+            for cmd in ESPTOOL_COMMANDS:
+                try:
+                    result = subprocess.run(cmd + ['version'], capture_output=True, text=True, timeout=5)
+                    if result.returncode == 0:
+                        _esptool_cmd = cmd
+                        break
+                except Exception:
+                    continue
+        return _esptool_cmd
+
+
+def library_unavailable():
+    """Why LibraryEsptool can't be used with the installed esptool, or None"""
+    if not ESPTOOL_LIBRARY_AVAILABLE:
+        return "esptool Python package is not installed"
+    version = getattr(esptool, "__version__", "unknown")
+    if version.split(".")[0] != str(ESPTOOL_LIBRARY_MAJOR):
+        return f"esptool {version} is installed, the in-process driver needs {ESPTOOL_LIBRARY_MAJOR}.x"
+    return None
+
+
+def parse_verify_output(output):
+    """Map flash offset -> True/False (digest matched) from verify_flash output"""
+    matches = {}
+    address = None
+    for line in output.split('\n'):
+        if 'Verifying' in line:
+            found = re.search(r'(?:@|at) (0x[0-9a-fA-F]+)', line)
+            address = int(found.group(1), 16) if found else None
+        elif address is not None and 'digest matched' in line:
+            matches[address] = True
+            address = None
+        elif address is not None and 'digest mismatch' in line:
+            matches[address] = False
+            address = None
+    return matches
+
+
+def changed_images(images, matches):
+    """Return the (offset, filename) pairs whose region did not verify"""
+    return [(offset, filename) for offset, filename in images if not matches.get(int(offset, 16), False)]
+
+
+def image_bytes(images, cwd=None):
+    """Total size of the (offset, filename) images, used for throughput metrics"""
+    return sum(os.path.getsize(os.path.join(cwd, filename) if cwd else filename) for _, filename in images)
+
+
+def is_link_error(error):
+    """True for errors a slower baud rate may fix (timeouts, corrupted packets)"""
+    return bool(LINK_ERROR.search(str(error)))
+
+
+def slower_bauds(baud):
+    return [candidate for candidate in BAUD_CANDIDATES if candidate < int(baud)]
+
+
+def format_mac(mac):
+    """Format a MAC tuple/bytes from esptool as aa:bb:cc:dd:ee:ff"""
+    return ":".join(f"{b:02x}" for b in mac)
+
+
+class _ThreadOutput:
+    """sys.stdout proxy that captures writes from threads running esptool
+
+    esptool prints progress to sys.stdout. When several devices are flashed
+    from worker threads, each thread's output is collected separately instead
+    of being interleaved on the console.
+    """
+
+    _install_lock = threading.Lock()
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    @classmethod
+    def install(cls):
+        with cls._install_lock:
+            if not isinstance(sys.stdout, cls):
+                sys.stdout = cls(sys.stdout)
+            return sys.stdout
+
+    def capture(self, buffer):
+        self._local.buffer = buffer
+
+    def release(self):
+        self._local.buffer = None
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            buffer.append(text)
+            return len(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _BaudFallback:
+    """Retry a command at slower baud rates when the serial link fails"""
+
+    def with_fallback(self, command):
+        """Run command(), stepping down through BAUD_CANDIDATES on link errors
+
+        Every step is recorded in baud_fallbacks as (from, to, reason).
+        """
+        while True:
+            try:
+                return command()
+            except EsptoolError as e:
+                slower = slower_bauds(self.baud)
+                if not slower or not is_link_error(e):
+                    raise
+                self.baud_fallbacks.append((self.baud, slower[0], str(e).strip().split('\n')[0]))
+                self.set_baud(slower[0], reconnect=True)
+
+
+class SubprocessEsptool(_BaudFallback):
+    """Driver that starts one esptool process per command"""
+
+    name = "subprocess"
+
+    def __init__(self, port, baud, esptool_cmd=None):
+        self.port = port
+        self.baud = int(baud)
+        self.baud_fallbacks = []
+        self.esptool_cmd = esptool_cmd or find_esptool_command()
+        self.mac = None
+        self.last_command = None
+        self.bytes_written = 0
+        self.reset_pending = False
+        if not self.esptool_cmd:
+            raise EsptoolError("esptool not found!")
+
+    def connect(self):
+        """Nothing to do, every command opens the port on its own"""
+        return self
+
+    def set_baud(self, baud, reconnect=False):
+        """Use another baud rate from the next command on"""
+        self.baud = int(baud)
+
+    def run(self, args, timeout, cwd=None):
+        """Run one esptool command and return its stdout"""
+        cmd = self.esptool_cmd + ['--chip', CHIP, '-p', self.port] + args
+        self.last_command = ' '.join(cmd)
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, cwd=cwd)
+        except subprocess.TimeoutExpired:
+            raise EsptoolError(f"esptool timed out after {timeout}s")
+        if result.returncode != 0:
+            raise EsptoolError(result.stderr.strip() or result.stdout.strip())
+        self.learn_mac(result.stdout)
+        return result.stdout
+
+    def learn_mac(self, output):
+        """Pick up the MAC esptool prints while connecting, no chip_id call needed"""
+        if self.mac is None:
+            found = MAC_LINE.search(output)
+            if found:
+                self.mac = found.group(1).lower()
+
+    def read_mac(self):
+        output = self.run(['chip_id'], timeout=10)
+        for line in output.split('\n'):
+            if 'MAC:' in line:
+                self.mac = line.split('MAC:')[1].strip()
+                return self.mac
+        raise EsptoolError("MAC address not found in esptool output")
+
+    def erase_flash(self):
+        output = self.with_fallback(lambda: self.run(['-b', str(self.baud), 'erase_flash'], timeout=60))
+        self.reset_pending = False
+        return output
+
+    def write_flash(self, images, flash_mode, flash_freq, flash_size, cwd=None, reset=True):
+        """Write (offset, filename) pairs; the device is reset afterwards unless reset=False"""
+        def write():
+            args = [
+                '-b', str(self.baud), '--before=default_reset',
+                '--after=hard_reset' if reset else '--after=no_reset',
+                'write_flash', '--flash_mode', flash_mode, '--flash_freq', flash_freq,
+                '--flash_size', flash_size,
+            ]
+            for offset, filename in images:
+                args += [offset, filename]
+            return self.run(args, timeout=120, cwd=cwd)
+
+        output = self.with_fallback(write)
+        self.bytes_written += image_bytes(images, cwd)
+        self.reset_pending = not reset
+        return output
+
+    def verify_regions(self, images, flash_mode, flash_freq, flash_size, cwd=None):
+        """Compare flash regions with local images using on-chip MD5
+
+        Returns {offset: matched}. Only digests travel over serial, no data is
+        read back. verify_flash exits non-zero when anything differs, so the
+        output is parsed either way.
+        """
+        def verify():
+            args = [
+                '-b', str(self.baud), '--after=no_reset',
+                'verify_flash', '--flash_mode', flash_mode, '--flash_freq', flash_freq,
+                '--flash_size', flash_size,
+            ]
+            for offset, filename in images:
+                args += [offset, filename]
+            cmd = self.esptool_cmd + ['--chip', CHIP, '-p', self.port] + args
+            self.last_command = ' '.join(cmd)
+            try:
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=60, cwd=cwd)
+            except subprocess.TimeoutExpired:
+                raise EsptoolError("esptool timed out after 60s")
+            self.learn_mac(result.stdout)
+            self.reset_pending = True
+            matches = parse_verify_output(result.stdout)
+            if result.returncode != 0 and not matches:
+                raise EsptoolError(result.stderr.strip() or result.stdout.strip())
+            return matches
+
+        return self.with_fallback(verify)
+
+    def close(self, reset=True):
+        """Hard-reset the device if write_flash left it in the bootloader"""
+        if reset and self.reset_pending:
+            self.run(['--after=hard_reset', 'run'], timeout=10)
+        self.reset_pending = False
+
+
+class LibraryEsptool(_BaudFallback):
+    """Driver that keeps one in-process esptool connection per device
+
+    The port is opened, synced with the ROM bootloader and the flasher stub is
+    uploaded once; every later command reuses that connection.
+    """
+
+    name = "library"
+
+    def __init__(self, port, baud):
+        problem = library_unavailable()
+        if problem:
+            raise EsptoolError(problem)
+        self.port = port
+        self.baud = int(baud)
+        self.baud_fallbacks = []
+        self.esp = None
+        self.mac = None
+        self.last_command = None
+        self.bytes_written = 0
+        self.output = []
+        self.last_output = ""
+        self._stdout = _ThreadOutput.install()
+
+    def _call(self, func, *args, **kwargs):
+        """Call into esptool, capturing its console output"""
+        self._stdout.capture(self.output)
+        try:
+            return func(*args, **kwargs)
+        except EsptoolError:
+            raise
+        except (Exception, SystemExit) as e:
+            raise EsptoolError(str(e) or type(e).__name__)
+        finally:
+            self._stdout.release()
+
+    def connect(self):
+        """Open the port, sync the ROM loader, upload the stub and raise the baud rate"""
+        def _connect():
+            esp = esptool.cmds.detect_chip(self.port)
+            try:
+                esp = esp.run_stub()
+                esp.change_baud(self.baud)
+            except Exception:
+                esp._port.close()
+                raise
+            return esp
+
+        self.last_command = f"connect {self.port} @ {self.baud}"
+        self.esp = self._call(_connect)
+        return self
+
+    def _release_port(self):
+        try:
+            self.esp._port.close()
+        except Exception:
+            pass
+        self.esp = None
+
+    def set_baud(self, baud, reconnect=False):
+        """Switch the open connection to another baud rate
+
+        With reconnect (after a link error) the port is reopened and the stub
+        uploaded again instead of asking the possibly confused stub to switch.
+        """
+        self.baud = int(baud)
+        if self.esp is None:
+            return
+        if reconnect:
+            self._release_port()
+            self.connect()
+        else:
+            self.last_command = f"change_baud {self.baud}"
+            self._call(self.esp.change_baud, self.baud)
+
+    def probe_baud(self, candidates=BAUD_CANDIDATES, size=BAUD_PROBE_SIZE):
+        """Find the fastest baud rate that reads flash back intact
+
+        At each rate, fastest first, the start of flash is read back and
+        compared with an MD5 computed on the chip. Returns (baud, bytes per
+        second of the read); the connection is left at that rate.
+        """
+        candidates = sorted(candidates, reverse=True)
+        for index, baud in enumerate(candidates):
+            try:
+                if self.esp is None:
+                    self.connect()
+                self.set_baud(baud)
+                self.last_command = f"probe {size} bytes @ {baud}"
+                started = time.monotonic()
+                data = self._call(self.esp.read_flash, 0, size)
+                elapsed = time.monotonic() - started
+                digest = self._call(self.esp.flash_md5sum, 0, size)
+                if hashlib.md5(data).hexdigest() == str(digest).lower():
+                    return baud, size / elapsed if elapsed > 0 else None
+            except EsptoolError:
+                pass
+            # A failed rate can leave the stub at a baud the host no longer
+            # uses; reconnect at the next slower one
+            if index + 1 < len(candidates):
+                self.baud = candidates[index + 1]
+                if self.esp is not None:
+                    self._release_port()
+        raise EsptoolError("no baud rate passed the probe")
+
+    def run(self, args):
+        """Run an esptool command line on the open connection"""
+        # The stub is already running: --no-stub stops esptool from uploading
+        # it again and no_reset_stub keeps it running for the next command
+        def run():
+            argv = ['--chip', CHIP, '-p', self.port, '--no-stub', '--after', 'no_reset_stub'] + args
+            self.last_command = 'esptool ' + ' '.join(argv)
+            start = len(self.output)
+            try:
+                self._call(esptool.main, argv, esp=self.esp)
+            finally:
+                self.last_output = "".join(self.output[start:])
+            return self.last_output
+
+        return self.with_fallback(run)
+
+    def read_mac(self):
+        self.mac = format_mac(self._call(self.esp.read_mac))
+        return self.mac
+
+    def erase_flash(self):
+        return self.run(['erase_flash'])
+
+    def write_flash(self, images, flash_mode, flash_freq, flash_size, cwd=None, reset=True):
+        """Write (offset, filename) pairs, compressed and MD5-verified by the stub
+
+        The stub keeps running either way; close() resets the device.
+        """
+        args = [
+            'write_flash', '-z', '--flash_mode', flash_mode, '--flash_freq', flash_freq,
+            '--flash_size', flash_size,
+        ]
+        for offset, filename in images:
+            if cwd:
+                filename = os.path.join(cwd, filename)
+            args += [offset, filename]
+        output = self.run(args)
+        self.bytes_written += image_bytes(images, cwd)
+        return output
+
+    def verify_regions(self, images, flash_mode, flash_freq, flash_size, cwd=None):
+        """Compare flash regions with local images using on-chip MD5, see SubprocessEsptool"""
+        args = [
+            'verify_flash', '--flash_mode', flash_mode, '--flash_freq', flash_freq,
+            '--flash_size', flash_size,
+        ]
+        for offset, filename in images:
+            if cwd:
+                filename = os.path.join(cwd, filename)
+            args += [offset, filename]
+        try:
+            self.run(args)
+        except EsptoolError:
+            if not parse_verify_output(self.last_output):
+                raise
+        return parse_verify_output(self.last_output)
+
+    def close(self, reset=True):
+        """Reset the device into its new firmware and release the port"""
+        if self.esp is None:
+            return
+        try:
+            if reset:
+                self._call(self.esp.hard_reset)
+        finally:
+            self._release_port()
+
+
+def open_esptool(port, baud, driver="auto"):
+    """Return a connected driver for the port
+
+    driver is "library", "subprocess" or "auto" (library when esptool 4.x can
+    be imported and connects, subprocess otherwise). Returns (session, warning)
+    where warning explains a fallback to the subprocess driver, if any.
+    """
+    warning = None
+    if driver in ("auto", "library"):
+        problem = library_unavailable()
+        if not problem:
+            session = LibraryEsptool(port, baud)
+            try:
+                return session.connect(), None
+            except EsptoolError as e:
+                if driver == "library":
+                    raise
+                reason = str(e).strip().split('\n')[0]
+                warning = f"in-process esptool connection failed ({reason}), using subprocess esptool"
+        elif driver == "library":
+            raise EsptoolError(problem)
+        elif ESPTOOL_LIBRARY_AVAILABLE:
+            warning = f"{problem}, using subprocess esptool"
+    return SubprocessEsptool(port, baud).connect(), warning
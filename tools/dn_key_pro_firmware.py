@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro firmware image helpers
+=================================
+
+Builds the single merged flash image used by dn_key_pro_recovery.py --merged:
+bootloader, partition table, OTA data, CircuitPython app and TinyUF2 laid out
+at their flash offsets, so a board is provisioned in one write_flash session
+instead of going through the DN_BOOT volume.
+
+The OTA data in the merged image selects the ota_0 slot, so the board boots
+straight into CircuitPython. TinyUF2 stays in its factory partition and is
+still reachable by double-tapping reset.
+
+Also reads the CircuitPython version banner ("Adafruit CircuitPython 10.0.0
+on 2025-07-30; DEEPNET KEY PRO v0r5 with ESP32S3") from a .bin or .uf2 image
+and from a board's boot_out.txt, so up-to-date boards can be recognised.
+"""
+
+import binascii
+import re
+import struct
+
+# ESP-IDF partition table entry: magic, type, subtype, offset, size, label, flags
+PARTITION_ENTRY = struct.Struct("<2sBBII16sI")
+PARTITION_MAGIC = b"\xaa\x50"
+
+PARTITION_TYPE_APP = 0x00
+PARTITION_TYPE_DATA = 0x01
+PARTITION_SUBTYPE_FACTORY = 0x00
+PARTITION_SUBTYPE_OTA_0 = 0x10
+PARTITION_SUBTYPE_OTADATA = 0x00
+
+BOOTLOADER_OFFSET = 0x0
+PARTITION_TABLE_OFFSET = 0x8000
+
+# esp_ota_select_entry_t: ota_seq, seq_label[20], ota_state, crc
+OTA_SELECT_ENTRY = struct.Struct("<I20sII")
+OTA_SECTOR_SIZE = 0x1000
+OTA_IMG_UNDEFINED = 0xFFFFFFFF
+
+# UF2 block: magic0, magic1, flags, target address, payload size, block
+# number, block count, family ID; 476 payload bytes; end magic
+UF2_BLOCK = struct.Struct("<IIIIIIII")
+UF2_BLOCK_SIZE = 512
+UF2_MAGIC = (0x0A324655, 0x9E5D5157)
+UF2_FLAG_NOT_MAIN_FLASH = 0x00000001
+
+# First line of boot_out.txt, also stored in the firmware image
+VERSION_BANNER = re.compile(rb"Adafruit CircuitPython \S+ on \d{4}-\d{2}-\d{2}; [ -~]+? with \w+")
+
+# "UID:F412FA435A10" in boot_out.txt; the ESP32-S3 port reports the chip MAC
+BOOT_OUT_UID = re.compile(r"^UID:([0-9A-Fa-f]+)\s*$", re.MULTILINE)
+
+
+class FirmwareError(Exception):
+    """A firmware image is missing, malformed or doesn't fit its partition"""
+
+
+class Partition:
+    """One entry of an ESP-IDF partition table"""
+
+    def __init__(self, label, ptype, subtype, offset, size):
+        self.label = label
+        self.type = ptype
+        self.subtype = subtype
+        self.offset = offset
+        self.size = size
+
+    def __repr__(self):
+        return f"Partition({self.label!r}, 0x{self.offset:x}, 0x{self.size:x})"
+
+
+def read_partition_table(data):
+    """Parse a partition-table.bin into a list of Partition objects"""
+    partitions = []
+    for start in range(0, len(data) - PARTITION_ENTRY.size + 1, PARTITION_ENTRY.size):
+        magic, ptype, subtype, offset, size, label, _ = PARTITION_ENTRY.unpack_from(data, start)
+        if magic != PARTITION_MAGIC:
+            break
+        partitions.append(Partition(label.rstrip(b"\0").decode("ascii", "replace"), ptype, subtype, offset, size))
+    if not partitions:
+        raise FirmwareError("partition table contains no entries")
+    return partitions
+
+
+def find_partition(partitions, ptype, subtype):
+    for partition in partitions:
+        if partition.type == ptype and partition.subtype == subtype:
+            return partition
+    raise FirmwareError(f"partition table has no partition of type {ptype:#x}/{subtype:#x}")
+
+
+def ota_select_data(slot, size):
+    """OTA data partition contents that boot the given ota_N slot"""
+    seq = slot + 1
+    crc = binascii.crc32(struct.pack("<I", seq), 0xFFFFFFFF) & 0xFFFFFFFF
+    entry = OTA_SELECT_ENTRY.pack(seq, b"\xff" * 20, OTA_IMG_UNDEFINED, crc)
+    data = bytearray(b"\xff" * size)
+    data[:len(entry)] = entry
+    return bytes(data)
+
+
+def circuitpython_boot(partition_table):
+    """(ota_0 partition, otadata partition, OTA data contents that boot ota_0)"""
+    partitions = read_partition_table(partition_table)
+    otadata = find_partition(partitions, PARTITION_TYPE_DATA, PARTITION_SUBTYPE_OTADATA)
+    ota_0 = find_partition(partitions, PARTITION_TYPE_APP, PARTITION_SUBTYPE_OTA_0)
+    return ota_0, otadata, ota_select_data(0, min(otadata.size, 2 * OTA_SECTOR_SIZE))
+
+
+def merge_regions(regions):
+    """Lay out (offset, bytes) regions in one image, gaps filled with 0xFF"""
+    regions = sorted(regions)
+    end = max(offset + len(data) for offset, data in regions)
+    image = bytearray(b"\xff" * end)
+    previous_end = 0
+    for offset, data in regions:
+        if offset < previous_end:
+            raise FirmwareError(f"image at 0x{offset:x} overlaps the previous region")
+        image[offset:offset + len(data)] = data
+        previous_end = offset + len(data)
+    return bytes(image)
+
+
+def uf2_payload(data):
+    """Flash contents carried by a UF2 file, blocks joined in address order"""
+    blocks = []
+    for start in range(0, len(data) - UF2_BLOCK_SIZE + 1, UF2_BLOCK_SIZE):
+        magic0, magic1, flags, address, size = UF2_BLOCK.unpack_from(data, start)[:5]
+        if (magic0, magic1) != UF2_MAGIC:
+            raise FirmwareError(f"bad UF2 block at byte {start}")
+        if not flags & UF2_FLAG_NOT_MAIN_FLASH:
+            blocks.append((address, data[start + UF2_BLOCK.size:start + UF2_BLOCK.size + size]))
+    return b"".join(payload for _, payload in sorted(blocks))
+
+
+def firmware_version(image):
+    """CircuitPython version banner stored in a .bin or .uf2 image, None if absent"""
+    if image[:8] == struct.pack("<II", *UF2_MAGIC):
+        image = uf2_payload(image)
+    found = VERSION_BANNER.search(image)
+    return found.group(0).decode("ascii") if found else None
+
+
+def boot_out_version(text):
+    """(version banner, UID) from the contents of a board's boot_out.txt"""
+    found = VERSION_BANNER.search(text.encode("ascii", "replace"))
+    uid = BOOT_OUT_UID.search(text)
+    return (found.group(0).decode("ascii") if found else None), (uid.group(1) if uid else None)
+
+
+def merged_regions(bootloader, partition_table, tinyuf2, app):
+    """(offset, name, bytes) of each component of the merged image, in flash order
+
+    The offsets come from the partition table; raises FirmwareError when an
+    image doesn't fit its partition.
+    """
+    partitions = read_partition_table(partition_table)
+    otadata = find_partition(partitions, PARTITION_TYPE_DATA, PARTITION_SUBTYPE_OTADATA)
+    ota_0 = find_partition(partitions, PARTITION_TYPE_APP, PARTITION_SUBTYPE_OTA_0)
+    factory = find_partition(partitions, PARTITION_TYPE_APP, PARTITION_SUBTYPE_FACTORY)
+
+    if len(app) > ota_0.size:
+        raise FirmwareError(f"CircuitPython image ({len(app)} bytes) doesn't fit in {ota_0.label} ({ota_0.size} bytes)")
+    if len(tinyuf2) > factory.size:
+        raise FirmwareError(f"TinyUF2 image ({len(tinyuf2)} bytes) doesn't fit in {factory.label} ({factory.size} bytes)")
+
+    return sorted([
+        (BOOTLOADER_OFFSET, "bootloader", bootloader),
+        (PARTITION_TABLE_OFFSET, "partition_table", partition_table),
+        (otadata.offset, "ota_data", ota_select_data(0, min(otadata.size, 2 * OTA_SECTOR_SIZE))),
+        (ota_0.offset, "circuitpython", app),
+        (factory.offset, "tinyuf2", tinyuf2),
+    ])
+
+
+def build_merged_image(bootloader, partition_table, tinyuf2, app):
+    """Return the merged image bytes for the given component images
+
+    The gaps between the components (nvs, ota_1) are filled with 0xFF, so
+    writing the image erases them.
+    """
+    regions = merged_regions(bootloader, partition_table, tinyuf2, app)
+    return merge_regions([(offset, data) for offset, _, data in regions])
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro recovery run log and metrics
+=======================================
+
+Structured logging used by dn_key_pro_recovery.py. Every log message, stage
+and device outcome is written as one JSON line to a single file that is
+opened once per run and flushed in batches (at most every FLUSH_INTERVAL
+seconds, straight away for errors and device outcomes, and when the run
+ends).
+
+Record types ("event" field):
+
+    log       a console message: level, message, device
+    stage     one stage of one device: device, stage, ok, duration, baud, bytes
+    device    a device outcome: device, mac, success, failed_stage, duration, bytes,
+              verified (flash region -> passed, with --verify), up_to_date
+    summary   per-run throughput, stage latency percentiles and verify results
+
+run_summary() builds the summary record from the DeviceResults of a run.
+"""
+
+import atexit
+import json
+import threading
+import time
+from pathlib import Path
+
+# Seconds between flushes of the buffered log file
+FLUSH_INTERVAL = 1.0
+
+# Stage latency percentiles reported in the run summary
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, pct):
+    """Linearly interpolated percentile of a list of numbers (pct 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def run_summary(results, wall_time):
+    """Summary record for a run: device counts, throughput and per-stage latency"""
+    stages = {}
+    for result in results:
+        for name, duration in result.stage_times.items():
+            entry = stages.setdefault(name, {"durations": [], "bytes": 0})
+            entry["durations"].append(duration)
+            entry["bytes"] += result.stage_bytes.get(name, 0)
+
+    stage_summary = {}
+    for name, entry in stages.items():
+        durations = entry["durations"]
+        busy = sum(durations)
+        summary = {
+            "count": len(durations),
+            "mean": busy / len(durations),
+            "max": max(durations),
+            "bytes": entry["bytes"],
+            "bytes_per_second": entry["bytes"] / busy if entry["bytes"] and busy > 0 else None,
+        }
+        for pct in PERCENTILES:
+            summary[f"p{pct}"] = percentile(durations, pct)
+        stage_summary[name] = summary
+
+    verification = {}
+    for result in results:
+        for region, passed in result.verified.items():
+            entry = verification.setdefault(region, {"passed": 0, "failed": 0})
+            entry["passed" if passed else "failed"] += 1
+
+    succeeded = sum(1 for result in results if result.success)
+    total_bytes = sum(sum(result.stage_bytes.values()) for result in results)
+    return {
+        "event": "summary",
+        "devices": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "wall_time": wall_time,
+        "devices_per_hour": succeeded * 3600.0 / wall_time if wall_time > 0 else None,
+        "bytes": total_bytes,
+        "bytes_per_second": total_bytes / wall_time if wall_time > 0 else None,
+        "stages": stage_summary,
+        "verification": verification,
+    }
+
+
+class RunLog:
+    """Buffered JSON-lines writer shared by all worker threads"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_flush = 0.0
+        self._started = time.monotonic()
+        atexit.register(self.close)
+
+    def write(self, record, flush=False):
+        """Append one record; timestamps are added here"""
+        record = dict(record)
+        record.setdefault("time", time.strftime("%Y-%m-%dT%H:%M:%S"))
+        record.setdefault("elapsed", round(time.monotonic() - self._started, 3))
+        line = json.dumps(record, sort_keys=True, default=str) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "a", buffering=64 * 1024)
+                self._file.write(line)
+                now = time.monotonic()
+                if flush or now - self._last_flush >= FLUSH_INTERVAL:
+                    self._file.flush()
+                    self._last_flush = now
+            except OSError:
+                # Logging must never abort a recovery
+                pass
+
+    def message(self, message, level, device=None):
+        self.write({"event": "log", "level": level, "message": message, "device": device},
+                   flush=level == "ERROR")
+
+    def stage(self, result, name, ok, duration, baud=None):
+        self.write({
+            "event": "stage",
+            "device": result.device_id,
+            "port": result.device_port,
+            "mac": result.mac,
+            "stage": name,
+            "ok": ok,
+            "duration": round(duration, 3),
+            "baud": int(baud) if baud else None,
+            "bytes": result.stage_bytes.get(name, 0),
+        })
+
+    def device(self, result):
+        # Flushed at once: a board's outcome must not wait in the buffer for
+        # the next write, which in daemon mode may be the next board
+        self.write({
+            "event": "device",
+            "device": result.device_id,
+            "port": result.device_port,
+            "mac": result.mac,
+            "success": result.success,
+            "failed_stage": result.failed_stage,
+            "warnings": result.warnings,
+            "duration": round(result.duration, 3),
+            "bytes": sum(result.stage_bytes.values()),
+            "verified": result.verified,
+            "up_to_date": result.up_to_date,
+        }, flush=True)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.flush()
+                except OSError:
+                    pass
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro serial console monitor
+=================================
+
+Follows the serial consoles of every connected DN-KEY Pro at once, from one
+process, e.g. a whole bench of boards being recovered or tested:
+
+    python3 dn_key_pro_monitor.py
+
+- All ports are read without blocking from a single event loop (select on
+  POSIX, pyserial with zero timeouts elsewhere), so dozens of boards don't
+  need dozens of threads or screen sessions.
+- Every line is stamped with the host's monotonic clock when its first byte
+  arrived, in seconds since the monitor started, so output of different
+  boards can be compared.
+- The last RING_LINES lines of each board are kept in memory; SIGUSR1 dumps
+  them to the log directory.
+- Each board gets its own log file, rotated at LOG_MAX_BYTES and gzip
+  compressed in the background; LOG_BACKUPS old files are kept per board.
+- Boards are followed across resets and re-enumerations. On Linux a console
+  is named after the physical USB port ("1-2.3") it hangs off, so a board
+  that comes back as another /dev/ttyACM* continues the same console and log.
+
+CircuitPython's status bar (OSC title escape sequences) is stripped from the
+output. For an interactive REPL session on one board use serial_monitor.sh.
+"""
+
+import argparse
+import gzip
+import os
+import re
+import selectors
+import shutil
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from pathlib import Path
+
+try:
+    import termios
+    import tty
+    TTY_ERRORS = (OSError, termios.error)
+except ImportError:
+    termios = None
+    TTY_ERRORS = (OSError,)
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+from dn_key_pro_usb import IS_LINUX, DeviceMonitor, list_ports, tty_usb_ids, tty_usb_port
+
+BAUD_RATE = 115200
+
+# Serial ports a board's console can show up as
+if sys.platform == "darwin":
+    CONSOLE_PORT_PATTERNS = ("/dev/cu.usbmodem*", "/dev/cu.usbserial*")
+else:
+    CONSOLE_PORT_PATTERNS = ("/dev/ttyACM*", "/dev/ttyUSB*")
+
+# Lines of recent output kept in memory per board
+RING_LINES = 20000
+
+# Per-board log files: rotated at LOG_MAX_BYTES, LOG_BACKUPS compressed
+# files kept per board
+LOG_DIR = "serial_logs"
+LOG_MAX_BYTES = 8 * 1024 * 1024
+LOG_BACKUPS = 20
+
+# Seconds between flushes of the log files
+FLUSH_INTERVAL = 1.0
+
+# Seconds between port scans; with device events (Linux) ports are also
+# scanned as soon as one appears
+RESCAN_INTERVAL = 1.0
+
+# A line without its newline (">>> " prompt, "Press any key...") is shown
+# once no more bytes arrived for this many seconds
+PARTIAL_LINE_TIMEOUT = 0.5
+
+# Poll interval of ports that can't be selected on (pyserial on Windows)
+POLL_INTERVAL = 0.01
+
+READ_SIZE = 64 * 1024
+
+# CircuitPython status bar: OSC "set title" sequences ended by BEL or ST
+STATUS_BAR = re.compile(rb"\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)")
+
+
+class MonitorError(Exception):
+    """A console port can't be opened or read"""
+
+
+def find_console_ports():
+    """Serial ports a DN-KEY Pro console may be on, sorted"""
+    ports = []
+    for pattern in CONSOLE_PORT_PATTERNS:
+        ports.extend(glob(pattern))
+    if not ports and termios is None and list_ports is not None:
+        ports = [info.device for info in list_ports.comports()]
+    return sorted(ports)
+
+
+def open_tty(port, baud=BAUD_RATE):
+    """Open a POSIX serial port in raw, non-blocking mode and return its fd"""
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        speed = getattr(termios, f"B{baud}", termios.B115200)
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except TTY_ERRORS:
+        os.close(fd)
+        raise
+    return fd
+
+
+def parse_usb_id(text):
+    """"239a:8112" -> (0x239a, 0x8112)"""
+    try:
+        vid, pid = text.split(":")
+        return int(vid, 16), int(pid, 16)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected VID:PID in hex, e.g. 239a:8112, got {text!r}")
+
+
+def compress_log(path, name, backups):
+    """gzip a rotated log file and drop the board's oldest compressed logs beyond backups"""
+    compressed = path.with_name(path.name + ".gz")
+    partial = compressed.with_name(compressed.name + ".tmp")
+    try:
+        with open(path, "rb") as source, gzip.open(partial, "wb") as target:
+            shutil.copyfileobj(source, target, READ_SIZE)
+        os.replace(partial, compressed)
+        path.unlink()
+    except OSError:
+        return
+    old = sorted(path.parent.glob(f"{glob_escape(name)}.*.log.gz"), key=lambda p: p.stat().st_mtime)
+    for stale in old[:len(old) - backups]:
+        try:
+            stale.unlink()
+        except OSError:
+            pass
+
+
+def glob_escape(text):
+    """Match text literally in a glob pattern"""
+    return re.sub(r"([*?\[])", r"[\1]", text)
+
+
+class ConsoleLog:
+    """Log file of one board, rotated at max_bytes and compressed in the background"""
+
+    def __init__(self, directory, name, header, max_bytes, backups, compressor):
+        self.path = Path(directory) / f"{name}.log"
+        self.name = name
+        self.header = header
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._compressor = compressor
+        self._file = None
+        self._size = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        try:
+            if self._file is None:
+                self._file = open(self.path, "ab", buffering=64 * 1024)
+                self._size = self._file.tell()
+                header = self.header.encode("utf-8")
+                self._file.write(header)
+                self._size += len(header)
+            self._file.write(data)
+            self._size += len(data)
+            if self.max_bytes and self._size >= self.max_bytes:
+                self.rotate()
+        except OSError:
+            # A full disk must not stop the consoles of other boards
+            self.close()
+
+    def rotate(self):
+        self.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = self.path.with_name(f"{self.name}.{stamp}.log")
+        count = 1
+        while rotated.exists() or rotated.with_name(rotated.name + ".gz").exists():
+            rotated = self.path.with_name(f"{self.name}.{stamp}-{count}.log")
+            count += 1
+        os.replace(self.path, rotated)
+        self._compressor.submit(compress_log, rotated, self.name, self.backups)
+
+    def flush(self):
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except OSError:
+                pass
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+class Console:
+    """Serial console of one board: open port, partial line, ring buffer and log"""
+
+    def __init__(self, name, ring_lines, log=None):
+        self.name = name
+        self.port = None
+        self.handle = None
+        self.fd = None
+        self.ring = deque(maxlen=ring_lines)
+        self.log = log
+        self.connections = 0
+        self.lines = 0
+        self.bytes = 0
+        self._partial = b""
+        self._partial_time = None
+        self._last_data = None
+
+    @property
+    def connected(self):
+        return self.handle is not None
+
+    def open(self, port, baud=BAUD_RATE):
+        """Open the port without blocking; raises MonitorError"""
+        try:
+            if termios is not None:
+                self.handle = self.fd = open_tty(port, baud)
+            elif serial is not None:
+                self.handle = serial.Serial(port, baud, timeout=0, write_timeout=0)
+                self.fd = None
+            else:
+                raise MonitorError("pyserial is required on this system (pip install pyserial)")
+        except TTY_ERRORS as e:
+            # serial.SerialException is an OSError too
+            raise MonitorError(f"{port}: {e}")
+        self.port = port
+        self.connections += 1
+
+    def read(self):
+        """Bytes waiting on the port (b"" when none); raises MonitorError once the port is gone"""
+        try:
+            if self.fd is not None:
+                try:
+                    data = os.read(self.fd, READ_SIZE)
+                except BlockingIOError:
+                    return b""
+                if not data:
+                    # A hung up tty reads as end of file
+                    raise MonitorError(f"{self.port}: hung up")
+                return data
+            return self.handle.read(self.handle.in_waiting or 0)
+        except OSError as e:
+            raise MonitorError(f"{self.port}: {e}")
+
+    def write(self, data):
+        """Send bytes to the board (keystrokes such as Ctrl-C); raises MonitorError"""
+        if self.handle is None:
+            raise MonitorError(f"{self.name}: not connected")
+        try:
+            if self.fd is None:
+                self.handle.write(data)
+                return
+            view = memoryview(data)
+            while view:
+                try:
+                    view = view[os.write(self.fd, view):]
+                except BlockingIOError:
+                    time.sleep(POLL_INTERVAL)
+        except OSError as e:
+            raise MonitorError(f"{self.port}: {e}")
+
+    def close(self):
+        if self.handle is None:
+            return
+        try:
+            if self.fd is not None:
+                os.close(self.fd)
+            else:
+                self.handle.close()
+        except OSError:
+            pass
+        self.handle = self.fd = None
+
+    def feed(self, data, now):
+        """Split received bytes into (timestamp, line) pairs
+
+        A line is stamped with the time its first byte arrived.
+        """
+        self.bytes += len(data)
+        self._last_data = now
+        if not self._partial:
+            self._partial_time = now
+        *complete, self._partial = (self._partial + data).split(b"\n")
+        lines = []
+        for index, raw in enumerate(complete):
+            lines.append((self._partial_time if index == 0 else now, decode_line(raw)))
+        if complete:
+            self._partial_time = now
+        return lines
+
+    def flush_partial(self, now, force=False):
+        """The unfinished line once it has been idle for PARTIAL_LINE_TIMEOUT, else None"""
+        if not self._partial or (not force and now - self._last_data < PARTIAL_LINE_TIMEOUT):
+            return None
+        line = (self._partial_time, decode_line(self._partial))
+        self._partial = b""
+        return line
+
+    def recent(self, count=None):
+        """Last count (timestamp, line) pairs of the ring buffer, all of them by default"""
+        lines = list(self.ring)
+        return lines if count is None else lines[-count:]
+
+
+def decode_line(raw):
+    return STATUS_BAR.sub(b"", raw).rstrip(b"\r").decode("utf-8", "replace")
+
+
+class ConsoleMux:
+    """Reads the consoles of many boards from one event loop
+
+    on_line(console, timestamp, line) is called for every line, with
+    timestamp in seconds of time.monotonic() since the monitor started.
+    """
+
+    def __init__(self, ports=None, usb_ids=None, log_dir=LOG_DIR, ring_lines=RING_LINES,
+                 max_log_bytes=LOG_MAX_BYTES, log_backups=LOG_BACKUPS, on_line=None, echo=True):
+        self.fixed_ports = list(ports) if ports else None
+        self.usb_ids = set(usb_ids) if usb_ids else None
+        self.log_dir = Path(log_dir) if log_dir else None
+        self.ring_lines = ring_lines
+        self.max_log_bytes = max_log_bytes
+        self.log_backups = log_backups
+        self.on_line = on_line
+        self.echo = echo
+        self.consoles = {}
+        self.started = time.monotonic()
+        self.started_wall = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.monitor = DeviceMonitor()
+        self.selector = selectors.DefaultSelector() if termios is not None else None
+        self.compressor = ThreadPoolExecutor(max_workers=1)
+        self.stopped = False
+        self._by_port = {}
+        self._failed_ports = {}
+        self._output = []
+        self._dump_requested = False
+        self._name_width = 8
+
+    def timestamp(self, now=None):
+        return (time.monotonic() if now is None else now) - self.started
+
+    def console_name(self, port):
+        """Stable name of the board on a port: its USB port path on Linux"""
+        name = (tty_usb_port(port) if IS_LINUX else None) or Path(port).name
+        console = self.consoles.get(name)
+        if console is not None and console.connected and console.port != port:
+            # A second console interface of the same board
+            name = f"{name}-{Path(port).name}"
+        return name
+
+    def wanted(self, port):
+        if self.usb_ids is None:
+            return True
+        return tty_usb_ids(port) in self.usb_ids
+
+    def scan(self):
+        """Open consoles on new ports and notice ports that went away"""
+        now = time.monotonic()
+        ports = self.fixed_ports if self.fixed_ports is not None else find_console_ports()
+        for port, console in list(self._by_port.items()):
+            if not os.path.exists(port):
+                self.disconnect(console, "removed")
+        for port in ports:
+            if port in self._by_port or now < self._failed_ports.get(port, 0) or not os.path.exists(port):
+                continue
+            if not self.wanted(port):
+                # Check again later, the port may be reused by a board that is wanted
+                self._failed_ports[port] = now + 10 * RESCAN_INTERVAL
+                continue
+            self.connect(port)
+
+    def connect(self, port):
+        name = self.console_name(port)
+        console = self.consoles.get(name)
+        if console is None:
+            log = None
+            if self.log_dir is not None:
+                header = f"# {name}: timestamps are seconds since {self.started_wall} (host monotonic clock)\n"
+                log = ConsoleLog(self.log_dir, name, header, self.max_log_bytes, self.log_backups, self.compressor)
+            console = Console(name, self.ring_lines, log)
+        try:
+            console.open(port)
+        except MonitorError as e:
+            # Usually a node that just appeared and isn't accessible yet
+            self._failed_ports[port] = time.monotonic() + RESCAN_INTERVAL
+            if port not in self._by_port and name not in self.consoles:
+                self.notice(console, f"can't open ({e})")
+            return None
+        self._failed_ports.pop(port, None)
+        self.consoles[name] = console
+        self._by_port[port] = console
+        self._name_width = max(self._name_width, len(name))
+        if self.selector is not None:
+            self.selector.register(console.fd, selectors.EVENT_READ, console)
+        self.notice(console, f"connected ({port})" if console.connections == 1 else f"reconnected ({port})")
+        return console
+
+    def disconnect(self, console, reason):
+        if not console.connected:
+            return
+        pending = console.flush_partial(time.monotonic(), force=True)
+        if pending is not None:
+            self.emit(console, *pending)
+        if self.selector is not None:
+            try:
+                self.selector.unregister(console.fd)
+            except (KeyError, ValueError):
+                pass
+        port = console.port
+        console.close()
+        self._by_port.pop(port, None)
+        self.notice(console, f"disconnected ({reason})")
+
+    def notice(self, console, message, now=None):
+        """Monitor message about a console, logged like a line but not kept in the ring"""
+        text = f"--- {message} ---"
+        timestamp = self.timestamp(now)
+        if console.log is not None:
+            console.log.write(f"{timestamp:.6f} {text}\n")
+        if self.echo:
+            self._output.append(f"{timestamp:10.3f} {console.name:>{self._name_width}} | {text}\n")
+
+    def emit(self, console, now, line):
+        timestamp = now - self.started
+        console.lines += 1
+        console.ring.append((timestamp, line))
+        if console.log is not None:
+            console.log.write(f"{timestamp:.6f} {line}\n")
+        if self.echo:
+            self._output.append(f"{timestamp:10.3f} {console.name:>{self._name_width}} | {line}\n")
+        if self.on_line is not None:
+            self.on_line(console, timestamp, line)
+
+    def poll(self, timeout):
+        """Read every console that has data, waiting up to timeout for some"""
+        if self.selector is not None:
+            if self.selector.get_map():
+                ready = [key.data for key, _ in self.selector.select(timeout)]
+            else:
+                time.sleep(timeout)
+                ready = []
+        else:
+            time.sleep(min(timeout, POLL_INTERVAL))
+            ready = [console for console in self.consoles.values() if console.connected]
+        now = time.monotonic()
+        for console in ready:
+            try:
+                data = console.read()
+            except MonitorError as e:
+                self.disconnect(console, str(e).split(": ", 1)[-1])
+                continue
+            if data:
+                for line in console.feed(data, now):
+                    self.emit(console, *line)
+        for console in self.consoles.values():
+            pending = console.flush_partial(now)
+            if pending is not None:
+                self.emit(console, *pending)
+
+    def write_output(self):
+        if not self._output:
+            return
+        text = "".join(self._output)
+        self._output = []
+        try:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # Output piped into e.g. head; keep logging without echoing
+            self.echo = False
+
+    def flush_logs(self):
+        for console in self.consoles.values():
+            if console.log is not None:
+                console.log.flush()
+
+    def request_dump(self, *_):
+        self._dump_requested = True
+
+    def dump_rings(self):
+        """Write every ring buffer to <log dir>/<name>.ring-<time>.txt, returns the paths"""
+        directory = self.log_dir or Path(".")
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        paths = []
+        for console in self.consoles.values():
+            path = directory / f"{console.name}.ring-{stamp}.txt"
+            with open(path, "w", encoding="utf-8") as dump:
+                dump.write(f"# {console.name}: last {len(console.ring)} lines, "
+                           f"timestamps are seconds since {self.started_wall}\n")
+                dump.writelines(f"{timestamp:.6f} {line}\n" for timestamp, line in console.ring)
+            paths.append(path)
+        return paths
+
+    def run(self, duration=None):
+        """Follow the consoles until stop() (or Ctrl+C), or for duration seconds"""
+        if self.log_dir is not None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+        event_driven = self.fixed_ports is None and self.monitor.start()
+        deadline = None if duration is None else time.monotonic() + duration
+        next_scan = next_flush = 0.0
+        generation = self.monitor.generation
+        try:
+            while not self.stopped:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                if now >= next_scan or (event_driven and self.monitor.generation != generation):
+                    generation = self.monitor.generation
+                    self.scan()
+                    next_scan = now + RESCAN_INTERVAL
+                self.poll(min(0.2, max(0.0, next_scan - now)))
+                self.write_output()
+                if self._dump_requested:
+                    self._dump_requested = False
+                    for path in self.dump_rings():
+                        self._output.append(f"--- ring buffer written to {path} ---\n")
+                if time.monotonic() >= next_flush:
+                    self.flush_logs()
+                    next_flush = time.monotonic() + FLUSH_INTERVAL
+        finally:
+            self.close()
+
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        for console in self.consoles.values():
+            self.disconnect(console, "monitor stopped")
+        self.write_output()
+        for console in self.consoles.values():
+            if console.log is not None:
+                console.log.close()
+        self.monitor.stop()
+        self.compressor.shutdown(wait=True)
+        if self.selector is not None:
+            self.selector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow the serial consoles of many DN-KEY Pro boards at once")
+    parser.add_argument("ports", nargs="*",
+                        help="serial ports to follow (default: every "
+                             + ", ".join(CONSOLE_PORT_PATTERNS) + " port, as boards come and go)")
+    parser.add_argument("--usb-id", action="append", type=parse_usb_id, metavar="VID:PID",
+                        help="only follow ports of these USB devices, e.g. 239a:8112 for CircuitPython "
+                             "(repeatable, Linux or pyserial)")
+    parser.add_argument("--log-dir", default=LOG_DIR, help=f"per-board log directory (default: {LOG_DIR})")
+    parser.add_argument("--no-log", action="store_true", help="don't write log files")
+    parser.add_argument("--max-log-size", type=float, default=LOG_MAX_BYTES / (1024 * 1024), metavar="MIB",
+                        help=f"rotate a board's log at this size (default: {LOG_MAX_BYTES // (1024 * 1024)})")
+    parser.add_argument("--log-backups", type=int, default=LOG_BACKUPS,
+                        help=f"compressed logs kept per board (default: {LOG_BACKUPS})")
+    parser.add_argument("--ring-lines", type=int, default=RING_LINES,
+                        help=f"lines kept in memory per board (default: {RING_LINES})")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only write the logs, don't print lines")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    if termios is None and serial is None:
+        parser.error("pyserial is required on this system (pip install pyserial)")
+    if args.quiet and args.no_log:
+        parser.error("--quiet with --no-log leaves nothing to do")
+
+    mux = ConsoleMux(
+        ports=args.ports or None,
+        usb_ids=args.usb_id,
+        log_dir=None if args.no_log else args.log_dir,
+        ring_lines=args.ring_lines,
+        max_log_bytes=int(args.max_log_size * 1024 * 1024),
+        log_backups=args.log_backups,
+        echo=not args.quiet,
+    )
+    signal.signal(signal.SIGTERM, lambda *_: mux.stop())
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, mux.request_dump)
+    print(f"Following {'ports ' + ', '.join(args.ports) if args.ports else 'every console port'}"
+          + ("" if args.no_log else f", logs in {args.log_dir}") + " - Ctrl+C to stop", file=sys.stderr)
+    try:
+        mux.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    for console in mux.consoles.values():
+        print(f"{console.name}: {console.lines} lines, {console.bytes} bytes, "
+              f"{console.connections} connection(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
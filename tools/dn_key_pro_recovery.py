@@ -19,13 +19,36 @@ Requirements:
 """
 
 import os
+import re
 import sys
 import time
+import argparse
+import json
 import subprocess
 import platform
 import shutil
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from dn_key_pro_artifacts import CACHE_DIR as DEFAULT_CACHE_DIR, ArtifactError, ArtifactStore, sha256_file
+from dn_key_pro_deploy import (
+    MPY_CROSS, DeployError, MpyCompiler, MpyCrossUnavailable, compile_app, scan_app, sync_app, target_circuitpython,
+)
+from dn_key_pro_esptool import EsptoolError, SubprocessEsptool, changed_images, find_esptool_command, open_esptool
+from dn_key_pro_firmware import (
+    FirmwareError, boot_out_version, build_merged_image, circuitpython_boot, firmware_version,
+    merged_regions,
+)
+from dn_key_pro_metrics import PERCENTILES, RunLog, run_summary
+from dn_key_pro_repl import RawRepl, eject_drive, find_repl_ports, sync_app_repl
+from dn_key_pro_usb import (
+    ESPRESSIF_USB_VID, DeviceMonitor, block_usb_port, find_volume_mounts, group_by_hub, mac_from_usb_serial,
+    serial_by_id, tty_usb_ids, tty_usb_port, usb_device_name, usb_hub_path, usb_port_present,
+    usb_serial_number,
+)
+
 # =============================================================================
 # USER CONFIGURATION - MODIFY THESE PATHS FOR YOUR SYSTEM
 # =============================================================================
@@ -38,10 +61,31 @@ TINYUF2_DIR = "/path/to/your/tinyuf2/ports/espressif"
 # Example: "/path/to/your/circuitpython_firmware.uf2"
 CIRCUITPYTHON_UF2 = "/path/to/your/circuitpython_firmware.uf2"
 
+# CircuitPython app image (.bin) used by --merged mode. Leave empty to use the
+# .bin that sits next to CIRCUITPYTHON_UF2 (as in firmware/circuitpython/UF2/)
+CIRCUITPYTHON_BIN = ""
+
 # Sample code.py file to copy to the device after flashing
 # Example: "/path/to/your/sample_code.py"
 SAMPLE_CODE = "/path/to/your/sample_code.py"
 
+# Whole app directory synced to the device instead of SAMPLE_CODE (code.py,
+# dn_key_pro/, lib/, images/, ...), e.g. "examples/circuitpython/dc33_demo".
+# Only changed files are copied, see dn_key_pro_deploy.py. Leave empty to copy
+# SAMPLE_CODE only
+SAMPLE_APP = ""
+
+# Push the app's modules as .mpy compiled with mpy-cross (cached under
+# CACHE_DIR/mpy) instead of .py sources. mpy-cross must match the CircuitPython
+# major version of CIRCUITPYTHON_UF2; without it the sources are deployed
+COMPILE_MPY = False
+
+# How the code stage writes the sample code or app: "volume" copies to the
+# DN-S3-PY drive, "repl" streams it over the CircuitPython serial console
+# (dn_key_pro_repl.py), for hosts that can't mount the drive reliably. On
+# Linux the drive is ejected first, so CircuitPython can write to it
+CODE_TRANSPORT = "volume"
+
 # =============================================================================
 # ADVANCED CONFIGURATION (usually don't need to change these)
 # =============================================================================
@@ -59,10 +103,291 @@ FLASH_FREQ = "80m"
 FLASH_SIZE = "8MB"
 BAUD_RATE = "460800"
 
+# Probe the fastest stable baud rate of each port (in-process esptool only).
+# Results are cached per USB port and MAC in CACHE_DIR/baud_rates.json;
+# BAUD_RATE is used until the probe has run and whenever it can't
+PROBE_BAUD = True
+
+# Check every region written over serial against its image with an MD5
+# computed on the chip, before the board is reset (--verify). Only digests
+# travel over serial, the flash is never read back
+VERIFY_FLASH = False
+
+# Boards that already run the target firmware, found from boot_out.txt on
+# their DN-S3-PY volume or by hashing the bootloader, TinyUF2 and CircuitPython
+# regions on the chip: "reflash" erases and flashes every board anyway (a board
+# being recovered may report the right version and still be broken), "code"
+# only copies the sample code, "skip" leaves the board alone
+UP_TO_DATE_BOARDS = "reflash"
+
+# Where verified firmware artifacts and merged flash images are cached
+CACHE_DIR = str(DEFAULT_CACHE_DIR)
+
+# How esptool is driven: "auto" (in-process library when installed, falling
+# back to a subprocess per command), "library" or "subprocess"
+ESPTOOL_DRIVER = "auto"
+
+# Parallel recovery settings
+# Maximum number of devices flashed at the same time in --parallel mode
+MAX_CONCURRENT_DEVICES = 4
+
+# USB topology limits (Linux, from sysfs)
+# Maximum boards on the same upstream hub in a serial stage (identify, erase,
+# bootloader) at once; 0 for no limit. Boards are also spread across hubs
+# when they are queued. --jobs caps serial stages across all hubs.
+MAX_JOBS_PER_HUB = 2
+
+# Pipeline recovery settings (--pipeline)
+# Worker threads per stage. Boards whose volumes are matched by USB port run
+# the mass-storage stages (uf2/code) in parallel like the serial ones; boards
+# without a known port share DN_BOOT / DN-S3-PY labels and still take turns
+PIPELINE_STAGE_WORKERS = {
+    "identify": 4,
+    "erase": 4,
+    "bootloader": 4,
+    "verify": 4,
+    "uf2": 4,
+    "code": 4,
+}
+
+# Hot-plug daemon settings (--daemon)
+# Seconds to let a newly attached port settle before esptool opens it
+DAEMON_SETTLE_TIME = 0.5
+# How often the live status lines are redrawn, in seconds
+DAEMON_STATUS_INTERVAL = 0.5
+
 # =============================================================================
 # END USER CONFIGURATION
 # =============================================================================
 
+# Stages that read or write the DN_BOOT / DN-S3-PY mass-storage volumes
+VOLUME_STAGES = ("uf2", "code")
+
+# Stages that talk to the ROM bootloader over serial (logged with their baud rate)
+SERIAL_STAGES = ("identify", "erase", "bootloader", "verify")
+
+# Failure messages per stage, e.g. "[0] Erase failed - skipping device"
+STAGE_FAILURES = {
+    "identify": "Identification",
+    "erase": "Erase",
+    "bootloader": "TinyUF2 flash",
+    "verify": "Flash verification",
+    "uf2": "CircuitPython flash",
+    "code": "Sample code copy",
+}
+
+# Stages recorded in the checkpoint file, in the order they run
+CHECKPOINT_STAGES = ("erase", "bootloader", "verify", "uf2", "code")
+
+class JsonStore:
+    """A JSON object in a file under CACHE_DIR, shared by the tool's threads
+    
+    The file is read once; a missing or unreadable one starts empty. save()
+    rewrites it through a temporary file, so a crash never leaves it
+    half-written. Callers hold self.lock around changes and save().
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        tmp.replace(self.path)
+
+class CheckpointStore(JsonStore):
+    """Per-device progress, keyed by MAC, persisted across runs
+    
+    Each entry lists the stages a board finished and the artifact hashes and
+    mode they were run with. A rerun resumes the board at its first
+    incomplete stage as long as the artifacts and mode still match.
+    """
+
+    def completed_stages(self, mac, artifacts, mode):
+        """Stages already finished for this board with the same artifacts and mode"""
+        with self.lock:
+            entry = self.entries.get(mac)
+        if not entry or entry.get("artifacts") != artifacts or entry.get("mode") != mode:
+            return []
+        return list(entry.get("stages", []))
+
+    def stage_done(self, mac, stage, artifacts, mode):
+        """Record that a board finished a stage
+        
+        Only stages that actually ran are listed: a run without --verify
+        doesn't mark verification done for a later --verify resume.
+        """
+        with self.lock:
+            entry = self.entries.get(mac)
+            done = set()
+            if entry and entry.get("artifacts") == artifacts and entry.get("mode") == mode:
+                done.update(entry.get("stages", []))
+            done.add(stage)
+            self.entries[mac] = {
+                "stages": [name for name in CHECKPOINT_STAGES if name in done],
+                "artifacts": artifacts,
+                "mode": mode,
+                "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self.save()
+
+    def clear(self, mac):
+        """Forget a board once it is fully provisioned"""
+        with self.lock:
+            if self.entries.pop(mac, None) is not None:
+                self.save()
+
+class BaudCache(JsonStore):
+    """Fastest stable baud rate per USB port and chip MAC, persisted across runs
+    
+    The same board on a different hub or cable gets probed again, and a rate
+    that later fails is replaced by the slower one the driver fell back to.
+    """
+
+    @staticmethod
+    def key(usb_port, mac):
+        return f"{usb_port or '-'}/{mac}"
+
+    def get(self, usb_port, mac):
+        with self.lock:
+            entry = self.entries.get(self.key(usb_port, mac))
+        return entry["baud"] if entry else None
+
+    def record(self, usb_port, mac, baud, source, throughput=None):
+        """Store the baud rate for a port and board (source: probe or fallback)"""
+        with self.lock:
+            self.entries[self.key(usb_port, mac)] = {
+                "baud": int(baud),
+                "source": source,
+                "read_bytes_per_second": round(throughput) if throughput else None,
+                "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self.save()
+
+class IdentityCache(JsonStore):
+    """USB serial number -> chip MAC, learned from flashing sessions
+    
+    Boards on the ESP32-S3 USB-Serial/JTAG report their MAC as the USB serial
+    number; this cache covers USB-UART bridges, whose serial numbers are
+    their own, once a flashing session has read the chip's MAC.
+    """
+
+    def get(self, usb_serial):
+        if not usb_serial:
+            return None
+        with self.lock:
+            entry = self.entries.get(usb_serial)
+        return entry["mac"] if entry else None
+
+    def learn(self, usb_serial, mac, by_id=None):
+        """Remember the MAC behind a USB serial number"""
+        if not usb_serial or mac_from_usb_serial(usb_serial):
+            return
+        with self.lock:
+            if self.entries.get(usb_serial, {}).get("mac") == mac:
+                return
+            self.entries[usb_serial] = {
+                "mac": mac,
+                "by_id": by_id,
+                "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self.save()
+
+class TopologyLimiter:
+    """Caps how many serial stages run at once, per upstream hub and overall"""
+
+    def __init__(self, per_hub=MAX_JOBS_PER_HUB, total=MAX_CONCURRENT_DEVICES):
+        self.per_hub = per_hub
+        self.total = total
+        self.cond = threading.Condition()
+        self.active = 0
+        self.active_per_hub = {}
+
+    def _free(self, hub):
+        if self.total and self.active >= self.total:
+            return False
+        if hub and self.per_hub and self.active_per_hub.get(hub, 0) >= self.per_hub:
+            return False
+        return True
+
+    def acquire(self, hub, blocking=True):
+        """Take a slot on the hub (None: only the global limit), False if busy and not blocking"""
+        with self.cond:
+            if not blocking and not self._free(hub):
+                return False
+            self.cond.wait_for(lambda: self._free(hub))
+            self.active += 1
+            if hub:
+                self.active_per_hub[hub] = self.active_per_hub.get(hub, 0) + 1
+            return True
+
+    def release(self, hub):
+        with self.cond:
+            self.active -= 1
+            if hub:
+                self.active_per_hub[hub] -= 1
+            self.cond.notify_all()
+
+class DeviceResult:
+    """Outcome of recovering a single device, used for the summary table"""
+
+    def __init__(self, device_port, device_id):
+        self.device_port = device_port
+        self.device_id = device_id
+        self.mac = "unknown"
+        self.usb_serial = None
+        self.success = False
+        self.failed_stage = None
+        self.warnings = []
+        self.stage_times = {}
+        self.stage_bytes = {}
+        self.session = None
+        
+        # Flash region -> True/False from the verify stage
+        self.verified = {}
+        
+        # Board already runs the target firmware; skip_stages aren't needed
+        self.up_to_date = False
+        self.skip_stages = []
+        self.baud = int(BAUD_RATE)
+        
+        # Stage currently running, shown by the --daemon status lines
+        self.stage = None
+        
+        # Stages finished by an earlier, interrupted run (from the checkpoint)
+        self.resume_stages = []
+        
+        # Physical USB port ("1-2.3") on Linux; stays the same while the board
+        # re-enumerates as ROM bootloader, DN_BOOT and DN-S3-PY
+        self.usb_port = tty_usb_port(device_port)
+        self.hub = usb_hub_path(self.usb_port) if self.usb_port else None
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def duration(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    def fail(self, stage):
+        self.failed_stage = stage
+        self.finished = time.monotonic()
+        return self
+
+    def complete(self):
+        self.success = True
+        self.finished = time.monotonic()
+        return self
+
+
 class DNKeyProRecovery:
     def __init__(self):
         self.os_type = platform.system().lower()
@@ -77,39 +402,84 @@ class DNKeyProRecovery:
         self.BLUE = '\033[0;34m'
         self.NC = '\033[0m'
         
-        # Log file
-        self.log_file = Path("recovery_log.txt")
-        self.setup_logging()
-        
-    def setup_logging(self):
-        """Setup logging to both file and console"""
-        import logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(self.log_file),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
+        self.esptool_driver = ESPTOOL_DRIVER
+        
+        # Refresh mode: only rewrite flash regions that differ, no full erase
+        self.refresh = False
+        
+        # Merged mode: write bootloader, TinyUF2 and CircuitPython in one session
+        self.merged = False
+        self.merged_image = None
+        # (offset, name, image path) of its components, written one by one with --refresh
+        self.merged_parts = []
+        
+        # Verify mode: hash the written regions on the chip before the reset
+        self.verify = VERIFY_FLASH
+        
+        # Up-to-date boards: "code", "skip" or "reflash" (see UP_TO_DATE_BOARDS)
+        self.up_to_date = UP_TO_DATE_BOARDS
+        self.target_firmware = None
+        self.firmware_regions = []
+        
+        # Verified firmware images, keyed by role (see ARTIFACT_ROLES)
+        self.artifact_store = ArtifactStore(Path(CACHE_DIR) / "artifacts")
+        self.artifacts = {}
+        
+        # Per-device stage checkpoints so interrupted boards resume where they stopped
+        self.checkpoints = CheckpointStore(Path(CACHE_DIR) / "checkpoints.json")
+        self.resume = True
+        
+        # USB serial number -> MAC for boards behind USB-UART bridges
+        self.identities = IdentityCache(Path(CACHE_DIR) / "identities.json")
+        
+        # Fastest stable baud rate per port and board
+        self.baud_cache = BaudCache(Path(CACHE_DIR) / "baud_rates.json")
+        self.probe_baud = PROBE_BAUD
+        
+        # App directory synced by the code stage instead of SAMPLE_CODE,
+        # scanned (and compiled with --mpy) once per run
+        self.sample_app = SAMPLE_APP
+        self.app_files = None
+        self.compile_mpy = COMPILE_MPY
+        self.mpy_cross = MPY_CROSS
+        self.code_transport = CODE_TRANSPORT
+        
+        # Log file: buffered JSON lines, see dn_key_pro_metrics.py
+        self.log_file = Path("recovery_log.jsonl")
+        self.run_log = RunLog(self.log_file)
+        self.log_lock = threading.Lock()
+        
+        # Print log lines on the console (the --daemon status view turns this off)
+        self.console_output = True
+
+        # DN_BOOT / DN-S3-PY volumes of different boards share the same label,
+        # so unless a board's USB port is known (Linux) the mass-storage
+        # stages are serialized across worker threads
+        self.volume_lock = threading.Lock()
+        
+        # Event-driven waits for ports and volumes (Linux), polling elsewhere
+        self.device_monitor = DeviceMonitor()
+        
+        # Per-hub and global limits for the serial stages
+        self.limiter = TopologyLimiter()
     
     def log(self, message, level="INFO"):
         """Log message with color coding"""
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        
-        if level == "SUCCESS":
-            print(f"{self.GREEN}[SUCCESS]{self.NC} {message}")
-        elif level == "WARNING":
-            print(f"{self.YELLOW}[WARNING]{self.NC} {message}")
-        elif level == "ERROR":
-            print(f"{self.RED}[ERROR]{self.NC} {message}")
-        else:
-            print(f"{self.BLUE}[INFO]{self.NC} {message}")
+        # Messages about one device start with its ID, e.g. "[0] Erasing..."
+        device = re.match(r"\[([^\]]+)\]", message)
+        self.run_log.message(message, level, device.group(1) if device else None)
         
-        # Also write to log file
-        with open(self.log_file, "a") as f:
-            f.write(f"[{timestamp}] {level}: {message}\n")
+        # Worker threads log concurrently, keep each line intact
+        with self.log_lock:
+            if self.console_output:
+                if level == "SUCCESS":
+                    print(f"{self.GREEN}[SUCCESS]{self.NC} {message}")
+                elif level == "WARNING":
+                    print(f"{self.YELLOW}[WARNING]{self.NC} {message}")
+                elif level == "ERROR":
+                    print(f"{self.RED}[ERROR]{self.NC} {message}")
+                else:
+                    print(f"{self.BLUE}[INFO]{self.NC} {message}")
     
     def check_configuration(self):
         """Check if all required files and paths exist"""
@@ -144,8 +514,20 @@ class DNKeyProRecovery:
         else:
             self.log(f"✓ CircuitPython UF2 found: {CIRCUITPYTHON_UF2}")
         
-        # Check sample code
-        if not Path(SAMPLE_CODE).exists():
+        # Check CircuitPython app image for merged flashing
+        if self.merged:
+            if not Path(self.circuitpython_bin()).exists():
+                issues.append(f"CircuitPython .bin not found: {self.circuitpython_bin()}")
+            else:
+                self.log(f"✓ CircuitPython .bin found: {self.circuitpython_bin()}")
+        
+        # Check sample code, or the app directory synced instead
+        if self.sample_app:
+            if not (Path(self.sample_app) / "code.py").exists():
+                issues.append(f"App directory with a code.py not found: {self.sample_app}")
+            else:
+                self.log(f"✓ App directory found: {self.sample_app}")
+        elif not Path(SAMPLE_CODE).exists():
             issues.append(f"Sample code not found: {SAMPLE_CODE}")
         else:
             self.log(f"✓ Sample code found: {SAMPLE_CODE}")
@@ -238,19 +620,130 @@ class DNKeyProRecovery:
     
     def find_esptool(self):
         """Find esptool installation"""
-        for cmd in [['esptool.py'], ['python', '-m', 'esptool'], ['python3', '-m', 'esptool']]:
+        return find_esptool_command()
+    
+    def wait_for_port(self, device_port):
+        """Wait for a serial port to re-enumerate after the chip was reset"""
+        if self.device_monitor.event_driven:
+            self.device_monitor.wait_for_reenumeration(device_port)
+        else:
+            time.sleep(2)
+    
+    def open_esptool(self, device_port, device_id):
+        """Open an esptool session (in-process when possible) for one device"""
+        session, warning = open_esptool(device_port, BAUD_RATE, self.esptool_driver)
+        if warning:
+            self.log(f"[{device_id}] {warning}", "WARNING")
+        if session.name == "library":
+            self.log(f"[{device_id}] Connected with in-process esptool at {BAUD_RATE} baud")
+        return session
+    
+    def esptool_session(self, result):
+        """Return the device's esptool session, opening it on first use"""
+        if result.session is None:
+            result.session = self.open_esptool(result.device_port, result.device_id)
+        return result.session
+    
+    def select_baud(self, result):
+        """Switch the device's session to its cached or probed baud rate"""
+        session = result.session
+        if result.mac == "unknown" or not hasattr(session, "set_baud"):
+            return
+        try:
+            cached = self.baud_cache.get(result.usb_port, result.mac)
+            if cached:
+                if cached != session.baud:
+                    session.set_baud(cached)
+                self.log(f"[{result.device_id}] Using cached baud rate {cached}")
+            elif self.probe_baud and hasattr(session, "probe_baud"):
+                self.log(f"[{result.device_id}] Probing fastest stable baud rate...")
+                baud, throughput = session.probe_baud()
+                self.baud_cache.record(result.usb_port, result.mac, baud, "probe", throughput)
+                rate = f" ({throughput / 1024:.0f} KiB/s read back)" if throughput else ""
+                self.log(f"[{result.device_id}] Using baud rate {baud}{rate}", "SUCCESS")
+        except EsptoolError as e:
+            self.log(f"[{result.device_id}] Baud rate probe failed ({e}), using {BAUD_RATE}", "WARNING")
+            session.set_baud(BAUD_RATE, reconnect=True)
+        except OSError as e:
+            self.log(f"[{result.device_id}] Could not save baud rate: {e}", "WARNING")
+        result.baud = session.baud
+    
+    def record_baud_fallbacks(self, result):
+        """Cache the slower rate a session fell back to after write errors"""
+        session = result.session
+        fallbacks = getattr(session, "baud_fallbacks", None)
+        if not fallbacks:
+            return
+        for old, new, reason in fallbacks:
+            self.log(f"[{result.device_id}] Serial error at {old} baud ({reason}), retried at {new}", "WARNING")
+        del fallbacks[:]
+        result.baud = session.baud
+        if result.mac != "unknown":
             try:
-                result = subprocess.run(cmd + ['version'], capture_output=True, text=True, timeout=5)
-                if result.returncode == 0:
-                    return cmd
-            except:
-                continue
-        return None
+                self.baud_cache.record(result.usb_port, result.mac, session.baud, "fallback")
+            except OSError as e:
+                self.log(f"[{result.device_id}] Could not save baud rate: {e}", "WARNING")
+    
+    def close_esptool_session(self, result, reset=True):
+        """Reset the device and release its esptool session"""
+        if result.session is not None:
+            self.record_baud_fallbacks(result)
+            try:
+                result.session.close(reset=reset)
+            except EsptoolError as e:
+                self.log(f"[{result.device_id}] Reset after flashing failed: {e}", "WARNING")
+            result.session = None
     
     def detect_devices(self):
         """Detect connected devices"""
         self.log("Scanning for connected devices...")
         
+        devices = self.scan_ports()
+        
+        if devices:
+            self.log(f"Found {len(devices)} device(s):", "SUCCESS")
+            for device in devices:
+                self.log(f"  - {device}")
+            self.log_topology(devices)
+        else:
+            self.log("No devices found!", "WARNING")
+        
+        return devices
+    
+    def log_topology(self, devices):
+        """Show which upstream USB hub each port hangs off (Linux)"""
+        groups = group_by_hub(devices)
+        if list(groups) == [None]:
+            return
+        self.log("USB topology:")
+        for hub, ports in sorted(groups.items(), key=lambda item: item[0] or ""):
+            if hub is None:
+                self.log(f"  unknown hub: {', '.join(ports)}")
+                continue
+            name = usb_device_name(hub)
+            label = f"hub {hub}" + (f" [{name}]" if name else "")
+            self.log(f"  {label}: " + ", ".join(f"{Path(port).name} ({tty_usb_port(port)})" for port in ports))
+    
+    def port_hub(self, device_port):
+        """Upstream USB hub of a serial port, None when unknown"""
+        usb_port = tty_usb_port(device_port)
+        return usb_hub_path(usb_port) if usb_port else None
+    
+    def order_by_hub(self, devices):
+        """Interleave ports across hubs so the first jobs don't all share one hub"""
+        by_hub = {}
+        for device_port in devices:
+            by_hub.setdefault(self.port_hub(device_port) or "", []).append(device_port)
+        groups = [by_hub[hub] for hub in sorted(by_hub)]
+        ordered = []
+        while any(groups):
+            for ports in groups:
+                if ports:
+                    ordered.append(ports.pop(0))
+        return ordered
+    
+    def scan_ports(self):
+        """List candidate serial ports without logging"""
         devices = []
         
         if self.is_macos:
@@ -276,142 +769,406 @@ class DNKeyProRecovery:
             except:
                 pass
         
-        if devices:
-            self.log(f"Found {len(devices)} device(s):", "SUCCESS")
-            for device in devices:
-                self.log(f"  - {device}")
-        else:
-            self.log("No devices found!", "WARNING")
-        
         return devices
     
-    def get_device_mac(self, device_port):
+    def get_device_mac(self, device_port, session=None):
         """Get device MAC address for identification"""
-        esptool_cmd = self.find_esptool()
-        if not esptool_cmd:
+        try:
+            if session is None:
+                session = SubprocessEsptool(device_port, BAUD_RATE)
+            return session.read_mac()
+        except EsptoolError:
             return "unknown"
+    
+    def erase_device(self, device_port, device_id, session=None):
+        """Erase device flash memory"""
+        self.log(f"[{device_id}] Erasing flash memory...")
         
         try:
-            result = subprocess.run(esptool_cmd + ['--chip', 'esp32s3', '-p', device_port, 'chip_id'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'MAC:' in line:
-                        return line.split('MAC:')[1].strip()
-        except:
-            pass
+            if session is None:
+                session = self.open_esptool(device_port, device_id)
+            
+            self.log(f"[{device_id}] Running: erase_flash ({session.name} esptool)")
+            session.erase_flash()
+            
+            self.log(f"[{device_id}] Flash erased successfully!", "SUCCESS")
+            if session.name == "subprocess":
+                # esptool reset the chip on exit, give it time to come back
+                self.wait_for_port(device_port)
+            return True
         
-        return "unknown"
+        except EsptoolError as e:
+            self.log(f"[{device_id}] Flash erase failed: {e}", "ERROR")
+            return False
+        except Exception as e:
+            self.log(f"[{device_id}] Error during flash erase: {e}", "ERROR")
+            return False
     
-    def erase_device(self, device_port, device_id):
-        """Erase device flash memory"""
-        self.log(f"[{device_id}] Erasing flash memory...")
+    def artifact_sources(self):
+        """(role, source path) of every firmware image this run needs"""
+        base = Path(TINYUF2_DIR)
+        sources = [
+            ("bootloader", base / TINYUF2_BOOTLOADER),
+            ("partition_table", base / TINYUF2_PARTITION_TABLE),
+            ("ota_data", base / TINYUF2_OTA_DATA),
+            ("tinyuf2", base / TINYUF2_BINARY),
+            ("circuitpython_uf2", Path(CIRCUITPYTHON_UF2)),
+        ]
+        if self.merged or (self.up_to_date != "reflash" and Path(self.circuitpython_bin()).exists()):
+            # Also used to recognise boards that already run this build
+            sources.append(("circuitpython_bin", Path(self.circuitpython_bin())))
+        return sources
+    
+    def import_artifacts(self):
+        """Import every firmware image into the artifact store
         
-        esptool_cmd = self.find_esptool()
-        if not esptool_cmd:
-            self.log("esptool not found!", "ERROR")
+        New or changed files are hashed and verified once; unchanged ones are
+        resolved from the manifest. Stages then flash the stored copies.
+        """
+        self.log("Importing firmware artifacts...")
+        try:
+            for role, source in self.artifact_sources():
+                artifact = self.artifact_store.import_file(source, role)
+                self.artifacts[role] = artifact
+                state = "cached" if artifact.cached else "imported"
+                self.log(f"✓ {artifact.name}: sha256 {artifact.short_hash} ({state})")
+            self.artifact_store.save()
+        except (OSError, ArtifactError) as e:
+            self.log(f"Failed to import firmware artifacts: {e}", "ERROR")
             return False
+        return True
+    
+    def mode_name(self):
+        """Flashing mode, stored with provisioning records and checkpoints"""
+        if self.merged:
+            return "merged+refresh" if self.refresh else "merged"
+        return "refresh" if self.refresh else "full"
+    
+    def artifact_hashes(self):
+        """role -> SHA-256 of the artifacts used this run"""
+        hashes = {role: artifact.sha256 for role, artifact in self.artifacts.items()}
+        if self.merged_image is not None:
+            hashes["merged"] = self.merged_image.sha256
+        return hashes
+    
+    def tinyuf2_regions(self):
+        """(offset, role, image path) of every region written by flash_tinyuf2
         
+        Paths point into the artifact store once imported, otherwise they are
+        relative to TINYUF2_DIR.
+        """
+        images = [
+            ('0x8000', "partition_table", TINYUF2_PARTITION_TABLE),
+            ('0xe000', "ota_data", TINYUF2_OTA_DATA),
+            ('0x0', "bootloader", TINYUF2_BOOTLOADER),
+            ('0x410000', "tinyuf2", TINYUF2_BINARY),
+        ]
+        return [
+            (offset, role, str(self.artifacts[role].path) if role in self.artifacts else path)
+            for offset, role, path in images
+        ]
+    
+    def tinyuf2_images(self):
+        """(offset, image path) pairs written by flash_tinyuf2"""
+        return [(offset, path) for offset, _, path in self.tinyuf2_regions()]
+    
+    def written_regions(self):
+        """(offset, name, image path) of every region the bootloader stage writes"""
+        if self.merged and self.refresh:
+            # The components only: the merged image would also overwrite nvs
+            # and ota_1 with 0xFF, so it would never match once CircuitPython
+            # has written nvs, and rewriting it would erase nvs
+            return self.merged_parts
+        if self.merged:
+            return [('0x0', "merged", str(self.merged_image.path))]
+        return self.tinyuf2_regions()
+    
+    def changed_regions(self, session, device_id, images):
+        """Refresh mode: hash each region on the chip and keep the ones that differ"""
+        self.log(f"[{device_id}] Comparing flash regions with local images...")
+        matches = session.verify_regions(images, FLASH_MODE, FLASH_FREQ, FLASH_SIZE, cwd=TINYUF2_DIR)
+        changed = changed_images(images, matches)
+        for offset, filename in images:
+            state = "changed" if (offset, filename) in changed else "up to date"
+            self.log(f"[{device_id}]   {offset:>9} {Path(filename).name}: {state}")
+        return changed
+    
+    def circuitpython_bin(self):
+        """CircuitPython app image used for merged flashing"""
+        return CIRCUITPYTHON_BIN or str(Path(CIRCUITPYTHON_UF2).with_suffix(".bin"))
+    
+    def prepare_merged_image(self):
+        """Build the merged flash image once, reused while its inputs are unchanged"""
+        roles = ["bootloader", "partition_table", "tinyuf2", "circuitpython_bin"]
+        inputs = [self.artifacts[role] for role in roles]
         try:
-            cmd = esptool_cmd + [
-                '--chip', 'esp32s3', '-p', device_port, '-b', BAUD_RATE, 'erase_flash'
-            ]
-            
-            self.log(f"Running: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-            
-            if result.returncode == 0:
-                self.log(f"[{device_id}] Flash erased successfully!", "SUCCESS")
-                time.sleep(2)
-                return True
+            self.merged_image = self.artifact_store.derived(
+                "merged",
+                f"merged-{Path(self.circuitpython_bin()).stem}.bin",
+                inputs,
+                lambda: build_merged_image(*[artifact.path.read_bytes() for artifact in inputs]),
+            )
+            if self.refresh:
+                self.merged_parts = []
+                for offset, name, data in merged_regions(*[artifact.path.read_bytes() for artifact in inputs]):
+                    if name == "ota_data":
+                        artifact = self.artifact_store.derived(
+                            "otadata_ota_0", "otadata-ota_0.bin", [self.artifacts["partition_table"]],
+                            lambda: data)
+                    else:
+                        artifact = self.artifacts["circuitpython_bin" if name == "circuitpython" else name]
+                    self.merged_parts.append((f"0x{offset:x}", name, str(artifact.path)))
+            self.artifact_store.save()
+        except (OSError, ArtifactError, FirmwareError) as e:
+            self.log(f"Failed to build merged flash image: {e}", "ERROR")
+            return False
+        state = "cached" if self.merged_image.cached else "built"
+        self.log(f"✓ Merged flash image: sha256 {self.merged_image.short_hash} ({state})")
+        return True
+    
+    def prepare_firmware_check(self):
+        """Work out how an up-to-date board looks, for the check in the identify stage
+        
+        Boards running CircuitPython are compared by the version banner in
+        boot_out.txt; boards in the ROM bootloader by hashing the bootloader,
+        TinyUF2 and CircuitPython app regions (needs the CircuitPython .bin).
+        """
+        if self.up_to_date == "reflash":
+            return
+        try:
+            self.target_firmware = firmware_version(self.artifacts["circuitpython_uf2"].path.read_bytes())
+            if "circuitpython_bin" in self.artifacts:
+                partition_table = self.artifacts["partition_table"]
+                ota_0, otadata, boot_ota_0 = circuitpython_boot(partition_table.path.read_bytes())
+                otadata_image = self.artifact_store.derived(
+                    "otadata_ota_0", "otadata-ota_0.bin", [partition_table], lambda: boot_ota_0)
+                self.artifact_store.save()
+                self.firmware_regions = [
+                    region for region in self.tinyuf2_regions() if region[1] != "ota_data"
+                ] + [
+                    (f"0x{ota_0.offset:x}", "circuitpython", str(self.artifacts["circuitpython_bin"].path)),
+                    (f"0x{otadata.offset:x}", "ota_data", str(otadata_image.path)),
+                ]
+        except (OSError, ArtifactError, FirmwareError) as e:
+            self.log(f"Can't check for up-to-date boards: {e}", "WARNING")
+            return
+        
+        if self.target_firmware:
+            self.log(f"✓ Target firmware: {self.target_firmware}")
+        else:
+            self.log(f"No version banner found in {Path(CIRCUITPYTHON_UF2).name}, "
+                     f"boot_out.txt can't be checked", "WARNING")
+        if not self.firmware_regions:
+            self.log(f"CircuitPython .bin not found ({self.circuitpython_bin()}), "
+                     f"flash contents can't be checked", "WARNING")
+    
+    def installed_version(self, result):
+        """Version banner from boot_out.txt when the board's DN-S3-PY volume is mounted
+        
+        Needs the board's USB port (Linux) to tell its volume from the others.
+        """
+        if not result.usb_port:
+            return None
+        for volume_path in self.volume_candidates("DN-S3-PY", result.usb_port):
+            try:
+                text = (Path(volume_path) / "boot_out.txt").read_text(errors="replace")
+            except OSError:
+                continue
+            version, uid = boot_out_version(text)
+            if uid and len(uid) == 12 and result.mac == "unknown":
+                # The ESP32-S3 port of CircuitPython reports the chip MAC as its UID
+                result.mac = ":".join(uid[i:i + 2] for i in range(0, 12, 2)).lower()
+            return version
+        return None
+    
+    def firmware_on_flash(self, result, session):
+        """Hash the firmware regions on the chip, True when the board already has them
+        
+        Only the OTA data may differ (it still boots TinyUF2, or was left by an
+        earlier OTA); it is rewritten to boot CircuitPython.
+        """
+        device_id = result.device_id
+        self.log(f"[{device_id}] Checking installed firmware (on-chip MD5)...")
+        matches = session.verify_regions([(offset, path) for offset, _, path in self.firmware_regions],
+                                         FLASH_MODE, FLASH_FREQ, FLASH_SIZE, cwd=TINYUF2_DIR)
+        differ = [(offset, name, path) for offset, name, path in self.firmware_regions
+                  if not matches.get(int(offset, 16), False)]
+        if any(name != "ota_data" for _, name, _ in differ):
+            self.log(f"[{device_id}] Installed firmware differs: {', '.join(name for _, name, _ in differ)}")
+            return False
+        if differ:
+            offset, _, path = differ[0]
+            self.log(f"[{device_id}] Firmware up to date, selecting the CircuitPython slot in OTA data")
+            session.write_flash([(offset, path)], FLASH_MODE, FLASH_FREQ, FLASH_SIZE, reset=False)
+        return True
+    
+    def skip_up_to_date(self, result, version):
+        """Mark the flashing stages (with "skip", also the code copy) as not needed"""
+        result.up_to_date = True
+        result.skip_stages = [name for name, _ in self.recovery_stages() if name != "identify"]
+        if self.up_to_date == "code":
+            result.skip_stages.remove("code")
+            self.log(f"[{result.device_id}] Firmware up to date ({version}), only copying the sample code", "SUCCESS")
+        else:
+            self.log(f"[{result.device_id}] Firmware up to date ({version}), leaving the board as it is", "SUCCESS")
+    
+    def flash_merged_image(self, device_port, device_id, session):
+        """Write bootloader, partition table, OTA data, CircuitPython and TinyUF2 in one pass"""
+        self.log(f"[{device_id}] Flashing merged image (TinyUF2 + CircuitPython)...")
+        
+        try:
+            images = [(offset, path) for offset, _, path in self.written_regions()]
+            if self.refresh:
+                # Region by region, so nvs and ota_1 keep their contents
+                images = self.changed_regions(session, device_id, images)
+                if not images:
+                    self.log(f"[{device_id}] Merged image already on the device, nothing to write", "SUCCESS")
+                    return True
+                self.log(f"[{device_id}] Running: write_flash {' '.join(offset for offset, _ in images)} ({session.name} esptool)")
             else:
-                self.log(f"[{device_id}] Flash erase failed: {result.stderr}", "ERROR")
-                return False
-                
+                self.log(f"[{device_id}] Running: write_flash 0x0 {self.merged_image.name} ({self.merged_image.short_hash}, {session.name} esptool)")
+            session.write_flash(images, FLASH_MODE, FLASH_FREQ, FLASH_SIZE, reset=not self.verify)
+            self.log(f"[{device_id}] Merged image flashed successfully!", "SUCCESS")
+            return True
+        except EsptoolError as e:
+            self.log(f"[{device_id}] Merged image flash failed: {e}", "ERROR")
+            return False
         except Exception as e:
-            self.log(f"[{device_id}] Error during flash erase: {e}", "ERROR")
+            self.log(f"[{device_id}] Error during merged image flash: {e}", "ERROR")
             return False
     
-    def flash_tinyuf2(self, device_port, device_id):
+    def flash_tinyuf2(self, device_port, device_id, session=None):
         """Flash TinyUF2 bootloader"""
         self.log(f"[{device_id}] Flashing TinyUF2...")
         
-        esptool_cmd = self.find_esptool()
-        if not esptool_cmd:
-            self.log("esptool not found!", "ERROR")
-            return False
-        
         try:
-            # Change to TinyUF2 directory
-            original_cwd = os.getcwd()
-            os.chdir(TINYUF2_DIR)
+            owns_session = session is None
+            if owns_session:
+                session = self.open_esptool(device_port, device_id)
             
-            cmd = esptool_cmd + [
-                '--chip', 'esp32s3', '-p', device_port, '-b', BAUD_RATE,
-                '--before=default_reset', '--after=hard_reset',
-                'write_flash', '--flash_mode', FLASH_MODE, '--flash_freq', FLASH_FREQ, 
-                '--flash_size', FLASH_SIZE,
-                '0x8000', TINYUF2_PARTITION_TABLE,
-                '0xe000', TINYUF2_OTA_DATA,
-                '0x0', TINYUF2_BOOTLOADER,
-                '0x410000', TINYUF2_BINARY
-            ]
-            
-            self.log(f"Running: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            images = self.tinyuf2_images()
+            if self.refresh:
+                images = self.changed_regions(session, device_id, images)
+                if not images:
+                    self.log(f"[{device_id}] All TinyUF2 regions already match, nothing to write", "SUCCESS")
+                    if owns_session:
+                        session.close()
+                    return True
             
-            # Change back to original directory
-            os.chdir(original_cwd)
+            # Paths are in the artifact store, or relative to the TinyUF2
+            # directory; the drivers resolve those with cwd= instead of
+            # os.chdir() so worker threads stay safe
+            self.log(f"[{device_id}] Running: write_flash ({session.name} esptool)")
+            session.write_flash(images, FLASH_MODE, FLASH_FREQ, FLASH_SIZE, cwd=TINYUF2_DIR,
+                                reset=owns_session or not self.verify)
+            if owns_session:
+                session.close()
             
-            if result.returncode == 0:
-                self.log(f"[{device_id}] TinyUF2 flashed successfully!", "SUCCESS")
+            self.log(f"[{device_id}] TinyUF2 flashed successfully!", "SUCCESS")
+            if not self.device_monitor.event_driven and not self.verify:
                 time.sleep(2)
-                return True
-            else:
-                self.log(f"[{device_id}] TinyUF2 flash failed: {result.stderr}", "ERROR")
-                return False
-                
+            return True
+        
+        except EsptoolError as e:
+            self.log(f"[{device_id}] TinyUF2 flash failed: {e}", "ERROR")
+            return False
         except Exception as e:
             self.log(f"[{device_id}] Error during TinyUF2 flash: {e}", "ERROR")
             return False
     
-    def wait_for_volume(self, volume_name, max_attempts=30):
+    def verify_flash(self, result, session):
+        """Compare every written region with its image using MD5s computed on the chip
+        
+        The per-region outcome is stored in result.verified for the summary.
+        """
+        device_id = result.device_id
+        self.log(f"[{device_id}] Verifying written flash regions (on-chip MD5)...")
+        regions = self.written_regions()
+        
+        try:
+            matches = session.verify_regions([(offset, path) for offset, _, path in regions],
+                                             FLASH_MODE, FLASH_FREQ, FLASH_SIZE, cwd=TINYUF2_DIR)
+        except EsptoolError as e:
+            self.log(f"[{device_id}] Flash verification failed: {e}", "ERROR")
+            return False
+        
+        for offset, name, _ in regions:
+            result.verified[name] = matches.get(int(offset, 16), False)
+            state = "OK" if result.verified[name] else "MISMATCH"
+            self.log(f"[{device_id}]   {offset:>9} {name}: {state}", "INFO" if result.verified[name] else "ERROR")
+        
+        failed = [name for name, passed in result.verified.items() if not passed]
+        if failed:
+            self.log(f"[{device_id}] Flash contents differ from the images: {', '.join(failed)}", "ERROR")
+            return False
+        self.log(f"[{device_id}] All {len(regions)} flash region(s) verified!", "SUCCESS")
+        return True
+    
+    def volume_candidates(self, volume_name, usb_port=None):
+        """Return the mount paths a volume with the given label may appear at
+        
+        On Linux the mount table is searched for the label. With usb_port, only
+        the volume of the board on that physical USB port is returned.
+        """
+        if self.is_linux:
+            mounts = find_volume_mounts(volume_name)
+            if usb_port:
+                return [mount for mount, device in mounts if block_usb_port(device) == usb_port]
+            if mounts:
+                return [mount for mount, _ in mounts]
+        
+        if self.is_macos:
+            base = Path("/Volumes")
+        elif self.is_linux:
+            base = Path(f"/media/{os.getenv('USER', 'user')}")
+        elif self.is_windows:
+            return [f"{volume_name}:\\"]
+        else:
+            base = Path("/mnt")
+        
+        # Several boards attached at once mount as DN_BOOT, DN_BOOT1 or "DN_BOOT 1"
+        candidates = [str(base / volume_name)]
+        for path in sorted(base.glob(f"{volume_name}*")):
+            suffix = path.name[len(volume_name):].strip()
+            if suffix.isdigit():
+                candidates.append(str(path))
+        return candidates
+    
+    def wait_for_volume(self, volume_name, max_attempts=30, device_id=None, usb_port=None):
         """Wait for a volume to appear"""
-        self.log(f"Waiting for {volume_name} volume...")
-        
-        for i in range(max_attempts):
-            if self.is_macos:
-                volume_path = f"/Volumes/{volume_name}"
-            elif self.is_linux:
-                volume_path = f"/media/{os.getenv('USER', 'user')}/{volume_name}"
-            elif self.is_windows:
-                volume_path = f"{volume_name}:\\"
-            else:
-                volume_path = f"/mnt/{volume_name}"
-            
-            if Path(volume_path).exists():
-                self.log(f"{volume_name} volume found!", "SUCCESS")
-                return volume_path
-            
-            time.sleep(2)
+        prefix = f"[{device_id}] " if device_id else ""
+        self.log(f"{prefix}Waiting for {volume_name} volume...")
+        
+        def find_volume():
+            for volume_path in self.volume_candidates(volume_name, usb_port):
+                if Path(volume_path).exists():
+                    return volume_path
+            return None
         
-        self.log(f"{volume_name} volume did not appear", "ERROR")
+        # Re-checked on every device/mount event, or every 2 s when polling
+        volume_path = self.device_monitor.wait_until(find_volume, timeout=max_attempts * 2)
+        if volume_path:
+            self.log(f"{prefix}{volume_name} volume found at {volume_path}", "SUCCESS")
+            return volume_path
+        
+        self.log(f"{prefix}{volume_name} volume did not appear", "ERROR")
         return None
     
-    def flash_circuitpython(self, device_id):
+    def flash_circuitpython(self, device_id, usb_port=None):
         """Flash CircuitPython firmware"""
         self.log(f"[{device_id}] Flashing CircuitPython...")
         
         # Wait for DN_BOOT volume
-        volume_path = self.wait_for_volume("DN_BOOT")
+        volume_path = self.wait_for_volume("DN_BOOT", device_id=device_id, usb_port=usb_port)
         if not volume_path:
             self.log(f"[{device_id}] DN_BOOT volume not found", "ERROR")
             return False
         
         # Copy CircuitPython UF2 to volume
         try:
+            uf2_source = self.artifacts["circuitpython_uf2"].path if "circuitpython_uf2" in self.artifacts else CIRCUITPYTHON_UF2
             uf2_dest = Path(volume_path) / Path(CIRCUITPYTHON_UF2).name
-            shutil.copy2(CIRCUITPYTHON_UF2, uf2_dest)
+            shutil.copy2(uf2_source, uf2_dest)
             self.log(f"[{device_id}] CircuitPython UF2 copied successfully!", "SUCCESS")
         except Exception as e:
             self.log(f"[{device_id}] Failed to copy CircuitPython UF2: {e}", "ERROR")
@@ -419,10 +1176,13 @@ class DNKeyProRecovery:
         
         # Wait for device to reboot with CircuitPython
         self.log(f"[{device_id}] Waiting for device to reboot with CircuitPython...")
-        time.sleep(8)
+        if not (usb_port and self.device_monitor.event_driven):
+            # Without events a DN-S3-PY volume of another board could be
+            # mistaken for this one, give the reboot time to happen
+            time.sleep(8)
         
         # Wait for DN-S3-PY volume
-        volume_path = self.wait_for_volume("DN-S3-PY")
+        volume_path = self.wait_for_volume("DN-S3-PY", device_id=device_id, usb_port=usb_port)
         if not volume_path:
             self.log(f"[{device_id}] DN-S3-PY volume not found", "ERROR")
             return False
@@ -430,16 +1190,22 @@ class DNKeyProRecovery:
         self.log(f"[{device_id}] CircuitPython installed successfully!", "SUCCESS")
         return True
     
-    def copy_sample_code(self, device_id):
-        """Copy sample code to the device"""
+    def copy_sample_code(self, device_id, usb_port=None, result=None):
+        """Copy sample code (or sync the app directory) to the device"""
         self.log(f"[{device_id}] Copying sample code...")
         
+        if self.code_transport == "repl":
+            return self.deploy_repl(device_id, usb_port, result)
+        
         # Find DN-S3-PY volume
-        volume_path = self.wait_for_volume("DN-S3-PY")
+        volume_path = self.wait_for_volume("DN-S3-PY", device_id=device_id, usb_port=usb_port)
         if not volume_path:
             self.log(f"[{device_id}] DN-S3-PY volume not found", "ERROR")
             return False
         
+        if self.sample_app:
+            return self.deploy_app(device_id, volume_path, result)
+        
         try:
             code_dest = Path(volume_path) / "code.py"
             shutil.copy2(SAMPLE_CODE, code_dest)
@@ -449,10 +1215,405 @@ class DNKeyProRecovery:
             self.log(f"[{device_id}] Failed to copy sample code: {e}", "ERROR")
             return False
     
-    def comprehensive_recovery(self):
-        """Execute comprehensive recovery procedure"""
-        self.log("=== DN-KEY Pro Comprehensive Recovery ===")
+    def prepare_app(self):
+        """Hash the app directory once per run, compiling its modules with --mpy"""
+        try:
+            self.app_files = scan_app(self.sample_app)
+        except (OSError, DeployError) as e:
+            self.log(f"Failed to read app directory {self.sample_app}: {e}", "ERROR")
+            return False
+        if self.compile_mpy:
+            target = target_circuitpython(self.artifacts["circuitpython_uf2"].path)
+            compiler = MpyCompiler(self.mpy_cross, Path(CACHE_DIR) / "mpy", target)
+            try:
+                self.log(f"Compiling app modules with {compiler.check()}")
+                self.app_files = compile_app(self.app_files, compiler)
+                self.log(f"✓ {compiler.compiled} module(s) compiled, {compiler.cached} from the cache")
+            except MpyCrossUnavailable as e:
+                self.log(f"Skipping .mpy compilation: {e}; deploying .py sources", "WARNING")
+            except (OSError, DeployError) as e:
+                self.log(f"Failed to compile app modules: {e}", "ERROR")
+                return False
+        total = sum(entry["size"] for entry in self.app_files.values())
+        self.log(f"✓ App {Path(self.sample_app).name}: {len(self.app_files)} file(s), {total / 1024:.1f} KiB")
+        return True
+    
+    def deploy_app(self, device_id, volume_path, result=None):
+        """Sync SAMPLE_APP to the volume, copying only what changed since the last deploy"""
+        try:
+            sync = sync_app(self.sample_app, volume_path, self.app_files)
+        except (OSError, DeployError) as e:
+            self.log(f"[{device_id}] Failed to deploy {self.sample_app}: {e}", "ERROR")
+            return False
+        if result is not None:
+            result.stage_bytes["code"] = sync.bytes_copied
+        self.log(f"[{device_id}] {Path(self.sample_app).name} deployed: {sync.summary()}", "SUCCESS")
+        return True
+    
+    def deploy_repl(self, device_id, usb_port=None, result=None):
+        """Write the sample code (or sync the app) over the CircuitPython raw REPL"""
+        self.log(f"[{device_id}] Waiting for the CircuitPython console...")
+        # Without a USB port (macOS, Windows) only a single board can be told apart
+        ports = self.device_monitor.wait_until(lambda: find_repl_ports(usb_port), timeout=60)
+        if not ports or (usb_port is None and len(ports) > 1):
+            self.log(f"[{device_id}] CircuitPython console not found" if not ports else
+                     f"[{device_id}] Several CircuitPython consoles ({', '.join(ports)}), can't pick this board's",
+                     "ERROR")
+            return False
+        
+        if usb_port is not None and self.is_linux:
+            try:
+                ejected = eject_drive(usb_port)
+                if ejected:
+                    self.log(f"[{device_id}] Ejected {', '.join(ejected)} so CircuitPython can write to it")
+            except DeployError as e:
+                self.log(f"[{device_id}] Could not eject the DN-S3-PY drive: {e}", "WARNING")
         
+        if self.sample_app:
+            app_dir, files, prune = self.sample_app, self.app_files, True
+        else:
+            app_dir, prune = Path(SAMPLE_CODE).parent, False
+            files = {"code.py": {"sha256": sha256_file(SAMPLE_CODE), "size": os.path.getsize(SAMPLE_CODE),
+                                 "source": SAMPLE_CODE}}
+        repl = None
+        try:
+            repl = RawRepl(ports[0])
+            repl.enter()
+            sync = sync_app_repl(app_dir, repl, files, prune=prune)
+        except (OSError, DeployError) as e:
+            self.log(f"[{device_id}] Raw REPL deploy failed: {e}", "ERROR")
+            return False
+        finally:
+            if repl is not None:
+                repl.leave()
+        if result is not None:
+            result.stage_bytes["code"] = sync.bytes_copied
+        name = Path(app_dir).name if self.sample_app else "Sample code"
+        self.log(f"[{device_id}] {name} written over the raw REPL: {sync.summary()} "
+                 f"in {sync.duration:.1f}s", "SUCCESS")
+        return True
+    
+    def device_id_for_port(self, device_port):
+        """Short device label: end of the board's MAC or USB serial number, else from the port name"""
+        serial = usb_serial_number(device_port)
+        mac = mac_from_usb_serial(serial) or self.identities.get(serial)
+        if mac:
+            return mac.replace(":", "")[-6:]
+        if serial:
+            return serial[-6:]
+        return Path(device_port).name.replace('cu.usbmodem', '').replace('ttyUSB', '').replace('ttyACM', '').replace('COM', '')
+    
+    def identify_from_usb(self, result):
+        """Fill in the MAC from USB metadata, without opening the port
+        
+        The USB-Serial/JTAG serial number is the MAC itself; other serial
+        numbers are looked up in the identity cache.
+        """
+        result.usb_serial = usb_serial_number(result.device_port)
+        mac = mac_from_usb_serial(result.usb_serial) or self.identities.get(result.usb_serial)
+        if mac:
+            result.mac = mac
+        return mac
+    
+    def learn_mac(self, result):
+        """Adopt a MAC the flashing session picked up, and cache it for the USB serial"""
+        session = result.session
+        mac = getattr(session, "mac", None)
+        if result.mac != "unknown" or not mac:
+            return
+        result.mac = mac
+        self.log(f"[{result.device_id}] Device MAC: {result.mac} (from the flashing session)")
+        try:
+            self.identities.learn(result.usb_serial, mac, serial_by_id(result.device_port))
+        except OSError as e:
+            self.log(f"[{result.device_id}] Could not save device identity: {e}", "WARNING")
+    
+    def new_result(self, device_port):
+        """Create the DeviceResult that tracks one device through the stages"""
+        return DeviceResult(device_port, self.device_id_for_port(device_port))
+    
+    def stage_identify(self, result):
+        """Pipeline stage: identify the board and open its flashing session
+        
+        The MAC comes from the USB serial number or the identity cache when
+        possible. Otherwise the in-process session reads it over the
+        connection it opens anyway, and the subprocess driver picks it up
+        from the output of the first flashing command.
+        """
+        self.log(f"Processing device: {result.device_id} ({result.device_port})")
+        if self.up_to_date != "reflash" and self.target_firmware:
+            installed = self.installed_version(result)
+            if installed == self.target_firmware:
+                # Already running CircuitPython: no ROM bootloader session needed
+                self.skip_up_to_date(result, installed)
+                return True
+            if installed:
+                self.log(f"[{result.device_id}] Board runs {installed}, reflashing")
+        
+        if self.identify_from_usb(result):
+            self.log(f"[{result.device_id}] Device MAC: {result.mac} (USB serial number)")
+        session = self.esptool_session(result)
+        if result.mac == "unknown" and session.name != "subprocess":
+            self.get_device_mac(result.device_port, session)
+            self.learn_mac(result)
+        if result.mac == "unknown":
+            self.log(f"[{result.device_id}] MAC not known yet, it will be read while flashing")
+        else:
+            self.select_baud(result)
+            if self.resume:
+                result.resume_stages = self.checkpoints.completed_stages(result.mac, self.artifact_hashes(), self.mode_name())
+                if result.resume_stages:
+                    self.log(f"[{result.device_id}] Resuming from checkpoint, already done: {', '.join(result.resume_stages)}")
+        
+        if self.up_to_date != "reflash" and self.firmware_regions and not result.resume_stages:
+            try:
+                if self.firmware_on_flash(result, session):
+                    self.skip_up_to_date(result, self.target_firmware or "flash contents match")
+            except EsptoolError as e:
+                self.log(f"[{result.device_id}] Firmware check failed ({e}), reflashing", "WARNING")
+        return True
+    
+    def stage_erase(self, result):
+        """Pipeline stage: erase the whole flash"""
+        if self.refresh:
+            # write_flash erases only the sectors it rewrites
+            self.log(f"[{result.device_id}] Refresh mode: skipping full-chip erase")
+            return True
+        return self.erase_device(result.device_port, result.device_id, self.esptool_session(result))
+    
+    def stage_bootloader(self, result):
+        """Pipeline stage: write bootloader, partition table and TinyUF2"""
+        session = self.esptool_session(result)
+        written = session.bytes_written
+        if self.merged:
+            ok = self.flash_merged_image(result.device_port, result.device_id, session)
+        else:
+            ok = self.flash_tinyuf2(result.device_port, result.device_id, session)
+        result.stage_bytes["bootloader"] = session.bytes_written - written
+        
+        if self.last_serial_stage() == "bootloader":
+            # Reboot into TinyUF2 and free the port
+            self.close_esptool_session(result, reset=ok)
+        return ok
+    
+    def stage_verify(self, result):
+        """Pipeline stage: check the written regions before the board leaves the bootloader"""
+        ok = self.verify_flash(result, self.esptool_session(result))
+        
+        # Reboot into TinyUF2 (or CircuitPython with --merged) and free the port
+        self.close_esptool_session(result, reset=ok)
+        return ok
+    
+    def stage_uf2(self, result):
+        """Pipeline stage: install CircuitPython through the DN_BOOT volume"""
+        if self.merged:
+            # Already written by the merged image, the board boots straight into it
+            self.log(f"[{result.device_id}] CircuitPython written with the merged image, skipping DN_BOOT copy")
+            return True
+        ok = self.flash_circuitpython(result.device_id, result.usb_port)
+        if ok:
+            result.stage_bytes["uf2"] = os.path.getsize(CIRCUITPYTHON_UF2)
+        return ok
+    
+    def stage_code(self, result):
+        """Pipeline stage: copy the sample code, a failure is only a warning"""
+        if not self.copy_sample_code(result.device_id, result.usb_port, result):
+            self.log(f"[{result.device_id}] Sample code copy failed", "WARNING")
+            result.warnings.append("code copy")
+        elif not self.sample_app:
+            result.stage_bytes["code"] = os.path.getsize(SAMPLE_CODE)
+        return True
+    
+    def recovery_stages(self):
+        """Ordered (name, stage function) pairs run for every device"""
+        stages = [
+            ("identify", self.stage_identify),
+            ("erase", self.stage_erase),
+            ("bootloader", self.stage_bootloader),
+            ("uf2", self.stage_uf2),
+            ("code", self.stage_code),
+        ]
+        if self.verify:
+            stages.insert(3, ("verify", self.stage_verify))
+        return stages
+    
+    def last_serial_stage(self):
+        """Stage that resets the board out of the ROM bootloader and frees its port"""
+        return "verify" if self.verify else "bootloader"
+    
+    def run_stage(self, name, stage, result):
+        """Run one stage for a device, recording its duration and any failure"""
+        if name in result.resume_stages:
+            self.log(f"[{result.device_id}] {name} stage already completed, skipping")
+            if name == self.last_serial_stage():
+                # Reboot the board into its firmware
+                self.close_esptool_session(result)
+            return True
+        if name in result.skip_stages:
+            if name == self.last_serial_stage():
+                self.close_esptool_session(result)
+            return True
+        
+        result.stage = name
+        limited = name in SERIAL_STAGES
+        if limited and not self.limiter.acquire(result.hub, blocking=False):
+            where = f"hub {result.hub}" if result.hub else "all hubs"
+            self.log(f"[{result.device_id}] Waiting for a free {name} slot ({where})")
+            self.limiter.acquire(result.hub)
+        started = time.monotonic()
+        try:
+            ok = stage(result)
+        except Exception as e:
+            self.log(f"[{result.device_id}] Unexpected error in {name} stage: {e}", "ERROR")
+            ok = False
+        finally:
+            if limited:
+                self.limiter.release(result.hub)
+        result.stage_times[name] = time.monotonic() - started
+        if result.session is not None:
+            self.learn_mac(result)
+            self.record_baud_fallbacks(result)
+        self.run_log.stage(result, name, ok, result.stage_times[name],
+                           baud=result.baud if name in SERIAL_STAGES else None)
+        
+        if not ok:
+            self.log(f"[{result.device_id}] {STAGE_FAILURES.get(name, name)} failed - skipping device", "ERROR")
+            self.close_esptool_session(result, reset=False)
+            result.fail(name)
+            self.run_log.device(result)
+        elif name in CHECKPOINT_STAGES and result.mac != "unknown":
+            try:
+                self.checkpoints.stage_done(result.mac, name, self.artifact_hashes(), self.mode_name())
+            except OSError as e:
+                self.log(f"[{result.device_id}] Could not save checkpoint: {e}", "WARNING")
+        return ok
+    
+    def needs_volume_lock(self, name, result):
+        """Boards without a known USB port can't tell their volumes apart"""
+        if result.usb_port or name not in VOLUME_STAGES:
+            return False
+        return not (name == "code" and self.code_transport == "repl")
+    
+    def recover_device(self, device_port, use_volume_lock=False, result=None):
+        """Run every recovery stage for one device and return a DeviceResult"""
+        if result is None:
+            result = self.new_result(device_port)
+        
+        holding_volume_lock = False
+        try:
+            for name, stage in self.recovery_stages():
+                if use_volume_lock and not holding_volume_lock and self.needs_volume_lock(name, result):
+                    self.log(f"[{result.device_id}] Waiting for mass-storage stage...")
+                    self.volume_lock.acquire()
+                    holding_volume_lock = True
+                
+                if not self.run_stage(name, stage, result):
+                    return result
+        finally:
+            if holding_volume_lock:
+                self.volume_lock.release()
+        
+        return self.finish_device(result)
+    
+    def finish_device(self, result):
+        """Mark a device as recovered and record which artifacts it received"""
+        self.log(f"[{result.device_id}] Device recovery completed successfully!", "SUCCESS")
+        result.complete()
+        self.run_log.device(result)
+        try:
+            self.artifact_store.record_provisioning({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "device_id": result.device_id,
+                "port": result.device_port,
+                "mac": result.mac,
+                "mode": self.mode_name(),
+                "artifacts": self.artifact_hashes(),
+                "up_to_date": result.up_to_date,
+                "warnings": result.warnings,
+            })
+            if result.mac != "unknown":
+                self.checkpoints.clear(result.mac)
+        except OSError as e:
+            self.log(f"[{result.device_id}] Could not record provisioning: {e}", "WARNING")
+        return result
+    
+    def recover_device_safe(self, device_port, use_volume_lock=False, result=None):
+        """recover_device() for worker threads: never raises, always returns a result"""
+        try:
+            return self.recover_device(device_port, use_volume_lock, result)
+        except Exception as e:
+            device_id = self.device_id_for_port(device_port)
+            self.log(f"[{device_id}] Unexpected error: {e}", "ERROR")
+            if result is None:
+                result = self.new_result(device_port)
+            self.close_esptool_session(result, reset=False)
+            result.fail("exception")
+            self.run_log.device(result)
+            return result
+    
+    def print_summary_table(self, results):
+        """Print one row per device with its outcome and duration"""
+        header = f"{'Device':<10} {'Port':<24} {'MAC':<18} {'Result':<8} {'Notes':<14} {'Time':>8}"
+        rows = []
+        for result in results:
+            status = "OK" if result.success else "FAILED"
+            if result.success and result.warnings:
+                status = "WARN"
+            stage = result.failed_stage or ", ".join(result.warnings) or ("up to date" if result.up_to_date else "-")
+            rows.append(f"{result.device_id:<10} {result.device_port:<24} {result.mac:<18} {status:<8} {stage:<14} {result.duration:>7.1f}s")
+        
+        self.log(header)
+        self.log("-" * len(header))
+        for row in rows:
+            self.log(row)
+        
+        if any(result.verified for result in results):
+            self.print_verification_table(results)
+    
+    def print_verification_table(self, results):
+        """Print pass/fail of every verified flash region per device"""
+        regions = []
+        for result in results:
+            regions += [name for name in result.verified if name not in regions]
+        header = (f"{'Device':<10} " + " ".join(f"{name:<16}" for name in regions)).rstrip()
+        self.log("Flash verification (on-chip MD5):")
+        self.log(header)
+        self.log("-" * len(header))
+        for result in results:
+            states = []
+            for name in regions:
+                passed = result.verified.get(name)
+                states.append(f"{'-' if passed is None else 'PASS' if passed else 'FAIL':<16}")
+            self.log((f"{result.device_id:<10} " + " ".join(states)).rstrip())
+    
+    def report_run(self, results, wall_time):
+        """Write the run summary record and print stage latency percentiles"""
+        summary = run_summary(results, wall_time)
+        self.run_log.write(summary, flush=True)
+        if not summary["stages"]:
+            return summary
+        
+        columns = "".join(f"{f'p{pct}':>8}" for pct in PERCENTILES)
+        header = f"{'Stage':<12} {'Runs':>5}{columns}{'Max':>8} {'Throughput':>12}"
+        self.log("Stage latency (seconds):")
+        self.log(header)
+        self.log("-" * len(header))
+        for name, _ in self.recovery_stages():
+            stage = summary["stages"].get(name)
+            if stage is None:
+                continue
+            values = "".join(f"{stage[f'p{pct}']:>8.2f}" for pct in PERCENTILES)
+            rate = stage["bytes_per_second"]
+            throughput = f"{rate / 1024:.0f} KiB/s" if rate else "-"
+            self.log(f"{name:<12} {stage['count']:>5}{values}{stage['max']:>8.2f} {throughput:>12}")
+        if summary["devices_per_hour"]:
+            self.log(f"Throughput: {summary['devices_per_hour']:.0f} device(s)/hour, "
+                     f"{summary['bytes'] / 1024 / 1024:.1f} MiB written")
+        self.run_log.flush()
+        return summary
+    
+    def prepare_recovery(self):
+        """Check configuration and dependencies and load firmware, shared by every mode"""
         # Step 1: Check configuration
         if not self.check_configuration():
             return False
@@ -461,6 +1622,41 @@ class DNKeyProRecovery:
         if not self.check_dependencies():
             self.log("Some dependencies are missing. Please install them first.", "WARNING")
         
+        if not self.import_artifacts():
+            return False
+        
+        if self.merged and not self.prepare_merged_image():
+            return False
+        
+        self.prepare_firmware_check()
+        
+        if self.sample_app and not self.prepare_app():
+            return False
+        
+        if self.device_monitor.start():
+            self.log("Watching USB device and mount events")
+        return True
+    
+    def recover_devices(self, devices, parallel=False, max_workers=MAX_CONCURRENT_DEVICES, pipeline=False):
+        """Recover the given ports with the selected scheduler, return their DeviceResults"""
+        devices = self.order_by_hub(devices)
+        if pipeline:
+            self.log(f"Recovering {len(devices)} device(s) through the stage pipeline")
+            return RecoveryPipeline(self).run(devices)
+        if parallel and len(devices) > 1:
+            workers = max(1, min(max_workers, len(devices)))
+            self.log(f"Recovering {len(devices)} device(s) in parallel ({workers} at a time)")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(lambda port: self.recover_device_safe(port, use_volume_lock=True), devices))
+        return [self.recover_device_safe(device_port) for device_port in devices]
+    
+    def comprehensive_recovery(self, parallel=False, max_workers=MAX_CONCURRENT_DEVICES, pipeline=False):
+        """Execute comprehensive recovery procedure"""
+        self.log("=== DN-KEY Pro Comprehensive Recovery ===")
+        
+        if not self.prepare_recovery():
+            return False
+        
         # Step 3: Detect devices
         devices = self.detect_devices()
         if not devices:
@@ -468,41 +1664,16 @@ class DNKeyProRecovery:
             return False
         
         # Step 4: Process each device
-        success_count = 0
-        for device_port in devices:
-            device_id = Path(device_port).name.replace('cu.usbmodem', '').replace('ttyUSB', '').replace('ttyACM', '').replace('COM', '')
-            
-            self.log(f"Processing device: {device_id} ({device_port})")
-            
-            # Get device MAC
-            device_mac = self.get_device_mac(device_port)
-            if device_mac != "unknown":
-                self.log(f"Device MAC: {device_mac}")
-            
-            # Step 4a: Erase device
-            if not self.erase_device(device_port, device_id):
-                self.log(f"[{device_id}] Erase failed - skipping device", "ERROR")
-                continue
-            
-            # Step 4b: Flash TinyUF2
-            if not self.flash_tinyuf2(device_port, device_id):
-                self.log(f"[{device_id}] TinyUF2 flash failed - skipping device", "ERROR")
-                continue
-            
-            # Step 4c: Flash CircuitPython
-            if not self.flash_circuitpython(device_id):
-                self.log(f"[{device_id}] CircuitPython flash failed - skipping device", "ERROR")
-                continue
-            
-            # Step 4d: Copy sample code
-            if not self.copy_sample_code(device_id):
-                self.log(f"[{device_id}] Sample code copy failed", "WARNING")
-            
-            success_count += 1
-            self.log(f"[{device_id}] Device recovery completed successfully!", "SUCCESS")
+        run_started = time.monotonic()
+        results = self.recover_devices(devices, parallel, max_workers, pipeline)
+        success_count = sum(1 for result in results if result.success)
         
         # Final summary
         self.log("=== Recovery Summary ===")
+        self.print_summary_table(results)
+        wall_time = time.monotonic() - run_started
+        self.report_run(results, wall_time)
+        self.log(f"Total time: {wall_time:.1f}s")
         self.log(f"Successfully recovered: {success_count} out of {len(devices)} device(s)", "SUCCESS")
         
         if success_count > 0:
@@ -513,34 +1684,314 @@ class DNKeyProRecovery:
             self.log("Please check the log file for detailed error information.", "INFO")
         
         return success_count > 0
+    
+    def provisioning_daemon(self, max_jobs=MAX_CONCURRENT_DEVICES):
+        """Hot-plug mode: provision boards as they are attached until Ctrl+C"""
+        self.log("=== DN-KEY Pro Provisioning Daemon ===")
+        
+        if not self.prepare_recovery():
+            return False
+        
+        return ProvisioningDaemon(self, max_jobs).run()
+
+class RecoveryPipeline:
+    """Staged recovery: every stage has its own queue and worker threads
+
+    Devices flow detect -> identify -> erase -> bootloader (-> verify) -> uf2 -> code, so
+    one board can be erasing while another waits for its DN_BOOT volume.
+    """
+
+    def __init__(self, recovery, stage_workers=None):
+        self.recovery = recovery
+        self.stage_workers = dict(PIPELINE_STAGE_WORKERS)
+        if stage_workers:
+            self.stage_workers.update(stage_workers)
+        self.stages = recovery.recovery_stages()
+        self.queues = [queue.Queue() for _ in self.stages]
+        self.results = []
+        self.results_lock = threading.Lock()
+
+    def _worker(self, index):
+        name, stage = self.stages[index]
+        jobs = self.queues[index]
+        while True:
+            result = jobs.get()
+            if result is None:
+                return
+            if self.recovery.needs_volume_lock(name, result):
+                with self.recovery.volume_lock:
+                    ok = self.recovery.run_stage(name, stage, result)
+            else:
+                ok = self.recovery.run_stage(name, stage, result)
+            if not ok:
+                continue
+            if index + 1 < len(self.stages):
+                self.queues[index + 1].put(result)
+            else:
+                self.recovery.finish_device(result)
+
+    def run(self, devices):
+        """Push every detected port through the pipeline, return the results"""
+        threads = []
+        for index, (name, _) in enumerate(self.stages):
+            workers = max(1, min(self.stage_workers.get(name, 1), len(devices)))
+            stage_threads = [
+                threading.Thread(target=self._worker, args=(index,), name=f"{name}-{n}", daemon=True)
+                for n in range(workers)
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        # detect stage: feed the first queue
+        results = []
+        for device_port in devices:
+            result = self.recovery.new_result(device_port)
+            results.append(result)
+            self.queues[0].put(result)
+
+        # Shut the stages down in order once all upstream work has drained
+        for index, stage_threads in enumerate(threads):
+            for _ in stage_threads:
+                self.queues[index].put(None)
+            for thread in stage_threads:
+                thread.join()
+
+        return results
+
+
+class ProvisioningDaemon:
+    """Hot-plug mode: provision every ESP32-S3 port as soon as it is attached
+
+    Boards are tracked by their physical USB port (by port name where that is
+    unknown). A port is claimed when its ROM bootloader shows up and stays
+    claimed through the re-enumerations of the recovery and until the board is
+    unplugged, so a finished board is never provisioned twice and the next
+    board plugged into the same port is picked up straight away.
+    """
+
+    def __init__(self, recovery, max_jobs=MAX_CONCURRENT_DEVICES):
+        self.recovery = recovery
+        self.max_jobs = max(1, max_jobs)
+        self.claimed = {}
+        self.futures = {}
+        self.ignored = set()
+        self.results = []
+        self.lock = threading.Lock()
+        self.interactive = sys.stdout.isatty()
+        self.drawn_lines = 0
+        self.last_states = None
+        self.started = time.monotonic()
+
+    def attached(self, result, ports):
+        """True while the board behind a finished job is still plugged in"""
+        if result.usb_port:
+            return usb_port_present(result.usb_port)
+        return result.device_port in ports
+
+    def scan(self, pool):
+        """Release unplugged boards and start a job for every new bootloader port"""
+        ports = self.recovery.scan_ports()
+        with self.lock:
+            for key, result in list(self.claimed.items()):
+                if result.finished is not None and not self.attached(result, ports):
+                    del self.claimed[key]
+                    del self.futures[key]
+            self.ignored &= set(ports)
+
+            for device_port in ports:
+                key = tty_usb_port(device_port) or device_port
+                if key in self.claimed or device_port in self.ignored:
+                    continue
+                ids = tty_usb_ids(device_port)
+                if ids is None or ids[0] != ESPRESSIF_USB_VID:
+                    # Boards already running TinyUF2/CircuitPython, other
+                    # serial devices, or ports whose USB IDs can't be read
+                    self.ignored.add(device_port)
+                    usb_id = f"USB {ids[0]:04x}:{ids[1]:04x}" if ids else "unknown USB ID"
+                    self.recovery.log(f"Ignoring {device_port} ({usb_id}, not an ESP32-S3 bootloader port)")
+                    continue
+                result = self.recovery.new_result(device_port)
+                self.claimed[key] = result
+                self.recovery.log(f"[{result.device_id}] New board on {device_port} ({key})")
+                self.futures[key] = pool.submit(self.provision, result)
+
+    def provision(self, result):
+        """Worker: run every recovery stage for one newly attached board"""
+        time.sleep(DAEMON_SETTLE_TIME)
+        result.started = time.monotonic()
+        self.recovery.recover_device_safe(result.device_port, use_volume_lock=True, result=result)
+        with self.lock:
+            self.results.append(result)
+        # Wake the main loop so the status line updates right away
+        self.recovery.device_monitor.notify()
+        return result
+
+    def port_state(self, result):
+        if result.finished is None:
+            return result.stage or "queued"
+        if not result.success:
+            return f"FAILED at {result.failed_stage}"
+        if result.warnings:
+            return f"done, warnings: {', '.join(result.warnings)}"
+        return "done - unplug"
+
+    def status_lines(self):
+        """One header line plus one line per claimed port"""
+        with self.lock:
+            claimed = sorted(self.claimed.items())
+            succeeded = sum(1 for result in self.results if result.success)
+            failed = len(self.results) - succeeded
+        active = sum(1 for _, result in claimed if result.finished is None and result.stage)
+        queued = sum(1 for _, result in claimed if result.finished is None and not result.stage)
+        lines = [
+            f"Provisioned: {succeeded}  Failed: {failed}  "
+            f"Active: {active}/{self.max_jobs}  Queued: {queued}  (Ctrl+C to stop)"
+        ]
+        states = []
+        for key, result in claimed:
+            state = self.port_state(result)
+            states.append((key, state))
+            lines.append(
+                f"  {key:<12} {Path(result.device_port).name:<14} {result.mac:<18} {state:<32} {result.duration:>6.1f}s"
+            )
+        return lines, states
+
+    def render(self):
+        """Redraw the status lines in place, or log them when they change"""
+        lines, states = self.status_lines()
+        if not self.interactive:
+            if states != self.last_states:
+                self.last_states = states
+                for line in lines:
+                    self.recovery.log(line)
+            return
+        with self.recovery.log_lock:
+            output = f"\033[{self.drawn_lines}F" if self.drawn_lines else ""
+            output += "".join(f"\033[K{line}\n" for line in lines) + "\033[J"
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            self.drawn_lines = len(lines)
+
+    def run(self):
+        """Provision boards until interrupted, then print the summary table"""
+        recovery = self.recovery
+        recovery.log(f"Waiting for boards, up to {self.max_jobs} provisioned at a time")
+        recovery.log(f"Detailed progress is written to {recovery.log_file}")
+        if self.interactive:
+            # The status lines replace the scrolling per-device log
+            recovery.console_output = False
+
+        pool = ThreadPoolExecutor(max_workers=self.max_jobs)
+        last_scan = 0.0
+        changed = True
+        try:
+            while True:
+                # Rescan on device events; without them fall back to polling
+                if changed or time.monotonic() - last_scan >= 2.0:
+                    self.scan(pool)
+                    last_scan = time.monotonic()
+                self.render()
+                # Nothing else flushes the log while the daemon idles
+                recovery.run_log.flush()
+                changed = recovery.device_monitor.wait_for_event(DAEMON_STATUS_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            with self.lock:
+                for future in self.futures.values():
+                    future.cancel()
+                running = [result for result in self.claimed.values() if result.finished is None and result.stage]
+            recovery.console_output = True
+            if self.interactive:
+                print()
+            if running:
+                recovery.log(f"Stopping: waiting for {len(running)} board(s) in progress...", "WARNING")
+            pool.shutdown(wait=True)
+
+        succeeded = sum(1 for result in self.results if result.success)
+        recovery.log("=== Provisioning Summary ===")
+        if self.results:
+            recovery.print_summary_table(self.results)
+            recovery.report_run(self.results, time.monotonic() - self.started)
+        recovery.log(f"Provisioned {succeeded} of {len(self.results)} board(s)", "SUCCESS" if succeeded else "INFO")
+        return succeeded > 0
+
 
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(
+        description="DN-KEY Pro Recovery Tool. With no options, runs comprehensive recovery."
+    )
+    parser.add_argument("--parallel", action="store_true",
+                        help="recover all detected devices at the same time")
+    parser.add_argument("-j", "--jobs", type=int, default=MAX_CONCURRENT_DEVICES,
+                        help=f"maximum devices flashed at once with --parallel or --daemon, and serial "
+                             f"stages at once in every mode (default: {MAX_CONCURRENT_DEVICES})")
+    parser.add_argument("--hub-jobs", type=int, default=MAX_JOBS_PER_HUB,
+                        help=f"maximum boards on one USB hub in a serial stage at once, 0 for no limit "
+                             f"(default: {MAX_JOBS_PER_HUB})")
+    parser.add_argument("--esptool-driver", choices=["auto", "library", "subprocess"], default=ESPTOOL_DRIVER,
+                        help=f"run esptool in-process or as a subprocess per step (default: {ESPTOOL_DRIVER})")
+    parser.add_argument("--refresh", action="store_true",
+                        help="skip the full erase and only rewrite TinyUF2 regions that differ on the device")
+    parser.add_argument("--merged", action="store_true",
+                        help="write TinyUF2 and the CircuitPython .bin as one merged image, no DN_BOOT copy")
+    parser.add_argument("--app", metavar="DIR", default=SAMPLE_APP or None,
+                        help="sync a whole app directory (e.g. examples/circuitpython/dc33_demo) instead of "
+                             "copying SAMPLE_CODE; only changed files are copied")
+    parser.add_argument("--mpy", action="store_true",
+                        help="with --app, push modules compiled with mpy-cross instead of .py sources")
+    parser.add_argument("--mpy-cross", default=MPY_CROSS, help=f"mpy-cross command (default: {MPY_CROSS})")
+    parser.add_argument("--transport", choices=["volume", "repl"], default=CODE_TRANSPORT,
+                        help="write the code to the DN-S3-PY drive or over the CircuitPython raw REPL "
+                             f"(default: {CODE_TRANSPORT})")
+    parser.add_argument("--verify", action="store_true",
+                        help="check every written flash region with an on-chip MD5 before resetting the board")
+    parser.add_argument("--up-to-date", choices=["code", "skip", "reflash"], default=UP_TO_DATE_BOARDS,
+                        help=f"boards already running the target firmware: only copy the code, leave them "
+                             f"alone, or reflash them anyway (default: {UP_TO_DATE_BOARDS}; use code or "
+                             f"skip to speed up batches of healthy boards)")
+    parser.add_argument("--no-baud-probe", action="store_true",
+                        help=f"don't probe each port's fastest baud rate, use cached rates or {BAUD_RATE}")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="ignore checkpoints and run every stage on every device")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="recover devices through a staged pipeline (see PIPELINE_STAGE_WORKERS)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and provision every ESP32-S3 board as soon as it is plugged in")
+    args = parser.parse_args()
+    
     print("DN-KEY Pro Recovery Tool")
     print("========================")
     print()
     
     recovery = DNKeyProRecovery()
+    recovery.esptool_driver = args.esptool_driver
+    recovery.refresh = args.refresh
+    recovery.merged = args.merged
+    recovery.verify = args.verify or VERIFY_FLASH
+    recovery.up_to_date = args.up_to_date
+    recovery.sample_app = args.app or ""
+    recovery.compile_mpy = args.mpy or COMPILE_MPY
+    recovery.mpy_cross = args.mpy_cross
+    recovery.code_transport = args.transport
+    recovery.resume = not args.no_resume
+    recovery.probe_baud = not args.no_baud_probe
+    recovery.limiter.per_hub = args.hub_jobs
+    recovery.limiter.total = args.jobs
     
     # Show OS information
     print(f"Operating System: {platform.system()} {platform.release()}")
     print(f"Python Version: {sys.version}")
     print()
     
-    if len(sys.argv) > 1:
-        if sys.argv[1] == '--help':
-            print("Usage: python3 dn_key_pro_recovery.py [--help]")
-            print()
-            print("Options:")
-            print("  --help    Show this help message")
-            print("  (no args) Run comprehensive recovery")
-            return
-        else:
-            print("Unknown option. Use --help for usage information.")
-            return
+    if args.daemon:
+        recovery.provisioning_daemon(max_jobs=args.jobs)
+        return
     
     # Run comprehensive recovery
-    recovery.comprehensive_recovery()
+    recovery.comprehensive_recovery(parallel=args.parallel, max_workers=args.jobs, pipeline=args.pipeline)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
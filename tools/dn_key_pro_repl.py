@@ -0,0 +1,756 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro raw REPL deploy
+==========================
+
+Deploys a CircuitPython app directory over the board's serial console
+instead of the DN-S3-PY mass-storage volume, for hosts that can't mount the
+volume reliably and for apps with many small lib/ files:
+
+    python3 dn_key_pro_repl.py ../examples/circuitpython/dc33_demo
+
+The running code.py is interrupted and the raw REPL entered. Small helper
+functions are defined on the board once, then every file is:
+
+- streamed in CHUNK_SIZE pieces, base64 encoded (a raw 0x03 byte would raise
+  KeyboardInterrupt on the board), with the board acknowledging each chunk
+  once it is written; at most WINDOW chunks are in flight;
+- written through one open() per file in flash-sector sized writes;
+- hashed on the board while it is written (SHA-256 with hashlib, CRC-32 on
+  firmware without it) and compared against the host's hash.
+
+Commands are sent in raw-paste mode with the board's own flow control when
+the firmware supports it. The same manifest as dn_key_pro_deploy.py is kept
+on the board, so only changed files are sent and files removed from the app
+are deleted. The board reloads code.py at the end.
+
+CircuitPython only lets code write to CIRCUITPY while the drive isn't
+presented over USB. If it is read-only, the drive is remounted writable when
+the host has ejected it (--eject does that on Linux); otherwise add a
+boot.py that calls storage.remount("/", readonly=False) or
+storage.disable_usb_drive().
+
+--benchmark times a full copy of the app into a scratch directory over the
+raw REPL and over the mass-storage volume, whichever can write.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import select
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+
+from dn_key_pro_deploy import (
+    MANIFEST_NAME, MANIFEST_VERSION, VOLUME_LABEL, DeployError, SyncResult, compare_files, find_volumes,
+    manifest_record, scan_app, shadowing_sources, sync_app,
+)
+from dn_key_pro_monitor import BAUD_RATE, find_console_ports, open_tty, serial, termios
+from dn_key_pro_usb import CIRCUITPYTHON_USB_ID, IS_LINUX, block_usb_port, read_mounts, tty_usb_ids, tty_usb_port
+
+# Raw bytes per acknowledged chunk: one 4 KiB flash sector per write
+CHUNK_SIZE = 4096
+
+# Chunks sent ahead of the board's acknowledgements
+WINDOW = 2
+
+# Seconds to wait for the raw REPL, and for a command to finish
+ENTER_TIMEOUT = 2.0
+ENTER_ATTEMPTS = 5
+COMMAND_TIMEOUT = 10.0
+
+# Seconds of silence that end the output of an interrupted command
+DRAIN_QUIET = 0.2
+
+# Plain raw REPL (no raw-paste support): bytes written per pause, as pyboard.py does
+RAW_CHUNK = 256
+RAW_CHUNK_DELAY = 0.01
+
+# Scratch directory on the board and on the volume used by --benchmark
+BENCHMARK_DIR = ".dn_key_pro_bench"
+
+RAW_REPL_BANNER = b"raw REPL; CTRL-B to exit\r\n>"
+ACK = b"\x06"
+
+# Helpers defined on the board when the raw REPL is entered. %(chunk)d is
+# CHUNK_SIZE; every helper prints its result for the host to parse.
+DEVICE_HELPERS = """
+import os, sys, binascii
+try:
+    import hashlib
+except ImportError:
+    hashlib = None
+
+class _dk_Digest:
+    def __init__(self):
+        self.h = hashlib.new('sha256') if hashlib else None
+        self.crc = 0
+    def update(self, data):
+        if self.h:
+            self.h.update(data)
+        else:
+            self.crc = binascii.crc32(data, self.crc)
+    def result(self):
+        if self.h:
+            return 'sha256:' + binascii.hexlify(self.h.digest()).decode()
+        return 'crc32:%%08x' %% (self.crc & 0xffffffff)
+
+def _dk_sizes(paths):
+    sizes = []
+    for p in paths:
+        try:
+            sizes.append(os.stat(p)[6])
+        except OSError:
+            sizes.append(-1)
+    print(sizes)
+
+def _dk_hash(p):
+    d = _dk_Digest()
+    b = bytearray(%(chunk)d)
+    with open(p, 'rb') as f:
+        while True:
+            n = f.readinto(b)
+            if not n:
+                break
+            d.update(memoryview(b)[:n])
+    print(d.result())
+
+def _dk_cat(p):
+    try:
+        with open(p) as f:
+            print(f.read())
+    except OSError:
+        pass
+
+def _dk_makedirs(p):
+    path = ''
+    for part in p.split('/')[1:-1]:
+        path += '/' + part
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+
+def _dk_recv(p, size):
+    _dk_makedirs(p)
+    d = _dk_Digest()
+    left = size
+    with open(p, 'wb') as f:
+        while left:
+            n = min(%(chunk)d, left)
+            data = binascii.a2b_base64(sys.stdin.read((n + 2) // 3 * 4))
+            f.write(data)
+            d.update(data)
+            left -= n
+            sys.stdout.write('\\x06')
+    print(d.result())
+
+def _dk_remove(paths, root):
+    for p in paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+        parent = p.rsplit('/', 1)[0]
+        while len(parent) > len(root):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = parent.rsplit('/', 1)[0]
+
+def _dk_rmtree(p):
+    try:
+        names = os.listdir(p)
+    except OSError:
+        return
+    for name in names:
+        child = p + '/' + name
+        if os.stat(child)[0] & 0x4000:
+            _dk_rmtree(child)
+        else:
+            os.remove(child)
+    os.rmdir(p)
+
+def _dk_writable(mount, remount):
+    p = mount.rstrip('/') + '/.dn_key_pro_probe'
+    for attempt in (0, 1):
+        try:
+            with open(p, 'wb') as f:
+                f.write(b'1')
+            os.remove(p)
+            print('remounted' if attempt else 'ok')
+            return
+        except OSError as e:
+            error = e
+        if attempt or not remount:
+            break
+        try:
+            import storage
+            storage.remount(mount, readonly=False)
+        except Exception as e:
+            error = e
+            break
+    print('read-only: %%r' %% (error,))
+"""
+
+
+class ReplError(DeployError):
+    """The board's raw REPL didn't respond, or a command failed on the board"""
+
+
+class SerialLink:
+    """Raw serial connection: non-blocking fd on POSIX, pyserial elsewhere"""
+
+    def __init__(self, port, baud=BAUD_RATE):
+        self.port = port
+        self.fd = None
+        self.serial = None
+        if termios is None and serial is None:
+            raise ReplError("pyserial is required on this system (pip install pyserial)")
+        try:
+            if termios is not None:
+                self.fd = open_tty(port, baud)
+            else:
+                self.serial = serial.Serial(port, baud, timeout=0)
+        except OSError as e:
+            raise ReplError(f"can't open {port}: {e}")
+
+    def write(self, data):
+        try:
+            if self.serial is not None:
+                self.serial.write(data)
+                return
+            view = memoryview(data)
+            while view:
+                try:
+                    view = view[os.write(self.fd, view):]
+                except BlockingIOError:
+                    select.select([], [self.fd], [], COMMAND_TIMEOUT)
+        except OSError as e:
+            raise ReplError(f"{self.port}: {e}")
+
+    def read(self, timeout):
+        """Bytes that arrive within timeout, b"" if none"""
+        try:
+            if self.serial is not None:
+                self.serial.timeout = timeout
+                return self.serial.read(max(1, self.serial.in_waiting))
+            if not select.select([self.fd], [], [], timeout)[0]:
+                return b""
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return b""
+        except OSError as e:
+            raise ReplError(f"{self.port}: {e}")
+        if not data:
+            raise ReplError(f"{self.port}: hung up")
+        return data
+
+    def close(self):
+        try:
+            if self.serial is not None:
+                self.serial.close()
+            elif self.fd is not None:
+                os.close(self.fd)
+        except OSError:
+            pass
+        self.fd = self.serial = None
+
+
+class RawRepl:
+    """Raw REPL session on a board's CircuitPython console
+
+    enter() stops code.py and defines the DEVICE_HELPERS; leave() returns to
+    the normal REPL and reloads code.py.
+    """
+
+    def __init__(self, port, baud=BAUD_RATE):
+        self.port = port
+        self.link = SerialLink(port, baud)
+        # Raw-paste support, found out by the first command
+        self.raw_paste = None
+        # "sha256" or "crc32", whichever the board computes
+        self.hash_kind = None
+        self._buffer = bytearray()
+        self._reset_needed = False
+
+    def read_until(self, ending, timeout=COMMAND_TIMEOUT):
+        """Everything received up to and including ending; raises ReplError on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            index = self._buffer.find(ending)
+            if index >= 0:
+                data = bytes(self._buffer[:index + len(ending)])
+                del self._buffer[:index + len(ending)]
+                return data
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ReplError(f"{self.port}: timed out waiting for {ending!r} "
+                                f"(received {bytes(self._buffer[-60:])!r})")
+            self._buffer += self.link.read(remaining)
+
+    def read_exact(self, count, timeout=COMMAND_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while len(self._buffer) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ReplError(f"{self.port}: timed out after {bytes(self._buffer)!r}")
+            self._buffer += self.link.read(remaining)
+        data = bytes(self._buffer[:count])
+        del self._buffer[:count]
+        return data
+
+    def enter(self):
+        """Interrupt code.py, enter the raw REPL and define the helpers"""
+        for _ in range(ENTER_ATTEMPTS):
+            # Ctrl-C twice stops code.py, the CR answers "Press any key to
+            # enter the REPL", Ctrl-A switches to the raw REPL
+            self.link.write(b"\r\x03\x03")
+            time.sleep(0.1)
+            self.link.write(b"\r\x01")
+            try:
+                self.read_until(RAW_REPL_BANNER, ENTER_TIMEOUT)
+                break
+            except ReplError:
+                continue
+        else:
+            raise ReplError(f"{self.port}: no raw REPL (is the board running CircuitPython?)")
+        # Output of whatever code.py printed while stopping
+        self._buffer.clear()
+        self.exec(DEVICE_HELPERS % {"chunk": CHUNK_SIZE})
+        self.hash_kind = self.exec("print('sha256' if hashlib else 'crc32')").strip()
+
+    def leave(self, reload=True):
+        """Back to the normal REPL; Ctrl-D there reloads code.py"""
+        try:
+            self.link.write(b"\x02\x04" if reload else b"\x02")
+        finally:
+            self.link.close()
+
+    def start(self, code):
+        """Send a command; its output is read with finish()"""
+        if self._reset_needed:
+            self._interrupt()
+        data = code.encode("utf-8")
+        if self.raw_paste is not False:
+            self.link.write(b"\x05A\x01")
+            reply = self.read_exact(2)
+            if reply == b"R\x01":
+                self.raw_paste = True
+                self._paste(data)
+                return
+            if reply != b"R\x00":
+                # Firmware without raw-paste took it as input and reset the raw REPL
+                self.read_until(RAW_REPL_BANNER[2:])
+            self.raw_paste = False
+        for offset in range(0, len(data), RAW_CHUNK):
+            self.link.write(data[offset:offset + RAW_CHUNK])
+            time.sleep(RAW_CHUNK_DELAY)
+        self.link.write(b"\x04")
+        reply = self.read_exact(2)
+        if reply != b"OK":
+            raise ReplError(f"{self.port}: command not accepted ({reply!r})")
+
+    def _interrupt(self):
+        """Stop the command a failed transfer left running, back to a clean raw REPL"""
+        # The board may still be blocked in sys.stdin.read() inside _dk_recv,
+        # where any other byte would be taken as file data; Ctrl-C interrupts
+        # it. Its ACKs and the KeyboardInterrupt traceback are dropped
+        self.link.write(b"\x03\x03")
+        self._drain()
+        self.link.write(b"\x01")
+        self.read_until(RAW_REPL_BANNER, ENTER_TIMEOUT)
+        self._buffer.clear()
+        self._reset_needed = False
+
+    def _drain(self, quiet=DRAIN_QUIET, timeout=COMMAND_TIMEOUT):
+        """Discard input until the board has been silent for quiet seconds"""
+        self._buffer.clear()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.link.read(quiet):
+                return
+
+    def _paste(self, data):
+        """Raw-paste mode: send data within the window the board grants"""
+        window = struct.unpack("<H", self.read_exact(2))[0]
+        remaining = window
+        offset = 0
+        while offset < len(data):
+            self._buffer += self.link.read(0)
+            while remaining == 0 or self._buffer:
+                flag = self.read_exact(1)
+                if flag == b"\x01":
+                    remaining += window
+                elif flag == b"\x04":
+                    # The board ended the paste early
+                    self.link.write(b"\x04")
+                    return
+                else:
+                    raise ReplError(f"{self.port}: unexpected {flag!r} during raw paste")
+            chunk = data[offset:offset + remaining]
+            self.link.write(chunk)
+            remaining -= len(chunk)
+            offset += len(chunk)
+        self.link.write(b"\x04")
+        self.read_until(b"\x04")
+
+    def finish(self, timeout=COMMAND_TIMEOUT):
+        """Output of the running command; raises ReplError with the board's traceback"""
+        output = self.read_until(b"\x04", timeout)[:-1]
+        error = self.read_until(b"\x04", timeout)[:-1]
+        self.read_until(b">", timeout)
+        if error:
+            raise ReplError(f"{self.port}: {error.decode('utf-8', 'replace').strip().splitlines()[-1]}")
+        return output.decode("utf-8", "replace")
+
+    def exec(self, code, timeout=COMMAND_TIMEOUT):
+        self.start(code)
+        return self.finish(timeout)
+
+    def digest(self, data):
+        """The result _dk_Digest prints for data on this board"""
+        if self.hash_kind == "sha256":
+            return "sha256:" + hashlib.sha256(data).hexdigest()
+        return f"crc32:{zlib.crc32(data) & 0xFFFFFFFF:08x}"
+
+    def sizes(self, paths):
+        """Size of each file on the board, None when missing"""
+        if not paths:
+            return []
+        return [None if size < 0 else size for size in json.loads(self.exec(f"_dk_sizes({list(paths)!r})"))]
+
+    def file_digest(self, path):
+        return self.exec(f"_dk_hash({path!r})", timeout=60).strip()
+
+    def read_text(self, path):
+        """Contents of a text file on the board, "" when missing"""
+        text = self.exec(f"_dk_cat({path!r})")
+        # print() ends the contents with CRLF
+        return text[:-2] if text.endswith("\r\n") else text.rstrip("\n")
+
+    def put(self, path, data):
+        """Write data to a file on the board and check the board's hash of it"""
+        self.start(f"_dk_recv({path!r},{len(data)})")
+        chunks = (len(data) + CHUNK_SIZE - 1) // CHUNK_SIZE
+        sent = acked = 0
+        try:
+            while acked < chunks:
+                while sent < chunks and sent - acked < WINDOW:
+                    self.link.write(base64.b64encode(data[sent * CHUNK_SIZE:(sent + 1) * CHUNK_SIZE]))
+                    sent += 1
+                acked += self._wait_ack()
+        except ReplError:
+            self._reset_needed = True
+            raise
+        result = self.finish().strip()
+        if result != self.digest(data):
+            raise ReplError(f"{path}: written file doesn't match ({result} on the board)")
+        return result
+
+    def _wait_ack(self):
+        """Number of chunk acknowledgements received; raises if the command failed"""
+        if not self._buffer:
+            self._buffer += self.link.read(COMMAND_TIMEOUT)
+            if not self._buffer:
+                raise ReplError(f"{self.port}: no acknowledgement from the board")
+        if self._buffer[:1] == b"\x04":
+            # Output ended before the file did: the traceback follows
+            del self._buffer[:1]
+            error = self.read_until(b"\x04")[:-1]
+            self.read_until(b">")
+            raise ReplError(f"{self.port}: {error.decode('utf-8', 'replace').strip().splitlines()[-1]}")
+        count = 0
+        while self._buffer[:1] == ACK:
+            del self._buffer[:1]
+            count += 1
+        if not count:
+            raise ReplError(f"{self.port}: unexpected {bytes(self._buffer[:20])!r} while writing")
+        return count
+
+    def remove(self, paths, root="/"):
+        """Delete files on the board, and the directories they leave empty below root"""
+        if paths:
+            self.exec(f"_dk_remove({list(paths)!r},{root.rstrip('/')!r})", timeout=60)
+
+    def rmtree(self, path):
+        self.exec(f"_dk_rmtree({path!r})", timeout=60)
+
+    def ensure_writable(self, dest="/"):
+        """Make sure dest can be written from the board, remounting CIRCUITPY if allowed
+
+        Returns True when CIRCUITPY had to be remounted (it is then read-only
+        to the host until the board resets).
+        """
+        # The SD card is its own, always writable, mount
+        mount = "/sd" if dest == "/sd" or dest.startswith("/sd/") else "/"
+        status = self.exec(f"_dk_writable({mount!r},{mount == '/'})").strip()
+        if status.startswith("read-only") and mount == "/sd":
+            raise ReplError(f"{dest} isn't writable ({status[len('read-only: '):]}), is the SD card mounted?")
+        if status.startswith("read-only"):
+            raise ReplError(
+                f"{dest} is read-only to CircuitPython ({status[len('read-only: '):]}): CIRCUITPY is "
+                "presented over USB. Eject the drive on the host, or add a boot.py that calls "
+                "storage.remount(\"/\", readonly=False) or storage.disable_usb_drive()")
+        return status == "remounted"
+
+
+def board_path(dest, relative):
+    return posixpath.join(dest, relative)
+
+
+def read_board_manifest(repl, dest):
+    """Files recorded by the last deploy to dest on the board, None when there is no manifest"""
+    text = repl.read_text(board_path(dest, MANIFEST_NAME))
+    try:
+        manifest = json.loads(text)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest.get("files", {})
+    except (ValueError, AttributeError):
+        pass
+    return None
+
+
+def sync_app_repl(app_dir, repl, files=None, dest="/", dry_run=False, prune=True, log=None):
+    """Bring dest on the board in line with the app directory, return a SyncResult
+
+    Same rules as dn_key_pro_deploy.sync_app(), with the manifest kept on the
+    board. With prune=False no manifest is used and nothing is deleted, for
+    pushing single files.
+    """
+    started = time.monotonic()
+    if files is None:
+        files = scan_app(app_dir)
+    log = log or (lambda message: None)
+
+    result = SyncResult(f"{repl.port}:{dest}")
+    manifest = read_board_manifest(repl, dest) if prune else None
+    # Sources that would shadow a pushed .mpy are looked up too, to delete them
+    relatives = list(files) + shadowing_sources(files)
+    sizes = dict(zip(relatives, repl.sizes([board_path(dest, relative) for relative in relatives])))
+
+    def same_content(relative, entry):
+        if repl.hash_kind == "sha256":
+            expected = "sha256:" + entry["sha256"]
+        else:
+            expected = repl.digest(Path(entry["source"]).read_bytes())
+        return repl.file_digest(board_path(dest, relative)) == expected
+
+    copy, result.unchanged, stale = compare_files(files, manifest or {}, sizes.get, same_content)
+    if dry_run:
+        result.copied, result.deleted = copy, stale
+        result.bytes_copied = sum(files[relative]["size"] for relative in copy)
+        return result
+
+    if (copy or stale or (prune and manifest is None)) and repl.ensure_writable(dest):
+        log("  CIRCUITPY remounted writable, read-only to the host until the board resets")
+    if manifest is not None and (copy or stale):
+        # As with volumes: an interrupted deploy leaves no manifest behind
+        repl.remove([board_path(dest, MANIFEST_NAME)], dest)
+
+    for relative in copy:
+        repl.put(board_path(dest, relative), Path(files[relative]["source"]).read_bytes())
+        result.copied.append(relative)
+        result.bytes_copied += files[relative]["size"]
+        log(f"  + {relative}")
+
+    repl.remove([board_path(dest, relative) for relative in stale], dest)
+    for relative in stale:
+        result.deleted.append(relative)
+        log(f"  - {relative}")
+
+    if prune and (result.changed or manifest is None):
+        record = json.dumps(manifest_record(app_dir, files), sort_keys=True, separators=(",", ":"))
+        repl.put(board_path(dest, MANIFEST_NAME), record.encode("utf-8"))
+
+    result.duration = time.monotonic() - started
+    return result
+
+
+def find_repl_ports(usb_port=None):
+    """Console ports of boards running CircuitPython, optionally on one USB port"""
+    ports = []
+    for port in find_console_ports():
+        ids = tty_usb_ids(port)
+        if ids is not None and ids != CIRCUITPYTHON_USB_ID:
+            continue
+        if usb_port is not None and tty_usb_port(port) != usb_port:
+            continue
+        ports.append(port)
+    return ports
+
+
+def unmount(source, mount):
+    """Unmount a partition of the board's drive, raising DeployError when it stays mounted"""
+    errors = []
+    for command in (["udisksctl", "unmount", "--no-user-interaction", "-b", source], ["umount", mount]):
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True, timeout=10)
+            return
+        except subprocess.CalledProcessError as e:
+            errors.append(f"{command[0]}: {(e.stderr or e.stdout).strip() or e.returncode}")
+        except (OSError, subprocess.SubprocessError) as e:
+            errors.append(f"{command[0]}: {e}")
+    raise DeployError(f"can't unmount the board's drive at {mount} ({'; '.join(errors)}); "
+                      "deploy to the volume instead")
+
+
+def eject_drive(usb_port):
+    """Eject the board's drive on the host (Linux), so CircuitPython may remount it writable
+
+    A drive the desktop automounted is unmounted first (udisksctl, which needs
+    no root, then umount). Returns the ejected disks. The drive comes back
+    when the board resets.
+    """
+    if not IS_LINUX or usb_port is None:
+        raise DeployError("the board's drive can only be ejected on Linux, with its USB port known")
+    disks = sorted(f"/dev/{entry.name}" for entry in Path("/sys/block").iterdir()
+                   if block_usb_port(f"/dev/{entry.name}") == usb_port)
+    for source, mount in read_mounts():
+        if any(source.startswith(disk) for disk in disks):
+            unmount(source, mount)
+    for disk in disks:
+        try:
+            subprocess.run(["eject", disk], check=True, capture_output=True, timeout=10)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise DeployError(f"can't eject {disk}: {e}")
+    return disks
+
+
+def benchmark(app_dir, files, port=None, volume=None, runs=1, log=print):
+    """Time full copies of the app over the raw REPL and the volume
+
+    Returns {transport: {"runs": [seconds...], "files", "bytes"} or {"error"}}.
+    """
+    results = {}
+    total = sum(entry["size"] for entry in files.values())
+    if port is not None:
+        repl = None
+        try:
+            repl = RawRepl(port)
+            repl.enter()
+            dest = "/" + BENCHMARK_DIR
+            repl.rmtree(dest)
+            durations = []
+            for run in range(runs):
+                sync = sync_app_repl(app_dir, repl, files, dest)
+                durations.append(sync.duration)
+                log(f"raw REPL run {run + 1}: {sync.summary()} in {sync.duration:.2f}s")
+                repl.rmtree(dest)
+            results["repl"] = {"runs": durations, "files": len(files), "bytes": total}
+        except (OSError, DeployError) as e:
+            results["repl"] = {"error": str(e)}
+        finally:
+            if repl is not None:
+                repl.leave(reload=False)
+    if volume is not None:
+        target = Path(volume) / BENCHMARK_DIR
+        try:
+            durations = []
+            for run in range(runs):
+                shutil.rmtree(target, ignore_errors=True)
+                target.mkdir()
+                sync = sync_app(app_dir, target, files)
+                durations.append(sync.duration)
+                log(f"mass storage run {run + 1}: {sync.summary()} in {sync.duration:.2f}s")
+            shutil.rmtree(target, ignore_errors=True)
+            results["volume"] = {"runs": durations, "files": len(files), "bytes": total}
+        except (OSError, DeployError) as e:
+            results["volume"] = {"error": str(e)}
+    return results
+
+
+def print_benchmark(results):
+    print()
+    print(f"{'Transport':<14} {'Best':>8} {'Mean':>8} {'KiB/s':>8} {'ms/file':>8}")
+    for transport, name in (("repl", "raw REPL"), ("volume", "mass storage")):
+        entry = results.get(transport)
+        if entry is None:
+            continue
+        if "error" in entry:
+            print(f"{name:<14} unavailable: {entry['error']}")
+            continue
+        best = min(entry["runs"])
+        mean = sum(entry["runs"]) / len(entry["runs"])
+        print(f"{name:<14} {best:>7.2f}s {mean:>7.2f}s {entry['bytes'] / 1024 / best:>8.1f} "
+              f"{best * 1000 / max(1, entry['files']):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deploy a CircuitPython app directory over the raw REPL")
+    parser.add_argument("app", help="app directory, e.g. examples/circuitpython/dc33_demo")
+    parser.add_argument("--port", help="console port of the board (default: the only CircuitPython board found)")
+    parser.add_argument("--dest", default="/", help="directory on the board to deploy to (default: /)")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would change")
+    parser.add_argument("--no-reload", action="store_true", help="don't reload code.py after the deploy")
+    parser.add_argument("--eject", action="store_true",
+                        help="eject the board's drive on the host first, so CircuitPython can write to it (Linux)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list every copied and deleted file")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time full copies over the raw REPL and the mounted volume instead of deploying")
+    parser.add_argument("--volume", help=f"volume for --benchmark (default: the mounted {VOLUME_LABEL} volume)")
+    parser.add_argument("--runs", type=int, default=3, help="copies per transport with --benchmark (default: 3)")
+    parser.add_argument("--json", metavar="FILE", help="write the --benchmark results as JSON")
+    args = parser.parse_args()
+
+    try:
+        files = scan_app(args.app)
+    except (OSError, DeployError) as e:
+        parser.error(str(e))
+    if not args.dest.startswith("/"):
+        parser.error("--dest must be an absolute path on the board")
+
+    port = args.port
+    if port is None:
+        ports = find_repl_ports()
+        if len(ports) > 1 and not args.benchmark:
+            parser.error(f"several boards found ({', '.join(ports)}), pass --port")
+        port = ports[0] if ports else None
+    if args.benchmark:
+        volumes = [args.volume] if args.volume else find_volumes()
+        if port is None and not volumes:
+            parser.error(f"no CircuitPython console or {VOLUME_LABEL} volume found")
+        results = benchmark(args.app, files, port, volumes[0] if volumes else None, args.runs)
+        print_benchmark(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+        sys.exit(0 if any("runs" in entry for entry in results.values()) else 1)
+    if port is None:
+        parser.error("no CircuitPython console found, pass --port")
+
+    if args.eject and not args.dry_run:
+        try:
+            print(f"Ejected {', '.join(eject_drive(tty_usb_port(port))) or 'nothing'}")
+        except DeployError as e:
+            parser.error(str(e))
+
+    total = sum(entry["size"] for entry in files.values())
+    print(f"{args.app}: {len(files)} file(s), {total / 1024:.1f} KiB -> {port}:{args.dest}")
+    repl = None
+    try:
+        repl = RawRepl(port)
+        repl.enter()
+        sync = sync_app_repl(args.app, repl, files, args.dest, args.dry_run, log=print if args.verbose else None)
+    except (OSError, DeployError) as e:
+        print(f"{port}: FAILED ({e})")
+        sys.exit(1)
+    finally:
+        if repl is not None:
+            repl.leave(reload=not (args.no_reload or args.dry_run))
+    prefix = "dry run, " if args.dry_run else ""
+    print(f"{port}: {prefix}{sync.summary()}" + ("" if args.dry_run else f" in {sync.duration:.1f}s"))
+
+
+if __name__ == "__main__":
+    main()
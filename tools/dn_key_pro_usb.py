@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+DN-KEY Pro USB device helpers
+=============================
+
+Helpers used by dn_key_pro_recovery.py to follow boards across the USB
+re-enumerations of a recovery (ROM bootloader -> DN_BOOT -> DN-S3-PY):
+
+- DeviceMonitor wakes waiters as soon as a tty or block device is added or
+  removed (kernel uevents over netlink) or the mount table changes
+  (/proc/self/mountinfo). On other systems, or if the netlink socket can't be
+  opened, waiters fall back to polling.
+- Mount points are discovered from /proc/self/mountinfo and
+  /dev/disk/by-label instead of being assumed at /media/$USER/<label>.
+- Serial ports and volumes are mapped to the physical USB port they hang off
+  (e.g. "1-2.3") through sysfs, so each board's DN_BOOT / DN-S3-PY volume can
+  be told apart even though they all share the same label.
+- usb_port_present() and tty_usb_ids() tell the --daemon mode when a board
+  was unplugged and whether a new port is an ESP32-S3 ROM bootloader.
+- usb_hub_path() and group_by_hub() describe the USB topology, so ports on the
+  same upstream hub can be grouped and their concurrent jobs limited.
+- usb_serial_number() identifies a board without opening its port. The
+  ESP32-S3 USB-Serial/JTAG reports the chip MAC as its serial number.
+"""
+
+import os
+import re
+import select
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    from serial.tools import list_ports
+except ImportError:
+    list_ports = None
+
+IS_LINUX = sys.platform.startswith("linux")
+
+# Netlink protocol and multicast group for kernel uevents
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP = 1
+
+# Subsystems whose add/remove events can make a waiter's condition true
+WATCHED_SUBSYSTEMS = (b"tty", b"block")
+
+MOUNTINFO = "/proc/self/mountinfo"
+DISK_BY_LABEL = Path("/dev/disk/by-label")
+SERIAL_BY_ID = Path("/dev/serial/by-id")
+
+# by-id link names: usb-<vendor>_<product>_<serial>-if<NN>
+BY_ID_NAME = re.compile(r"^usb-.*_([^_]+)-if[0-9a-fA-F]+(-port\d+)?$")
+
+# A MAC address used as USB serial number, e.g. "F4:12:FA:43:5A:10"
+MAC_SERIAL = re.compile(r"^[0-9a-fA-F]{2}(:[0-9a-fA-F]{2}){5}$")
+
+# sysfs names of USB devices: bus-port[.port...], e.g. "1-2" or "3-1.4.2"
+USB_PORT_PATH = re.compile(r"^\d+-\d+(\.\d+)*$")
+SYS_USB_DEVICES = Path("/sys/bus/usb/devices")
+
+# USB vendor ID of the ESP32-S3 ROM bootloader (USB-Serial/JTAG, 303a:1001)
+ESPRESSIF_USB_VID = 0x303A
+
+# (vendor ID, product ID) of a DN-KEY Pro running CircuitPython
+CIRCUITPYTHON_USB_ID = (0x239A, 0x8112)
+
+
+class DeviceMonitor:
+    """Wake up waiters when devices appear/disappear or mounts change"""
+
+    def __init__(self):
+        self.event_driven = False
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._thread = None
+        self._sock = None
+        self._mountinfo = None
+
+    def start(self):
+        """Start listening for device events, returns True when event driven"""
+        if self._thread is not None or not IS_LINUX:
+            return self.event_driven
+        try:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            self._sock.bind((0, UEVENT_KERNEL_GROUP))
+            self._mountinfo = open(MOUNTINFO)
+            self._mountinfo.read()
+        except (OSError, AttributeError):
+            self.stop()
+            return False
+
+        self.event_driven = True
+        self._thread = threading.Thread(target=self._run, name="device-monitor", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self.event_driven = False
+        for handle in (self._sock, self._mountinfo):
+            if handle is not None:
+                try:
+                    handle.close()
+                except OSError:
+                    pass
+        self._sock = None
+        self._mountinfo = None
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._sock.fileno(), select.POLLIN)
+        # The mount table signals changes with POLLPRI/POLLERR
+        poller.register(self._mountinfo.fileno(), select.POLLPRI | select.POLLERR)
+        while self.event_driven:
+            try:
+                ready = poller.poll(1000)
+            except (OSError, ValueError):
+                return
+            changed = False
+            for fd, _ in ready:
+                if self._sock is not None and fd == self._sock.fileno():
+                    changed |= self._read_uevent()
+                elif self._mountinfo is not None:
+                    self._mountinfo.seek(0)
+                    self._mountinfo.read()
+                    changed = True
+            if changed:
+                self.notify()
+
+    def _read_uevent(self):
+        try:
+            message = self._sock.recv(8192)
+        except OSError:
+            return False
+        # "ACTION@DEVPATH\0KEY=VALUE\0..."
+        for field in message.split(b"\0"):
+            if field.startswith(b"SUBSYSTEM="):
+                return field[len(b"SUBSYSTEM="):] in WATCHED_SUBSYSTEMS
+        return False
+
+    @property
+    def generation(self):
+        """Counter bumped by every device/mount event, for callers that poll"""
+        with self._cond:
+            return self._generation
+
+    def notify(self):
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def wait_until(self, check, timeout, poll_interval=2.0):
+        """Return the first truthy check() result, or None after timeout
+
+        check() runs again on every device/mount event; poll_interval bounds
+        how long a missed event (or no event support at all) can delay it.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                generation = self._generation
+            value = check()
+            if value:
+                return value
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._cond:
+                self._cond.wait_for(lambda: self._generation != generation, timeout=min(poll_interval, remaining))
+
+    def wait_for_event(self, timeout):
+        """Block until the next device/mount event, returns False on timeout"""
+        with self._cond:
+            generation = self._generation
+            return self._cond.wait_for(lambda: self._generation != generation, timeout=timeout)
+
+    def wait_for_reenumeration(self, path, timeout=10.0, detach_timeout=0.5):
+        """Wait for a device node to go away and come back after a reset
+
+        If the node doesn't disappear within detach_timeout (e.g. a USB-UART
+        bridge that stays enumerated), return straight away.
+        """
+        if self.wait_until(lambda: not os.path.exists(path), detach_timeout, poll_interval=0.05) is None:
+            return True
+        return self.wait_until(lambda: os.path.exists(path), timeout, poll_interval=0.25) is not None
+
+
+def unescape_mount_path(path):
+    """Undo the octal escapes (\\040 for space) used in /proc mount tables"""
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), path)
+
+
+def read_mounts():
+    """Return (source device, mount point) pairs from /proc/self/mountinfo"""
+    mounts = []
+    try:
+        with open(MOUNTINFO) as f:
+            for line in f:
+                fields = line.split()
+                if " - " not in line or len(fields) < 5:
+                    continue
+                source = line.split(" - ", 1)[1].split()[1]
+                mounts.append((unescape_mount_path(source), unescape_mount_path(fields[4])))
+    except OSError:
+        pass
+    return mounts
+
+
+def devices_with_label(label):
+    """Block device nodes whose filesystem label is label (via /dev/disk/by-label)"""
+    devices = []
+    if not DISK_BY_LABEL.is_dir():
+        return devices
+    for link in DISK_BY_LABEL.iterdir():
+        # udev escapes spaces and slashes in labels as \x20, \x2f
+        name = re.sub(r"\\x([0-9a-fA-F]{2})", lambda m: chr(int(m.group(1), 16)), link.name)
+        if name == label:
+            devices.append(os.path.realpath(str(link)))
+    return devices
+
+
+def find_volume_mounts(label):
+    """Return (mount point, device node) pairs for mounted volumes with this label"""
+    devices = set(devices_with_label(label))
+    found = []
+    for source, mount_point in read_mounts():
+        if source in devices:
+            found.append((mount_point, source))
+        elif not devices and source.startswith("/dev/"):
+            # No by-label symlinks (no udev): fall back to the mount point name
+            name = os.path.basename(mount_point)
+            if name == label or (name.startswith(label) and name[len(label):].strip().isdigit()):
+                found.append((mount_point, source))
+    return found
+
+
+def usb_port_path(sys_path):
+    """Physical USB port ("1-2.3") a sysfs device path belongs to, or None"""
+    port = None
+    for part in Path(sys_path).parts:
+        if USB_PORT_PATH.match(part):
+            port = part
+    return port
+
+
+def tty_usb_port(device_port):
+    """USB port path of a /dev/ttyACM* or /dev/ttyUSB* serial port"""
+    sys_path = Path("/sys/class/tty") / Path(device_port).name / "device"
+    if not sys_path.exists():
+        return None
+    return usb_port_path(os.path.realpath(str(sys_path)))
+
+
+def block_usb_port(device_node):
+    """USB port path of a block device node such as /dev/sdb1"""
+    sys_path = Path("/sys/class/block") / Path(device_node).name
+    if not sys_path.exists():
+        return None
+    return usb_port_path(os.path.realpath(str(sys_path)))
+
+
+def usb_port_present(usb_port):
+    """True while a USB device is attached to the physical port ("1-2.3")"""
+    return (SYS_USB_DEVICES / usb_port).exists()
+
+
+def tty_usb_ids(device_port):
+    """(vendor ID, product ID) of the USB device behind a serial port, or None
+
+    Read from sysfs on Linux, from pyserial (when installed) elsewhere.
+    """
+    usb_port = tty_usb_port(device_port)
+    if usb_port is not None:
+        try:
+            vid = int((SYS_USB_DEVICES / usb_port / "idVendor").read_text(), 16)
+            pid = int((SYS_USB_DEVICES / usb_port / "idProduct").read_text(), 16)
+            return vid, pid
+        except (OSError, ValueError):
+            pass
+    if list_ports is not None:
+        for info in list_ports.comports():
+            if info.device == device_port and info.vid is not None:
+                return info.vid, info.pid
+    return None
+
+
+def usb_hub_path(usb_port):
+    """Upstream hub of a USB port path: "1-2.3" -> "1-2", "1-2" -> "usb1" (root hub)"""
+    if "." in usb_port:
+        return usb_port.rsplit(".", 1)[0]
+    return "usb" + usb_port.split("-", 1)[0]
+
+
+def usb_device_name(usb_path):
+    """Product name and vendor:product ID of a USB device or hub from sysfs"""
+    device = SYS_USB_DEVICES / usb_path
+    try:
+        ids = f"{int((device / 'idVendor').read_text(), 16):04x}:{int((device / 'idProduct').read_text(), 16):04x}"
+    except (OSError, ValueError):
+        return None
+    try:
+        return f"{(device / 'product').read_text().strip()} ({ids})"
+    except OSError:
+        return ids
+
+
+def group_by_hub(device_ports):
+    """Map upstream hub -> serial ports attached to it (None for unknown ports)"""
+    groups = {}
+    for device_port in device_ports:
+        usb_port = tty_usb_port(device_port)
+        groups.setdefault(usb_hub_path(usb_port) if usb_port else None, []).append(device_port)
+    return groups
+
+
+def serial_by_id(device_port):
+    """Name of the /dev/serial/by-id link pointing at a serial port, or None"""
+    if not SERIAL_BY_ID.is_dir():
+        return None
+    target = os.path.realpath(device_port)
+    for link in SERIAL_BY_ID.iterdir():
+        if os.path.realpath(str(link)) == target:
+            return link.name
+    return None
+
+
+def usb_serial_number(device_port):
+    """USB serial number of the device behind a serial port, or None
+
+    From sysfs, then the /dev/serial/by-id link name, then pyserial.
+    """
+    usb_port = tty_usb_port(device_port)
+    if usb_port is not None:
+        try:
+            serial = (SYS_USB_DEVICES / usb_port / "serial").read_text().strip()
+            if serial:
+                return serial
+        except OSError:
+            pass
+    by_id = serial_by_id(device_port)
+    found = BY_ID_NAME.match(by_id) if by_id else None
+    if found:
+        return found.group(1)
+    if list_ports is not None:
+        for info in list_ports.comports():
+            if info.device == device_port and info.serial_number:
+                return info.serial_number
+    return None
+
+
+def mac_from_usb_serial(serial):
+    """Chip MAC when the serial number is one (ESP32-S3 USB-Serial/JTAG), else None"""
+    if serial and MAC_SERIAL.match(serial):
+        return serial.lower()
+    return None
@@ -0,0 +1,102 @@
+"""Tests for dn_key_pro_deploy.py and the REPL deploy path (run with pytest)"""
+
+import hashlib
+import posixpath
+from pathlib import Path
+
+from dn_key_pro_deploy import MANIFEST_NAME, compile_app, scan_app, sync_app
+from dn_key_pro_repl import sync_app_repl
+
+
+class FakeCompiler:
+    """Stands in for mpy-cross: the "compiled" module is the source behind a marker"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def compile(self, source, name, sha256):
+        target = self.cache_dir / f"{sha256}.mpy"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(b"MPY\0" + Path(source).read_bytes())
+        return target
+
+
+class FakeRepl:
+    """The parts of RawRepl used by sync_app_repl(), over a dict of board files"""
+
+    port = "fake"
+    hash_kind = "sha256"
+
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+
+    def read_text(self, path):
+        return self.files.get(path, b"").decode()
+
+    def sizes(self, paths):
+        return [len(self.files[path]) if path in self.files else None for path in paths]
+
+    def file_digest(self, path):
+        return "sha256:" + hashlib.sha256(self.files[path]).hexdigest()
+
+    def ensure_writable(self, dest):
+        return False
+
+    def put(self, path, data):
+        self.files[path] = data
+
+    def remove(self, paths, dest):
+        for path in paths:
+            self.files.pop(path, None)
+
+
+def make_app(root):
+    app = root / "app"
+    (app / "dn_key_pro").mkdir(parents=True)
+    (app / "code.py").write_text("import dn_key_pro\n")
+    (app / "dn_key_pro" / "__init__.py").write_text("from .menu import *\n")
+    (app / "dn_key_pro" / "menu.py").write_text("ITEMS = []\n")
+    return app
+
+
+def test_mpy_deploy_removes_sources_from_volume_without_manifest(tmp_path):
+    app = make_app(tmp_path)
+    volume = tmp_path / "volume"
+    # A board flashed before deploys kept a manifest: plain sources, no manifest
+    (volume / "dn_key_pro").mkdir(parents=True)
+    (volume / "code.py").write_text("import dn_key_pro\n")
+    (volume / "dn_key_pro" / "__init__.py").write_text("from .menu import *\n")
+    (volume / "dn_key_pro" / "menu.py").write_text("ITEMS = ['old']\n")
+    (volume / "dn_key_pro" / "notes.txt").write_text("the user's own file\n")
+
+    files = compile_app(scan_app(app), FakeCompiler(tmp_path / "cache"))
+    result = sync_app(app, volume, files)
+
+    assert sorted(result.deleted) == ["dn_key_pro/__init__.py", "dn_key_pro/menu.py"]
+    assert (volume / "dn_key_pro" / "menu.mpy").is_file()
+    assert (volume / "dn_key_pro" / "__init__.mpy").is_file()
+    assert not (volume / "dn_key_pro" / "menu.py").exists()
+    assert not (volume / "dn_key_pro" / "__init__.py").exists()
+    assert (volume / "code.py").is_file()
+    assert (volume / "dn_key_pro" / "notes.txt").is_file()
+    assert (volume / MANIFEST_NAME).is_file()
+
+    # Nothing left to do on the next deploy
+    again = sync_app(app, volume, files)
+    assert not again.changed
+
+
+def test_mpy_deploy_removes_sources_over_repl_without_manifest(tmp_path):
+    app = make_app(tmp_path)
+    repl = FakeRepl({
+        "/code.py": b"import dn_key_pro\n",
+        "/dn_key_pro/menu.py": b"ITEMS = ['old']\n",
+    })
+
+    files = compile_app(scan_app(app), FakeCompiler(tmp_path / "cache"))
+    result = sync_app_repl(app, repl, files)
+
+    assert result.deleted == ["dn_key_pro/menu.py"]
+    assert "/dn_key_pro/menu.py" not in repl.files
+    assert "/dn_key_pro/menu.mpy" in repl.files
+    assert posixpath.join("/", MANIFEST_NAME) in repl.files
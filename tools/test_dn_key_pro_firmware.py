@@ -0,0 +1,74 @@
+"""Tests for the merged image layout in dn_key_pro_firmware.py (run with pytest)"""
+
+import pytest
+
+from dn_key_pro_firmware import (
+    PARTITION_ENTRY, PARTITION_MAGIC, FirmwareError, build_merged_image, merged_regions, ota_select_data,
+)
+
+# First 32 bytes of the OTA data otatool.py writes to select ota_0 / ota_1:
+# ota_seq, 20 bytes of 0xff seq_label, ota_state ESP_OTA_IMG_UNDEFINED and
+# the CRC32 of ota_seq (initial value 0xffffffff)
+OTATOOL_OTA_0 = bytes.fromhex("01000000" + "ff" * 20 + "ffffffff" + "9a984347")
+OTATOOL_OTA_1 = bytes.fromhex("02000000" + "ff" * 20 + "ffffffff" + "7437f655")
+
+
+def partition_table():
+    """The DN-KEY Pro layout: nvs, otadata, ota_0, ota_1, TinyUF2 factory app, ffat"""
+    entries = [
+        (1, 0x02, 0x9000, 0x5000, b"nvs"),
+        (1, 0x00, 0xE000, 0x2000, b"otadata"),
+        (0, 0x10, 0x10000, 0x200000, b"ota_0"),
+        (0, 0x11, 0x210000, 0x200000, b"ota_1"),
+        (0, 0x00, 0x410000, 0x40000, b"uf2"),
+        (1, 0x81, 0x450000, 0x3B0000, b"ffat"),
+    ]
+    data = b"".join(PARTITION_ENTRY.pack(PARTITION_MAGIC, ptype, subtype, offset, size, label, 0)
+                    for ptype, subtype, offset, size, label in entries)
+    return data + b"\xff" * (0xC00 - len(data))
+
+
+def test_ota_select_data_matches_otatool():
+    data = ota_select_data(0, 0x2000)
+    assert len(data) == 0x2000
+    assert data[:32] == OTATOOL_OTA_0
+    assert data[32:] == b"\xff" * (0x2000 - 32)
+    assert ota_select_data(1, 0x2000)[:32] == OTATOOL_OTA_1
+
+
+def test_merged_image_puts_components_at_partition_offsets():
+    table = partition_table()
+    bootloader = b"B" * 0x5000
+    app = b"C" * 0x1000
+    tinyuf2 = b"U" * 0x800
+
+    image = build_merged_image(bootloader, table, tinyuf2, app)
+
+    assert len(image) == 0x410000 + len(tinyuf2)
+    assert image[:0x5000] == bootloader
+    assert image[0x8000:0x8000 + len(table)] == table
+    assert image[0xE000:0xE000 + 32] == OTATOOL_OTA_0
+    assert image[0x10000:0x10000 + len(app)] == app
+    assert image[0x410000:] == tinyuf2
+    # nvs and ota_1 are erased
+    assert image[0x9000:0xE000] == b"\xff" * 0x5000
+    assert image[0x210000:0x410000] == b"\xff" * 0x200000
+
+    regions = merged_regions(bootloader, table, tinyuf2, app)
+    assert [(offset, name) for offset, name, _ in regions] == [
+        (0x0, "bootloader"),
+        (0x8000, "partition_table"),
+        (0xE000, "ota_data"),
+        (0x10000, "circuitpython"),
+        (0x410000, "tinyuf2"),
+    ]
+
+
+def test_merged_image_rejects_images_too_large_for_their_partition():
+    table = partition_table()
+    with pytest.raises(FirmwareError, match="ota_0"):
+        build_merged_image(b"B", table, b"U", b"C" * (0x200000 + 1))
+    with pytest.raises(FirmwareError, match="uf2"):
+        build_merged_image(b"B", table, b"U" * (0x40000 + 1), b"C")
+    with pytest.raises(FirmwareError, match="overlaps"):
+        build_merged_image(b"B" * (0x8000 + 1), table, b"U", b"C")